@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+
+""" bench.py
+
+Times listing, sorting, pairing and renaming on synthetic testsets,
+as directories and as ZIP files, and records the peak memory of each
+stage. Results are written as JSON and can be compared with the
+results of another commit.
+
+Usage:
+    bench.py -o before.json
+    bench.py --sizes 1000 10000 100000 1000000 -o after.json
+    bench.py --scheme '*.in|*.ok' --layout zip --sizes 100000
+    bench.py --compare before.json after.json
+    bench.py --startup detect apple/
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import platform
+import datetime
+import tempfile
+import functools
+import subprocess
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from testfmt import api
+from testfmt import misc
+from testfmt import format
+from testfmt import formatpair
+
+from testfmt.filelist import BaseFileList, ZipFileList
+
+VERSION = 1
+DEFAULT_SIZES = [1000, 10000]
+DEFAULT_SCHEMES = ['*.in|*.ok', '*.inp|*.out', 'in.*|ans.*', 'debug.in.*|debug.out.*']
+LAYOUTS = ['dir', 'zip']
+
+STARTUP_BUDGET = 0.05
+LAZY_MODULES = ['bz2', 'concurrent.futures', 'ctypes', 'gzip', 'hashlib', 'json', 'lzma',
+                'tarfile', 'tempfile', 'zipfile', 'zstandard']
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def make_names(scheme, size):
+    """ (str, int) -> (list, list)
+
+    Returns size file names, as size/2 input and output files of
+    the format pair scheme, numbered from 1.
+    """
+    pair = formatpair.FormatPair.from_string(scheme)
+    n = size // 2
+    return ([pair.ifmt.text(str(i + 1)) for i in range(n)],
+            [pair.ofmt.text(str(i + 1)) for i in range(n)])
+
+def make_directory(path, names):
+    os.makedirs(path)
+    for name in names:
+        open(os.path.join(path, name), 'wb').close()
+
+def make_zip(path, names):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as z:
+        for name in names:
+            z.writestr(name, b'')
+
+def check(success):
+    if not success:
+        raise RuntimeError("Benchmark stage failed")
+
+def measure(run, setup=None, repeat=1, memory=True):
+    """ (function, function, ...) -> (float, int or None)
+
+    Returns the best time of repeat calls of run(*setup()) and, if
+    memory is True, the peak of memory allocated by one more call.
+    setup is not timed.
+    """
+    best = None
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        run(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if memory:
+        args = setup() if setup is not None else ()
+        tracemalloc.start()
+        try:
+            run(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return (best, peak)
+
+class Bench(object):
+    """
+    Runs every stage on one testset and collects the results.
+
+    Methods:
+        __init__(self, tmp, repeat=1, memory=True, cmp_limit=...)
+        run(self, scheme, size, layouts)
+        stage(self, layout, scheme, size, name, run, setup=None)
+    """
+
+    def __init__(self, tmp, repeat=1, memory=True, cmp_limit=100000):
+        self.tmp = tmp
+        self.repeat = repeat
+        self.memory = memory
+        self.cmp_limit = cmp_limit
+        self.results = []
+        self.counter = 0
+
+    def fresh_path(self, suffix=''):
+        self.counter += 1
+        return os.path.join(self.tmp, '{}{}'.format(self.counter, suffix))
+
+    def clean(self):
+        for name in os.listdir(self.tmp):
+            path = os.path.join(self.tmp, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+    def stage(self, layout, scheme, size, name, run, setup=None):
+        seconds, peak = measure(run, setup, repeat=self.repeat, memory=self.memory)
+        result = {'layout': layout, 'scheme': scheme, 'size': size, 'stage': name,
+                  'seconds': seconds, 'peak_bytes': peak}
+        self.results.append(result)
+        output_bench_result(result)
+
+    def run(self, scheme, size, layouts=LAYOUTS):
+        try:
+            self.run_stages(scheme, size, layouts)
+        finally:
+            self.clean()
+
+    def run_stages(self, scheme, size, layouts):
+        ifiles, ofiles = make_names(scheme, size)
+        names = misc.join_alternatively(ifiles, ofiles)
+        shuffled = list(names)
+        random.Random(size).shuffle(shuffled)
+        pair = formatpair.FormatPair.from_string(scheme)
+        sifmt, sofmt = pair.ifmt, pair.ofmt
+        difmt, dofmt = formatpair.DEFAULT_IFMT, formatpair.DEFAULT_OFMT
+        dst = misc.join_alternatively(format.convert_format_list(ifiles, sifmt, difmt),
+                                      format.convert_format_list(ofiles, sofmt, dofmt))
+
+        stage = functools.partial(self.stage, 'names', scheme, size)
+        stage('sort_human_key', lambda: sorted(shuffled, key=misc.human_key))
+        if size <= self.cmp_limit:
+            stage('sort_cmp_human', lambda: sorted(shuffled, key=functools.cmp_to_key(misc.cmp_human)))
+        stage('file_list', lambda: BaseFileList(names))
+        table = BaseFileList(names).files
+        stage('get_ifiles_ofiles', lambda: api.get_ifiles_ofiles(table, sifmt, sofmt))
+        stage('best_format_pair', lambda: api.best_format_pair(names))
+        stage('move_files_indirectly',
+              lambda file_list: check(file_list.move_files_indirectly(names, dst, quiet=True)),
+              lambda: (BaseFileList(names),))
+        stage('convert_preview',
+              lambda file_list: check(api.convert_file_list(file_list, sifmt, sofmt, preview=True).checked),
+              lambda: (BaseFileList(names),))
+
+        if 'dir' in layouts:
+            path = self.fresh_path()
+            make_directory(path, names)
+            stage = functools.partial(self.stage, 'dir', scheme, size)
+            stage('get_file_list_recursively', lambda: misc.get_file_list_recursively(root=path))
+            stage('convert', lambda path: check(api.convert(path, quiet=True).success),
+                  self.setup_directory(names))
+
+        if 'zip' in layouts:
+            path = self.fresh_path('.zip')
+            make_zip(path, names)
+            stage = functools.partial(self.stage, 'zip', scheme, size)
+            stage('list', lambda: ZipFileList(path))
+            stage('apply_changes',
+                  lambda file_list: check(file_list.move_files_directly(names, dst, real=True, quiet=True)),
+                  self.setup_zip(names))
+            stage('apply_changes_in_place',
+                  lambda file_list: check(file_list.move_files_directly(names, dst, real=True, quiet=True)),
+                  self.setup_zip(names, in_place=True))
+
+    def setup_directory(self, names):
+        def setup():
+            path = self.fresh_path()
+            make_directory(path, names)
+            return (path,)
+        return setup
+
+    def setup_zip(self, names, in_place=False):
+        def setup():
+            path = self.fresh_path('.zip')
+            make_zip(path, names)
+            return (ZipFileList(path, in_place=in_place),)
+        return setup
+
+def git_commit():
+    """ () -> str or None """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(sizes=DEFAULT_SIZES, schemes=DEFAULT_SCHEMES, layouts=LAYOUTS,
+                   repeat=1, memory=True, cmp_limit=100000, tmp=None):
+    """ (list, list, list, ...) -> dict
+
+    Runs every stage for every scheme and size, in a temporary
+    directory under tmp, and returns the results with the details of
+    the machine and commit they were measured on.
+    """
+    work = tempfile.mkdtemp(prefix='testfmt-bench-', dir=tmp)
+    bench = Bench(work, repeat=repeat, memory=memory, cmp_limit=cmp_limit)
+    try:
+        for size in sizes:
+            for scheme in schemes:
+                bench.run(scheme, size, layouts)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return {
+        'version': VERSION,
+        'commit': git_commit(),
+        'date': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': bench.results,
+    }
+
+def compare_results(old, new, threshold=1.25, min_seconds=0.01):
+    """ (dict, dict, ...) -> list
+
+    Matches the results of two runs by layout, scheme, size and stage.
+    Returns (key, old seconds, new seconds, regressed) for each match;
+    a stage regressed if it got more than threshold times slower and
+    takes at least min_seconds.
+    """
+    def key(x):
+        return (x['layout'], x['scheme'], x['size'], x['stage'])
+    old_results = {key(x): x for x in old['results']}
+    rows = []
+    for x in new['results']:
+        y = old_results.get(key(x))
+        if y is None:
+            continue
+        regressed = (x['seconds'] >= min_seconds
+                     and x['seconds'] > y['seconds'] * threshold)
+        rows.append((key(x), y['seconds'], x['seconds'], regressed))
+    return rows
+
+def startup_command(args):
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(ROOT))
+    return ([sys.executable, '-m', 'testfmt'] + list(args), env)
+
+def imported_modules(args):
+    """ (list) -> list
+
+    Runs testfmt with args in a new interpreter and returns the names
+    of the modules it imported, as reported by -X importtime.
+    """
+    command, env = startup_command(args)
+    command.insert(1, '-Ximporttime')
+    result = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            name = line.rsplit('|', 1)[1].strip()
+            if name != 'package':
+                modules.append(name)
+    return modules
+
+def measure_startup(args, repeat=20):
+    """ (list, ...) -> float
+
+    Returns the best wall time of repeat runs of testfmt with args,
+    each in a new interpreter.
+    """
+    command, env = startup_command(args)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def output_bench_result(result):
+    """
+    Print one result as it is measured:
+        dir   *.in|*.ok          10000 convert                     0.1234s   12.3 MiB
+    """
+    peak = result['peak_bytes']
+    print("{:6} {:24} {:>8} {:26} {:9.4f}s {}".format(
+        result['layout'], result['scheme'], result['size'], result['stage'], result['seconds'],
+        '' if peak is None else '{:8.1f} MiB'.format(peak / 2**20)))
+    sys.stdout.flush()
+
+def output_bench_comparison(rows):
+    """
+    Print the old and new times of every stage, marking regressions.
+    """
+    for (layout, scheme, size, stage), old, new, regressed in rows:
+        print("{:6} {:24} {:>8} {:26} {:9.4f}s {:9.4f}s {:6.2f}x{}".format(
+            layout, scheme, size, stage, old, new, new / old if old else float('inf'),
+            '  REGRESSED' if regressed else ''))
+    print("")
+    print("Number of regression(s): {}.".format(sum(1 for x in rows if x[3])))
+
+def output_startup(seconds, lazy, budget):
+    """
+    Print the cold start time and the modules that should not have
+    been imported.
+    """
+    print("Cold start: {:.4f}s (budget {:.4f}s){}".format(
+        seconds, budget, '  OVER BUDGET' if seconds > budget else ''))
+    for name in lazy:
+        print("Imported eagerly: {}".format(name))
+
+def handle_run(args):
+    data = run_benchmarks(args.sizes, args.scheme or DEFAULT_SCHEMES, args.layout or LAYOUTS,
+                          repeat=args.repeat, memory=not args.no_memory,
+                          cmp_limit=args.cmp_limit, tmp=args.tmp)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(data, fp, indent=1)
+
+def handle_compare(args):
+    with open(args.compare[0]) as fp:
+        old = json.load(fp)
+    with open(args.compare[1]) as fp:
+        new = json.load(fp)
+    rows = compare_results(old, new, args.threshold, args.min_seconds)
+    output_bench_comparison(rows)
+    sys.exit(1 if any(x[3] for x in rows) else 0)
+
+def handle_startup(args):
+    command = args.startup or ['detect', '.']
+    lazy = [x for x in imported_modules(command)
+            if any(x == m or x.startswith(m + '.') for m in LAZY_MODULES)]
+    seconds = measure_startup(command, args.repeat if args.repeat > 1 else 20)
+    output_startup(seconds, lazy, args.budget)
+    sys.exit(1 if lazy or seconds > args.budget else 0)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Numbers of files per testset")
+    parser.add_argument('--scheme', action='append', help="Format pair of the testsets, like '*.in|*.ok'")
+    parser.add_argument('--layout', action='append', choices=LAYOUTS)
+    parser.add_argument('--repeat', type=int, default=1, help="Keep the best time of this many runs")
+    parser.add_argument('--no-memory', action='store_true', help="Do not measure peak memory")
+    parser.add_argument('--cmp-limit', type=int, default=100000, help="Largest size sorted with cmp_human")
+    parser.add_argument('--tmp', help="Create the testsets under this directory")
+    parser.add_argument('-o', '--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two result files")
+    parser.add_argument('--threshold', type=float, default=1.25, help="Slowdown ratio counted as a regression")
+    parser.add_argument('--min-seconds', type=float, default=0.01, help="Ignore stages faster than this")
+    parser.add_argument('--startup', nargs=argparse.REMAINDER, help="Time the cold start of testfmt run with these arguments")
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET, help="Cold start budget in seconds")
+    args = parser.parse_args()
+    if args.startup is not None:
+        handle_startup(args)
+    elif args.compare:
+        handle_compare(args)
+    else:
+        handle_run(args)
@@ -0,0 +1,11 @@
+""" testfmt
+
+A tool to format test data in a directory or a compressed file.
+The command line is testfmt.testfmt5, the library testfmt.api.
+
+Modules only needed by some commands (ZIP and tar support, thread
+and process pools, hashing) are imported on first use through
+misc.lazy_import, so that short commands start fast.
+"""
+
+__version__ = '5.0.0'
@@ -0,0 +1,3 @@
+from testfmt.testfmt5 import main
+
+main()
@@ -0,0 +1,642 @@
+#!/usr/bin/env python3
+
+""" api.py
+
+Library API. Nothing here exits the process or changes the working
+directory, and nothing is printed to stdout unless quiet=False, so
+the functions can be called from many threads at once (on different
+targets).
+All file names are relative to the target directory or archive.
+
+Usage:
+    result = api.detect('apple/')
+    print result.ifiles, result.ofiles
+    report = api.convert('apple.zip', difmt=..., dofmt=..., preview=True)
+    print report.success, report.src, report.dst
+"""
+
+import os
+import sys
+import array
+
+from testfmt import misc
+from testfmt import dedup
+from testfmt import format
+from testfmt import dircache
+from testfmt import filelist
+from testfmt import formatpair
+from testfmt import instrument
+
+from testfmt.filelist import BaseFileList, FileList, ZipFileList, TarFileList, RenameJournal
+from testfmt.nametable import NameTable
+
+tarfile = misc.lazy_import('tarfile')
+zipfile = misc.lazy_import('zipfile')
+futures = misc.lazy_import('concurrent.futures')
+
+class DetectResult(object):
+    """
+    Test cases found in a file list.
+    
+    Properties:
+        sifmt, sofmt (Format): None if detected by shards
+        ifiles, ofiles (list): nametable.NameViews while planning
+        duplicates (list or None): groups of indices of byte-identical
+            test cases, None if they were not looked for
+        shards (list or None): (directory, DetectResult) of every
+            directory with test cases, named relative to it, if
+            detected by detect_shards
+        num_test_cases (int)
+    
+    Methods:
+        to_lists(self)
+    """
+    
+    def __init__(self, sifmt, sofmt, ifiles, ofiles, duplicates=None):
+        self.sifmt = sifmt
+        self.sofmt = sofmt
+        self.ifiles = ifiles
+        self.ofiles = ofiles
+        self.duplicates = duplicates
+        self.shards = None
+    
+    def __repr__(self):
+        return 'api.DetectResult({}, {}, {} test case(s))'.format(
+            self.sifmt, self.sofmt, self.num_test_cases)
+    
+    @property
+    def num_test_cases(self):
+        return len(self.ifiles)
+    
+    def to_lists(self):
+        """ (self) -> DetectResult
+        
+        Replaces the names, in the shards too, by plain lists and
+        returns self.
+        """
+        self.ifiles, self.ofiles = list(self.ifiles), list(self.ofiles)
+        for shard, result in self.shards or ():
+            result.to_lists()
+        return self
+
+class ConvertReport(object):
+    """
+    Outcome of a conversion.
+    
+    Properties:
+        detected (DetectResult)
+        difmt, dofmt (Format)
+        src, dst (list): requested moves; nametable.NameView and
+            NameTable while planning
+        dest (str or None): directory or ZIP file the renamed copy is
+            written to, None to rename in place
+        dropped (list): duplicate test cases left out, as
+            (ifile, ofile) pairs
+        normalized (list): test files whose content is normalized, or
+            would be in preview mode, by their names before the moves
+        plan (tuple or None): (src, dst) of the planned file operations,
+            None if the moves can not be done together; with dest,
+            every file copied and its new name
+        checked (bool): True if the moves can be done together
+        cancelled (bool): True if the moves were stopped and rolled back
+        preview (bool): True if no file operations were performed
+        success (bool): True if the moves can be done and, unless in
+            preview mode, all file operations have been done
+        shards (list or None): (directory, ConvertReport) of every
+            directory with test cases, if converted by convert_shards
+        num_test_cases (int)
+    
+    Methods:
+        to_lists(self)
+    """
+    
+    def __init__(self, detected, difmt, dofmt, src, dst, preview):
+        self.detected = detected
+        self.difmt = difmt
+        self.dofmt = dofmt
+        self.src = src
+        self.dst = dst
+        self.dest = None
+        self.dropped = []
+        self.normalized = []
+        self.preview = preview
+        self.plan = None
+        self.checked = False
+        self.cancelled = False
+        self.success = False
+        self.shards = None
+    
+    def __repr__(self):
+        return 'api.ConvertReport({} test case(s), success={})'.format(
+            self.num_test_cases, self.success)
+    
+    @property
+    def num_test_cases(self):
+        return self.detected.num_test_cases
+    
+    def to_lists(self):
+        """ (self) -> ConvertReport
+        
+        Same as DetectResult.to_lists, for the moves and the plan too.
+        """
+        self.detected.to_lists()
+        self.src, self.dst = list(self.src), list(self.dst)
+        if self.plan is not None:
+            self.plan = (list(self.plan[0]), list(self.plan[1]))
+        for shard, report in self.shards or ():
+            report.to_lists()
+        return self
+
+def best_format_pair(files):
+    return detect_format_pair(files)[0]
+
+def detect_format_pair(files, pairs=None):
+    """ (list or NameTable, list) -> (FormatPair, list, list)
+
+    Scores every format pair in a single pass over files and returns
+    the pair with the most test cases (the first one on ties) along
+    with its ifiles and ofiles, as get_ifiles_ofiles would give them.
+    """
+
+    if pairs is None:
+        pairs = formatpair.ALL_KNOWN_FORMAT_PAIRS
+    assert len(pairs) > 0
+
+    table = files if isinstance(files, NameTable) else NameTable(files)
+    index = format.FormatIndex(pair.ifmt for pair in pairs)
+    find = table.find
+    unique = not table.has_duplicates()
+    used = {}
+    found = [(array.array('I'), array.array('I')) for pair in pairs]
+
+    for h, x in enumerate(table):
+        for i in index.matches(x):
+            j = find(format.convert_format(x, pairs[i].ifmt, pairs[i].ofmt))
+            if j < 0:
+                continue
+            if i not in used:
+                used[i] = bytearray(len(table))
+            k = h if unique else find(x)
+            if used[i][k] or used[i][j]:
+                continue
+            used[i][k] = used[i][j] = 1
+            found[i][0].append(k)
+            found[i][1].append(j)
+
+    best = max(range(len(pairs)), key=lambda i: len(found[i][0]))
+    ifiles, ofiles = paired_names(files, table, *found[best])
+    return (pairs[best], ifiles, ofiles)
+
+def get_ifiles_ofiles(files, ifmt, ofmt):
+    """ (list or NameTable, Format, Format) -> (list, list)
+
+    Pairs every file matching ifmt with its counterpart under ofmt.
+    Files are visited in order; a file used once (as input or output)
+    is never paired again. Names are looked up by handle in a
+    NameTable and marked used in a bytearray, so the whole pass is
+    linear in len(files) and keeps no set of names.
+    """
+
+    assert isinstance(files, (list, NameTable))
+    assert isinstance(ifmt, format.Format)
+    assert isinstance(ofmt, format.Format)
+
+    table = files if isinstance(files, NameTable) else NameTable(files)
+    find = table.find
+    unique = not table.has_duplicates()
+    used = bytearray(len(table))
+    ifiles, ofiles = array.array('I'), array.array('I')
+    infix_list = ifmt.compile().infix_list
+    text_list = ofmt.compile().text_list
+
+    for start in range(0, len(table), format.CHUNK_SIZE):
+        chunk = table[start:start + format.CHUNK_SIZE]
+        infixes = infix_list(chunk)
+        xs = [i for i in range(len(chunk)) if infixes[i] is not None]
+        ys = text_list([x for x in infixes if x is not None], numbered=False)
+        for i, y in zip(xs, ys):
+            j = find(y)
+            if j < 0:
+                continue
+            k = start + i if unique else find(chunk[i])
+            if used[k] or used[j]:
+                continue
+            used[k] = used[j] = 1
+            ifiles.append(k)
+            ofiles.append(j)
+    return paired_names(files, table, ifiles, ofiles)
+
+def paired_names(files, table, ifiles, ofiles):
+    """ (list or NameTable, NameTable, array, array) -> (list, list)
+
+    Returns the names of the handles ifiles and ofiles in table: as
+    views of a snapshot of files if it is a NameTable, as lists
+    otherwise.
+    """
+    if files is table:
+        snapshot = table.copy()
+        return (snapshot.view(ifiles), snapshot.view(ofiles))
+    return (list(table.view(ifiles)), list(table.view(ofiles)))
+
+def open_file_list(path, alphabet=False, in_place=False, depth=2, include=None, exclude=None, cache=None,
+                   recover=False, rollback=False, **kwargs):
+    """ (str, ...) -> FileList|ZipFileList|TarFileList
+    
+    Lists a directory, a ZIP file or a tar file and sorts the names.
+    cache is a dircache.DirCache or the path of its file.
+    
+    The journals of interrupted conversions of a directory, in it or
+    in the subdirectories converted by convert_shards, are only
+    recovered with recover=True: the moves are resumed, or rolled back
+    if rollback is True, before listing. Otherwise nothing is changed
+    and the directories holding them are listed in
+    file_list.pending_journals.
+    """
+    assert path != ''
+    with instrument.stage('list'):
+        filelist.recover_zip_journal(path)
+        if os.path.isfile(path) and zipfile.is_zipfile(path):
+            file_list = ZipFileList(path, in_place=in_place)
+        elif os.path.isfile(path) and filelist.tar_compression(path) is not None:
+            file_list = TarFileList(path)
+        elif not os.path.isdir(path):
+            raise FileNotFoundError("No such directory or archive: '{}'".format(path))
+        else:
+            if isinstance(cache, str):
+                cache = dircache.DirCache(cache)
+            file_list = FileList.from_directory(
+                path, depth=depth, include=include, exclude=exclude, cache=cache)
+            journals = FileList.find_journals(path, file_list.files)
+            if journals and recover:
+                for x in journals:
+                    FileList.recover_journal(os.path.join(path, x) if x else path, rollback=rollback)
+                file_list = FileList.from_directory(
+                    path, depth=depth, include=include, exclude=exclude, cache=cache)
+            else:
+                file_list.pending_journals = journals
+            if cache is not None:
+                cache.save()
+    
+    with instrument.stage('sort'):
+        file_list.files.sort(key=None if alphabet else misc.human_key)
+    
+    return file_list
+
+def iter_file_list(path, alphabet=False, depth=2, include=None, exclude=None, cache=None, **kwargs):
+    """ (str, ...) -> iterator
+    
+    Yields the names open_file_list would list, in the same order,
+    without recovering interrupted conversions.
+    The files of a directory come out while deeper directories are
+    still being listed; an archive is listed all at once.
+    """
+    assert path != ''
+    key = None if alphabet else misc.human_key
+    filelist.recover_zip_journal(path)
+    if os.path.isfile(path) and zipfile.is_zipfile(path):
+        for x in sorted(ZipFileList(path).files, key=key):
+            yield x
+        return
+    if os.path.isfile(path) and filelist.tar_compression(path) is not None:
+        for x in sorted(TarFileList(path).files, key=key):
+            yield x
+        return
+    if not os.path.isdir(path):
+        raise FileNotFoundError("No such directory or archive: '{}'".format(path))
+    
+    if isinstance(cache, str):
+        cache = dircache.DirCache(cache)
+    for x in misc.iter_file_list_sorted(key, depth=depth, include=include,
+                                        exclude=exclude, cache=cache, root=path):
+        if x != filelist.RenameJournal.NAME:
+            yield x
+    if cache is not None:
+        cache.save()
+
+def detect_file_list(file_list, sifmt=None, sofmt=None, duplicates=False, hash_cache=None, views=False,
+                     save_cache=True):
+    """ (BaseFileList, Format, Format, ...) -> DetectResult
+    
+    Pairs the files with the given formats, or with the best known
+    format pair if none are given. With duplicates=True the contents
+    are hashed to find byte-identical test cases; hash_cache is a
+    dedup.HashCache or the path of its file, saved afterwards unless
+    save_cache=False. The names are lists, or with views=True the
+    nametable.NameViews planning works on.
+    """
+    assert (sifmt is None) == (sofmt is None)
+    with instrument.stage('detect'):
+        if sifmt is None and sofmt is None:
+            pair, ifiles, ofiles = detect_format_pair(file_list.files)
+            sifmt, sofmt = pair.ifmt, pair.ofmt
+        else:
+            ifiles, ofiles = get_ifiles_ofiles(file_list.files, sifmt, sofmt)
+    result = DetectResult(sifmt, sofmt, ifiles, ofiles)
+    if duplicates:
+        with instrument.stage('dedup'):
+            if isinstance(hash_cache, str):
+                hash_cache = dedup.HashCache(hash_cache)
+            result.duplicates = dedup.find_duplicate_tests(file_list, ifiles, ofiles, cache=hash_cache)
+            if hash_cache is not None and save_cache:
+                hash_cache.save()
+    return result if views else result.to_lists()
+
+def convert_file_list(file_list, sifmt=None, sofmt=None, difmt=None, dofmt=None, preview=False, quiet=True, stop=None,
+                      drop_duplicates=False, hash_cache=None, dest=None, link='auto', normalize=False):
+    """ (FileList|ZipFileList|TarFileList, Format, Format, Format, Format, ...) -> ConvertReport
+    
+    Renames the test cases found by detect_file_list to difmt/dofmt
+    (DEFAULT_IFMT/DEFAULT_OFMT by default). The moves are checked by
+    planning them first; nothing is changed in preview mode, if they
+    can not be done together or if there are no test cases. Setting the
+    threading.Event stop from another thread interrupts the moves,
+    which are then rolled back. With drop_duplicates=True only the
+    first of byte-identical test cases is renamed; the others are
+    left as they are and listed in report.dropped.
+    
+    If dest is given, file_list is left untouched and a copy of it is
+    written to the new directory or ZIP file dest instead, with the
+    test cases renamed and the dropped duplicates left out. Files are
+    linked as link says (see filelist.LINK_MODES) between directories,
+    and compressed data is copied as is between ZIP files.
+    
+    With normalize=True the test files are scanned in parallel and
+    those with CRLF line endings, trailing whitespace or no final
+    newline are rewritten (see normalize.py): after the renames in a
+    directory, during the rewrite of an archive, in the copy with dest.
+    Clean files are left untouched.
+    """
+    report = plan_conversion(file_list, sifmt, sofmt, difmt, dofmt, preview=preview,
+                             drop_duplicates=drop_duplicates, hash_cache=hash_cache,
+                             dest=dest, normalize=normalize)
+    if preview or not report.checked or report.num_test_cases == 0:
+        report.success = report.checked
+        return report.to_lists()
+    try:
+        run_conversion(file_list, report, quiet=quiet, stop=stop, link=link)
+    finally:
+        if dest is None and isinstance(file_list, FileList) and file_list.cache is not None:
+            file_list.cache.save()
+    return report.to_lists()
+
+def plan_conversion(file_list, sifmt=None, sofmt=None, difmt=None, dofmt=None, preview=False,
+                    drop_duplicates=False, hash_cache=None, dest=None, normalize=False, save_cache=True):
+    """ (FileList|ZipFileList|TarFileList, Format, Format, Format, Format, ...) -> ConvertReport
+    
+    The first half of convert_file_list: detects the test cases and
+    plans the moves, or the copy to dest, without changing anything.
+    The names of the report are still views (see ConvertReport).
+    """
+    detected = detect_file_list(file_list, sifmt, sofmt, duplicates=drop_duplicates,
+                                hash_cache=hash_cache, views=True, save_cache=save_cache)
+    dropped = []
+    if drop_duplicates:
+        detected.ifiles, detected.ofiles, dropped = dedup.drop_duplicate_tests(
+            detected.ifiles, detected.ofiles, detected.duplicates)
+    
+    assert (difmt is None) == (dofmt is None)
+    if difmt is None and dofmt is None:
+        difmt, dofmt = formatpair.DEFAULT_IFMT, formatpair.DEFAULT_OFMT
+    
+    with instrument.stage('plan'):
+        src = misc.join_alternatively(detected.ifiles, detected.ofiles)
+        dst = NameTable(misc.iter_alternatively(
+            format.iter_convert_format_list(detected.ifiles, detected.sifmt, difmt),
+            format.iter_convert_format_list(detected.ofiles, detected.sofmt, dofmt)))
+        report = ConvertReport(detected, difmt, dofmt, src, dst, preview)
+        report.dropped = dropped
+        report.dest = dest
+        if dest is None:
+            report.plan = file_list.plan_moves(src, dst)
+        else:
+            report.plan = plan_copy(file_list.files, src, dst, dropped)
+    report.checked = report.plan is not None
+    if normalize and report.checked:
+        with instrument.stage('scan'):
+            report.normalized = file_list.find_unnormalized(src)
+    return report
+
+def run_conversion(file_list, report, quiet=True, stop=None, link='auto'):
+    """ (FileList|ZipFileList|TarFileList, ConvertReport, ...) -> None
+    
+    The second half of convert_file_list: does the moves, or the copy,
+    of a checked report of plan_conversion and records the outcome in
+    report.success and report.cancelled.
+    """
+    assert report.checked
+    dirty = []
+    if report.normalized:
+        new_name = dict(zip(report.src, report.dst))
+        dirty = [new_name[x] for x in report.normalized]
+    
+    if report.dest is not None:
+        try:
+            with instrument.stage('copy'):
+                file_list.copy_files(report.plan[0], report.plan[1], report.dest,
+                                     link=link, quiet=quiet, dirty=dirty)
+            report.success = True
+        except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+            if not quiet:
+                print(e, file=sys.stderr)
+        return
+    
+    with instrument.stage('rename'):
+        report.success = file_list.move_files_directly(
+            report.plan[0], report.plan[1], real=True, quiet=quiet, stop=stop, dirty=dirty)
+    report.cancelled = not report.success and stop is not None and stop.is_set()
+
+def detect_shards(file_list, sifmt=None, sofmt=None, depth=1, jobs=None, duplicates=False, hash_cache=None):
+    """ (BaseFileList, Format, Format, ...) -> DetectResult
+    
+    Same as detect_file_list, for every directory at the given depth
+    (see BaseFileList.shards) on its own: each gets the best known
+    format pair for its files, unless sifmt and sofmt are given, and
+    byte-identical test cases are only looked for inside it. The
+    format pairs are detected in parallel by jobs processes. The
+    results are merged into one, named relative to file_list.
+    """
+    assert (sifmt is None) == (sofmt is None)
+    if isinstance(hash_cache, str):
+        hash_cache = dedup.HashCache(hash_cache)
+    shards = file_list.shards(depth)
+    results = []
+    for (shard, shard_list), pair in zip(shards, shard_format_pairs(shards, sifmt, sofmt, jobs)):
+        if pair is not None:
+            results.append((shard, detect_file_list(shard_list, pair.ifmt, pair.ofmt, duplicates=duplicates,
+                                                    hash_cache=hash_cache, save_cache=False)))
+    if duplicates and hash_cache is not None:
+        hash_cache.save()
+    return merge_detect_results(results, duplicates)
+
+def convert_shards(file_list, sifmt=None, sofmt=None, difmt=None, dofmt=None, preview=False, quiet=True, stop=None,
+                   drop_duplicates=False, hash_cache=None, dest=None, link='auto', normalize=False,
+                   depth=1, jobs=None):
+    """ (FileList, Format, Format, Format, Format, ...) -> ConvertReport
+    
+    Same as convert_file_list, for every directory at the given depth
+    on its own, as detect_shards detects them; the test cases of each
+    are numbered from the start inside it. The moves of all the
+    directories are planned first, in parallel by jobs threads, and
+    nothing is changed unless they all can be done. Each directory is
+    then renamed by a thread of its own under its own journal: one
+    that fails or is stopped rolls back its own moves, the others are
+    kept, and report.success tells if all went through. The reports
+    are merged into one, named relative to file_list.
+    
+    Only directories can be converted by shards, in place (dest and
+    link are not supported).
+    """
+    if not isinstance(file_list, FileList) or dest is not None:
+        raise ValueError("Only directories can be converted by shards, in place")
+    if isinstance(hash_cache, str):
+        hash_cache = dedup.HashCache(hash_cache)
+    assert (difmt is None) == (dofmt is None)
+    if difmt is None and dofmt is None:
+        difmt, dofmt = formatpair.DEFAULT_IFMT, formatpair.DEFAULT_OFMT
+    
+    shards = file_list.shards(depth)
+    pairs = shard_format_pairs(shards, sifmt, sofmt, jobs)
+    shards = [(x, y, pair) for (x, y), pair in zip(shards, pairs) if pair is not None]
+    
+    def plan(shard):
+        shard_list, pair = shard[1:]
+        return plan_conversion(shard_list, pair.ifmt, pair.ofmt, difmt, dofmt, preview=preview,
+                               drop_duplicates=drop_duplicates, hash_cache=hash_cache, normalize=normalize,
+                               save_cache=False)
+    
+    def run(shard, shard_report):
+        if shard_report.num_test_cases > 0:
+            run_conversion(shard[1], shard_report, quiet=quiet, stop=stop)
+        else:
+            shard_report.success = True
+    
+    with futures.ThreadPoolExecutor(jobs) as executor:
+        reports = list(executor.map(plan, shards))
+        if drop_duplicates and hash_cache is not None:
+            hash_cache.save()
+        report = merge_convert_reports([x[0] for x in shards], reports, difmt, dofmt, preview)
+        if preview or not report.checked or report.num_test_cases == 0:
+            report.success = report.checked
+            return report.to_lists()
+        try:
+            list(executor.map(run, shards, reports))
+        finally:
+            if file_list.cache is not None:
+                file_list.cache.save()
+    
+    # The shards printed their own moves; file_list only takes the names.
+    for shard, shard_report in report.shards:
+        if shard_report.success and shard_report.plan[0]:
+            src, dst = (list(map(shard_path(shard), x)) for x in shard_report.plan)
+            file_list.move_files_directly(src, dst, quiet=True)
+    report.success = all(x.success for x in reports)
+    report.cancelled = any(x.cancelled for x in reports)
+    return report.to_lists()
+
+def shard_format_pairs(shards, sifmt=None, sofmt=None, jobs=None):
+    """ (list, Format, Format, ...) -> list
+    
+    Returns the format pair of every (directory, file list) of shards,
+    sifmt and sofmt if given, or the best known one, None for those
+    without test cases. Several shards are detected by a process pool
+    of jobs processes.
+    """
+    if sifmt is not None:
+        return [formatpair.FormatPair(sifmt, sofmt)] * len(shards)
+    names = [list(shard_list.files) for shard, shard_list in shards]
+    if len(names) > 1 and jobs != 1:
+        with futures.ProcessPoolExecutor(jobs) as executor:
+            return list(executor.map(detect_shard_pair, names))
+    return list(map(detect_shard_pair, names))
+
+def detect_shard_pair(names):
+    """ (list) -> FormatPair or None
+    
+    Same as best_format_pair, None if there are no test cases.
+    """
+    pair, ifiles, ofiles = detect_format_pair(names)
+    return pair if len(ifiles) > 0 else None
+
+def shard_path(shard):
+    """ (str) -> function
+    
+    Returns the function naming a file of shard relative to the file
+    list it was split from.
+    """
+    return (lambda x: shard + '/' + x) if shard else (lambda x: x)
+
+def merge_detect_results(results, duplicates=False):
+    """ (list, ...) -> DetectResult
+    
+    Merges (directory, DetectResult) of detect_shards into one.
+    """
+    ifiles, ofiles, groups = [], [], []
+    for shard, result in results:
+        groups.extend([i + len(ifiles) for i in x] for x in result.duplicates or [])
+        ifiles.extend(map(shard_path(shard), result.ifiles))
+        ofiles.extend(map(shard_path(shard), result.ofiles))
+    merged = DetectResult(None, None, ifiles, ofiles, groups if duplicates else None)
+    merged.shards = results
+    return merged
+
+def merge_convert_reports(shards, reports, difmt, dofmt, preview):
+    """ (list, list, Format, Format, bool) -> ConvertReport
+    
+    Merges the reports of plan_conversion for the directories shards
+    into one.
+    """
+    detected = merge_detect_results([(x, y.detected) for x, y in zip(shards, reports)],
+                                    any(y.detected.duplicates is not None for y in reports))
+    src, dst, plan_src, plan_dst = [], [], [], []
+    report = ConvertReport(detected, difmt, dofmt, src, dst, preview)
+    for shard, shard_report in zip(shards, reports):
+        path = shard_path(shard)
+        src.extend(map(path, shard_report.src))
+        dst.extend(map(path, shard_report.dst))
+        report.dropped.extend((path(x), path(y)) for x, y in shard_report.dropped)
+        report.normalized.extend(map(path, shard_report.normalized))
+        if shard_report.checked:
+            plan_src.extend(map(path, shard_report.plan[0]))
+            plan_dst.extend(map(path, shard_report.plan[1]))
+    report.checked = all(x.checked for x in reports)
+    report.plan = (plan_src, plan_dst) if report.checked else None
+    report.shards = list(zip(shards, reports))
+    return report
+
+def plan_copy(files, src, dst, dropped=()):
+    """ (list, list, list, ...) -> (list, list) or None
+    
+    Returns every file of files but the dropped test cases, and its
+    name in the copy: its dst name for src files, the same otherwise.
+    Returns None if two files would get the same name.
+    """
+    new_name = dict(zip(src, dst))
+    skip = set()
+    for ifile, ofile in dropped:
+        skip.update((ifile, ofile))
+    names = [x for x in files if x not in skip]
+    new_names = [new_name.get(x, x) for x in names]
+    if len(set(new_names)) != len(new_names):
+        return None
+    return (names, new_names)
+
+def detect(path, sifmt=None, sofmt=None, duplicates=False, hash_cache=None, **kwargs):
+    """ (str, Format, Format, ...) -> DetectResult
+    
+    Same as detect_file_list(open_file_list(path, ...), ...).
+    """
+    return detect_file_list(open_file_list(path, **kwargs), sifmt, sofmt,
+                            duplicates=duplicates, hash_cache=hash_cache)
+
+def convert(path, sifmt=None, sofmt=None, difmt=None, dofmt=None, preview=False, quiet=True, stop=None,
+            drop_duplicates=False, hash_cache=None, dest=None, link='auto', normalize=False, **kwargs):
+    """ (str, Format, Format, Format, Format, ...) -> ConvertReport
+    
+    Same as convert_file_list(open_file_list(path, ...), ...),
+    recovering interrupted conversions first unless in preview mode.
+    """
+    kwargs.setdefault('recover', not preview)
+    return convert_file_list(open_file_list(path, **kwargs),
+                             sifmt, sofmt, difmt, dofmt, preview=preview, quiet=quiet, stop=stop,
+                             drop_duplicates=drop_duplicates, hash_cache=hash_cache,
+                             dest=dest, link=link, normalize=normalize)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+""" asyncapi.py
+
+AsyncRunner
+
+asyncio front-end of api.py. Listing, ZIP reading, detection and
+renames run in a bounded thread pool, off the event loop.
+
+Usage:
+    async with AsyncRunner(max_workers=8) as runner:
+        result = await runner.detect('apple/')
+        report = await runner.convert('apple.zip', preview=True)
+"""
+
+import asyncio
+import functools
+import threading
+import concurrent.futures
+
+from testfmt import api
+
+class AsyncRunner(object):
+    """
+    Runs api functions in a thread pool of at most max_workers threads.
+    
+    Cancelling convert stops the moves and waits until the ones
+    already done have been rolled back by move_files_directly, before
+    CancelledError is raised.
+    
+    Methods:
+        __init__(self, max_workers=None)
+        open_file_list(self, path, **kwargs)
+        detect(self, path, sifmt=None, sofmt=None, **kwargs)
+        convert(self, path, ..., preview=False, **kwargs)
+        close(self)
+    """
+    
+    def __init__(self, max_workers=None):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+    
+    def __repr__(self):
+        return 'asyncapi.AsyncRunner(max_workers={})'.format(self.executor._max_workers)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        self.executor.shutdown(wait=False)
+    
+    def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+    
+    async def open_file_list(self, path, **kwargs):
+        """ (self, str, ...) -> FileList|ZipFileList """
+        return await self.run(api.open_file_list, path, **kwargs)
+    
+    async def detect(self, path, sifmt=None, sofmt=None, **kwargs):
+        """ (self, str, Format, Format, ...) -> DetectResult """
+        return await self.run(api.detect, path, sifmt, sofmt, **kwargs)
+    
+    async def convert(self, path, sifmt=None, sofmt=None, difmt=None, dofmt=None, preview=False, **kwargs):
+        """ (self, str, Format, Format, Format, Format, ...) -> ConvertReport """
+        stop = threading.Event()
+        future = self.run(api.convert, path, sifmt, sofmt, difmt, dofmt,
+                          preview=preview, stop=stop, **kwargs)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            stop.set()
+            try:
+                await future
+            except Exception:
+                pass
+            raise
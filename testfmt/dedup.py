@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+""" dedup.py
+
+HashCache, find_duplicate_tests, drop_duplicate_tests
+
+Usage:
+    cache = HashCache(path)
+    groups = find_duplicate_tests(file_list, ifiles, ofiles, cache=cache)
+    ifiles, ofiles, dropped = drop_duplicate_tests(ifiles, ofiles, groups)
+    cache.save()
+"""
+
+import io
+import os
+
+from testfmt import misc
+from testfmt import filelist
+from testfmt import instrument
+from testfmt import jsoncache
+
+hashlib = misc.lazy_import('hashlib')
+zipfile = misc.lazy_import('zipfile')
+futures = misc.lazy_import('concurrent.futures')
+
+DEFAULT_PATH = jsoncache.default_path('hashcache.json')
+
+CHUNK_SIZE = 1 << 20
+
+class HashCache(jsoncache.JsonCache):
+    """
+    Keeps the content hashes of files on disk between runs.
+
+    A hash is reused while the file keeps the same size and stamp: the
+    mtime of a file in a directory, the CRC of a ZIP member, the mtime
+    of the whole archive for a tar member. Hashes of racy files are not
+    stored (see jsoncache.JsonCache).
+
+    Methods:
+        __init__(self, path=DEFAULT_PATH, max_entries=...)
+        get_digest(self, key, size, stamp)
+        put_digest(self, key, size, stamp, digest)
+        save(self)
+    """
+
+    FIELD = 'hashes'
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=1000000):
+        super(HashCache, self).__init__(path, max_entries)
+
+    def get_digest(self, key, size, stamp):
+        """ (self, str, int, int) -> str or None """
+        entry = self.get(key)
+        if entry is None or entry[0] != size or entry[1] != stamp:
+            return None
+        return entry[2]
+
+    def put_digest(self, key, size, stamp, digest):
+        """ (self, str, int, int, str) -> None """
+        self.put(key, [size, stamp, digest])
+
+def hash_stream(fp, chunk_size=CHUNK_SIZE):
+    """ (file, ...) -> str
+
+    Hashes a binary file object chunk by chunk.
+    """
+    h = hashlib.sha256()
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            return h.hexdigest()
+        instrument.count('bytes_read', len(chunk))
+        h.update(chunk)
+
+class ContentSource(object):
+    """
+    Reads the files of a FileList or the members of a ZipFileList or
+    a TarFileList.
+
+    A signature is (size, stamp, crc): crc is None for files in a
+    directory, whose stamp is their mtime, and for tar members. Since
+    a rebuilt tar may keep the sizes and mtimes of its members, their
+    stamp is the mtime of the archive, and their key holds the size of
+    the archive and the offset of the member in it.
+    Tar members can only be read in order, by iter_members.
+
+    Methods:
+        __init__(self, file_list)
+        signatures(self, names)
+        key(self, name)
+        open(self, name)
+        iter_members(self, names)
+        close(self)
+    """
+
+    def __init__(self, file_list):
+        self.zip_file = None
+        self.tar_list = None
+        if isinstance(file_list, filelist.ZipFileList):
+            self.zip_file = zipfile.ZipFile(file_list.src_path, 'r')
+            self.base = os.path.abspath(file_list.src_path) + '::'
+        elif isinstance(file_list, filelist.TarFileList):
+            self.tar_list = file_list
+            self.base = os.path.abspath(file_list.src_path) + '::'
+            self.offsets = {}
+        else:
+            self.root = getattr(file_list, 'root', '.')
+            self.base = os.path.abspath(self.root) + os.sep
+
+    def signatures(self, names):
+        """ (self, list) -> dict """
+        if self.zip_file is not None:
+            result = {}
+            for name in names:
+                info = self.zip_file.getinfo(name)
+                result[name] = (info.file_size, info.CRC, info.CRC)
+            return result
+        if self.tar_list is not None:
+            links, sizes = self.tar_list.links, {}
+            instrument.count('stat')
+            st = os.stat(self.tar_list.src_path)
+            with filelist.open_tar_stream(self.tar_list.src_path, self.tar_list.compression) as tar:
+                for info in tar:
+                    if not info.islnk() and info.name not in sizes:
+                        sizes[info.name] = info.size
+                        self.offsets[info.name] = '{}:{}'.format(st.st_size, info.offset)
+            for x in names:
+                self.offsets[x] = self.offsets[links.get(x, x)]
+            return {x: (sizes[links.get(x, x)], st.st_mtime_ns, None) for x in names}
+        result = {}
+        instrument.count('stat', len(names))
+        for name in names:
+            st = os.stat(os.path.join(self.root, name))
+            result[name] = (st.st_size, st.st_mtime_ns, None)
+        return result
+
+    def key(self, name):
+        if self.tar_list is not None:
+            return '{}{}:{}'.format(self.base, self.offsets[name], name)
+        return self.base + name
+
+    def open(self, name):
+        if self.zip_file is not None:
+            return self.zip_file.open(name)
+        return open(os.path.join(self.root, name), 'rb')
+
+    def iter_members(self, names):
+        """ (self, iterable) -> iterator of (list, file)
+
+        Same as TarFileList.iter_data, with symbolic links read as
+        their target path.
+        """
+        for group, info, fp in self.tar_list.iter_data(names):
+            yield (group, fp or io.BytesIO(info.linkname.encode('utf-8', 'surrogateescape')))
+
+    def close(self):
+        if self.zip_file is not None:
+            self.zip_file.close()
+
+def content_hashes(source, names, signatures, workers=None, cache=None):
+    """ (ContentSource, list, dict, ...) -> dict
+
+    Hashes the contents of names in a thread pool, or in one pass over
+    a tar file, reusing and filling cache (a HashCache) if given.
+    """
+    def lookup(name):
+        size, stamp, crc = signatures[name]
+        return cache.get_digest(source.key(name), size, stamp) if cache is not None else None
+
+    def store(name, digest):
+        size, stamp, crc = signatures[name]
+        if cache is not None and (crc is not None or not cache.racy(stamp)):
+            cache.put_digest(source.key(name), size, stamp, digest)
+
+    def work(name):
+        digest = lookup(name)
+        if digest is None:
+            with source.open(name) as fp:
+                digest = hash_stream(fp)
+            store(name, digest)
+        return digest
+
+    if source.tar_list is not None:
+        digests = {x: lookup(x) for x in names}
+        for group, fp in source.iter_members([x for x in names if digests[x] is None]):
+            digest = hash_stream(fp)
+            for name in group:
+                digests[name] = digest
+                store(name, digest)
+        return digests
+
+    with futures.ThreadPoolExecutor(workers) as executor:
+        return dict(zip(names, executor.map(work, names)))
+
+def find_duplicate_tests(file_list, ifiles, ofiles, workers=None, cache=None):
+    """ (BaseFileList, list, list, ...) -> list
+
+    Returns the groups of test cases whose input files and output
+    files are byte-identical, as lists of indices into ifiles/ofiles.
+    Only groups of two or more are returned, ordered by first index.
+
+    Test cases are first grouped by size (and CRC for ZIP members),
+    so only the files of possible duplicates are hashed.
+    cache is a HashCache or the path of its file.
+    """
+    assert len(ifiles) == len(ofiles)
+    if isinstance(cache, str):
+        cache = HashCache(cache)
+
+    source = ContentSource(file_list)
+    try:
+        sig = source.signatures(ifiles + ofiles)
+        candidates = {}
+        for i in range(len(ifiles)):
+            a, b = sig[ifiles[i]], sig[ofiles[i]]
+            candidates.setdefault((a[0], a[2], b[0], b[2]), []).append(i)
+        candidates = [x for x in candidates.values() if len(x) > 1]
+
+        names = []
+        for group in candidates:
+            for i in group:
+                names.extend([ifiles[i], ofiles[i]])
+        digests = content_hashes(source, names, sig, workers=workers, cache=cache)
+    finally:
+        source.close()
+
+    groups = []
+    for group in candidates:
+        same = {}
+        for i in group:
+            same.setdefault((digests[ifiles[i]], digests[ofiles[i]]), []).append(i)
+        groups.extend(x for x in same.values() if len(x) > 1)
+    return sorted(groups)
+
+def drop_duplicate_tests(ifiles, ofiles, groups):
+    """ (list, list, list) -> (list, list, list)
+
+    Keeps the first test case of every group of duplicates.
+    Returns the remaining ifiles and ofiles, and the dropped test
+    cases as (ifile, ofile) pairs.
+    """
+    dropped = set()
+    for group in groups:
+        dropped.update(group[1:])
+    keep = [i for i in range(len(ifiles)) if i not in dropped]
+    return ([ifiles[i] for i in keep], [ofiles[i] for i in keep],
+            [(ifiles[i], ofiles[i]) for i in sorted(dropped)])
+
+if __name__ == '__main__':
+    ifiles, ofiles = ['1.in', '2.in', '3.in'], ['1.ok', '2.ok', '3.ok']
+    assert drop_duplicate_tests(ifiles, ofiles, [[0, 2]]) == (
+        ['1.in', '2.in'], ['1.ok', '2.ok'], [('3.in', '3.ok')])
+    assert drop_duplicate_tests(ifiles, ofiles, []) == (ifiles, ofiles, [])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+""" dircache.py
+
+DirCache
+
+Usage:
+    cache = DirCache(path)
+    files = misc.get_file_list_recursively(cache=cache)
+    cache.invalidate(renamed_file)
+    cache.save()
+"""
+
+import os
+
+from testfmt import misc
+from testfmt import instrument
+from testfmt import jsoncache
+
+DEFAULT_PATH = jsoncache.default_path('dircache.json')
+
+class DirCache(jsoncache.JsonCache):
+    """
+    Keeps the listing of directories on disk between runs.
+
+    A listing is reused while the directory keeps the same mtime,
+    inode and device; those of racy directories are not stored (see
+    jsoncache.JsonCache).
+
+    Methods:
+        __init__(self, path=DEFAULT_PATH, max_entries=...)
+        list(self, path, root='.')
+        invalidate(self, path)
+        save(self)
+    """
+
+    VERSION = 2
+    FIELD = 'dirs'
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=100000):
+        super(DirCache, self).__init__(path, max_entries)
+
+    def list(self, path, root='.'):
+        """ (self, str, ...) -> (list, list)
+
+        Same as misc.get_file_list_and_dirr_list, reusing the cached
+        listing if the directory has not changed.
+        """
+        instrument.count('stat')
+        try:
+            st = os.stat(os.path.join(root, path))
+        except OSError:
+            return ([], [])
+        key = os.path.abspath(os.path.join(root, path))
+        stamp = [st.st_mtime_ns, st.st_ino, st.st_dev]
+
+        entry = self.get(key)
+        if entry is None or entry[:3] != stamp:
+            (files, dirrs) = misc.get_file_list_and_dirr_list(path, root=root)
+            if not self.racy(st.st_mtime_ns):
+                self.put(key, stamp + [[os.path.basename(x) for x in files],
+                                       [os.path.basename(x) for x in dirrs]])
+            return (files, dirrs)
+
+        if path == '.':
+            return (list(entry[3]), list(entry[4]))
+        return ([os.path.join(path, x) for x in entry[3]],
+                [os.path.join(path, x) for x in entry[4]])
+
+    def invalidate(self, path):
+        """ (self, str) -> None
+
+        Forgets the listings of all directories containing path.
+        """
+        d = os.path.dirname(os.path.abspath(path))
+        while True:
+            self.remove(d)
+            parent = os.path.dirname(d)
+            if parent == d:
+                break
+            d = parent
@@ -5,29 +5,60 @@
 BaseFileList
 FileList
 ZipFileList
+TarFileList
 
 Usage:
     file_list = FileList/ZipFileList(...)
     print file_list.files
     file_list.files = ...
     success = file_list.move_files_indirectly(src, dst, real=..., quiet=...)
+    success = file_list.move_files_planned(src, dst, real=..., quiet=...)
+    file_list.copy_files(src, dst, 'apple-copy/', link='auto')
+    dirty = file_list.find_unnormalized(names)
 """
 
 import os
 import sys
-import zipfile
-import datetime
+import copy
+import zlib
+import array
+import errno
+import struct
+import contextlib
 
-import misc
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
-from zipfile import ZipFile
+from testfmt import misc
+from testfmt import normalize
+from testfmt import instrument
+from testfmt.nametable import NameTable, view_of, has_duplicates
+
+bz2 = misc.lazy_import('bz2')
+gzip = misc.lazy_import('gzip')
+json = misc.lazy_import('json')
+lzma = misc.lazy_import('lzma')
+shutil = misc.lazy_import('shutil')
+tarfile = misc.lazy_import('tarfile')
+zipfile = misc.lazy_import('zipfile')
+datetime = misc.lazy_import('datetime')
+tempfile = misc.lazy_import('tempfile')
+zstandard = misc.lazy_import('zstandard', optional=True)
 
 class BaseFileList(object):
     """
     Moves files.
     
     Properties:
-        files (list)
+        files (NameTable): assigning a list or a NameTable copies it,
+            cheaply for a NameTable
+        pending_journals (list): directories, relative to the root of
+            a FileList, holding the journal of an interrupted
+            conversion that was left as is (see api.open_file_list)
+        display_prefix (str): put before the names in the output, the
+            directory of a shard (see FileList.shards)
     
     Methods:
         __init__(self, files)
@@ -37,14 +68,36 @@ class BaseFileList(object):
         move_files_best_effort(self, src, dst, **kwargs)
         move_files_directly(self, src, dst, **kwargs)
         move_files_indirectly(self, src, dst, **kwargs)
+        plan_moves(self, src, dst)
+        move_files_planned(self, src, dst, **kwargs)
+        copy_files(self, src, dst, dest_path, link='auto', quiet=False, dirty=())
+        find_unnormalized(self, names, workers=None)
+        normalize_files(self, names, workers=None, quiet=False)
+        shards(self, depth=1)
     """
     
+    pending_journals = ()
+    display_prefix = ''
+    
     #TODO: Handle natural sorting order
     def __init__(self, files):
-        self.files = list(files)
+        self.files = files
     
     def __repr__(self):
-        return 'filelist.BaseFileList({})'.format(self.files)
+        return 'filelist.BaseFileList({})'.format(list(self.files))
+    
+    @property
+    def files(self):
+        """ NameTable
+        
+        The table keeps its own name index, so it may be changed in
+        place, e.g. sorted.
+        """
+        return self._files
+    
+    @files.setter
+    def files(self, files):
+        self._files = files.copy() if isinstance(files, NameTable) else NameTable(files)
     
     def really_renames(self, src, dst):
         """ (self, str, str) -> bool """
@@ -63,18 +116,20 @@ class BaseFileList(object):
             False otherwise.
         """
         if src == dst:
-            return src in self.files
-        if (src not in self.files) or (dst in self.files):
+            return src in self._files
+        i = self._files.find(src)
+        if i < 0 or dst in self._files:
             return False
         if not quiet:
-            print("Moving '{}' -> '{}'".format(src, dst))
-        self.files[self.files.index(src)] = dst
+            print("Moving '{0}{1}' -> '{0}{2}'".format(self.display_prefix, src, dst))
+        self._files[i] = dst
         return self.really_renames(src, dst) if real else True
         
-    def move_files_best_effort(self, src, dst, **kwargs):
-        """ (list, list) -> int
+    def move_files_best_effort(self, src, dst, stop=None, **kwargs):
+        """ (list, list, ...) -> int
         
-        Moves files, stop at the first failure.
+        Moves files, stop at the first failure, or as soon as the
+        threading.Event stop is set.
         
         Returns:
             Number of successful moves
@@ -83,16 +138,19 @@ class BaseFileList(object):
         n = len(src)
         
         for i in range(n):
+            if stop is not None and stop.is_set():
+                return i
             if not self.move_file(src[i], dst[i], **kwargs):
                 return i
         return n
     
-    def move_files_directly(self, src, dst, **kwargs):
-        """ (self, list, list) -> bool
+    def move_files_directly(self, src, dst, stop=None, **kwargs):
+        """ (self, list, list, ...) -> bool
         
         Moves files. If success, returns True.
         Otherwise, recovers the original state and return False.
         Exceptions will be raised if recovering is failed.
+        Setting the threading.Event stop counts as a failure.
         
         Returns:
             True if success,
@@ -101,7 +159,7 @@ class BaseFileList(object):
         assert len(src) == len(dst)
         n = len(src)
         
-        success = self.move_files_best_effort(src, dst, **kwargs)
+        success = self.move_files_best_effort(src, dst, stop=stop, **kwargs)
         if success == n:
             return True
         else:
@@ -126,34 +184,615 @@ class BaseFileList(object):
         
         n = misc.ensure_equal_len(src, dst)
         pre = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-        sep = '--------'
-        mid = list(range(n))
+        mid = [intermediate_name(pre, src[i], dst[i], i) for i in range(n)]
+        return self.move_files_directly(list(src) + mid, mid + list(dst), **kwargs)
+    
+    def plan_moves(self, src, dst):
+        """ (self, list, list) -> (list, list) or None
+        
+        Orders the moves src[i] -> dst[i] so that they can be done one
+        after another without overwriting anything. Chains are moved
+        from their tail, and only cycles go through an intermediate
+        name, so the plan has about len(src) + number of cycles moves.
+        
+        Files are followed by their handles in self.files, so besides
+        the plan only arrays of len(self.files) are kept.
+        
+        Returns:
+            (src, dst) of the planned moves, as NameViews of copies of
+            the tables of src and dst,
+            None if the moves can not be done all together.
+        """
+        
+        n = misc.ensure_equal_len(src, dst)
+        files = self._files
+        src, dst = view_of(src), view_of(dst)
+        # Handles of the sources and of the existing destinations.
+        if files.shares_storage(src.table) and not files.has_duplicates():
+            sh = array.array('q', src.handles)
+        else:
+            sh = array.array('q', map(files.find, src))
+        if -1 in sh or has_duplicates(dst):
+            return None
+        th = array.array('q', map(files.find, dst))
+        # Move moving each file away, -1 for the files staying.
+        move_of = array.array('q', [-1]) * len(files)
+        seen = bytearray(len(files))
+        for i in range(n):
+            if seen[sh[i]]:
+                return None
+            seen[sh[i]] = 1
+            if sh[i] != th[i]:
+                move_of[sh[i]] = i
+        targeted = bytearray(len(files))
+        for i in range(n):
+            if sh[i] != th[i] and th[i] >= 0:
+                if move_of[th[i]] < 0:
+                    return None
+                targeted[th[i]] = 1
+        
+        pre = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+        # Intermediate names are appended to copies of the tables.
+        src_table, dst_table = src.table.copy(), dst.table.copy()
+        src2, dst2 = array.array('I'), array.array('I')
+        done = bytearray(n)
+        
+        for i in range(n):
+            if sh[i] == th[i] or targeted[sh[i]]:
+                continue
+            chain = [i]
+            while th[chain[-1]] >= 0:
+                chain.append(move_of[th[chain[-1]]])
+            for j in reversed(chain):
+                src2.append(src.handles[j])
+                dst2.append(dst.handles[j])
+                done[j] = 1
         
         for i in range(n):
-            t0 = src[i].replace('/', '----').replace('\\', '------')
-            t1 = dst[i].replace('/', '----').replace('\\', '------')
-            mid[i] = pre+sep+t0+sep+t1+sep+str(i).zfill(8)+'.testdata'
+            if sh[i] == th[i] or done[i]:
+                continue
+            cycle = [i]
+            j = move_of[th[i]]
+            while j != i:
+                cycle.append(j)
+                j = move_of[th[j]]
+            src_table.append(intermediate_name(pre, src[i], dst[i], len(src2)))
+            dst_table.append(src_table[-1])
+            src2.append(src.handles[i])
+            dst2.append(len(dst_table) - 1)
+            for j in reversed(cycle[1:]):
+                src2.append(src.handles[j])
+                dst2.append(dst.handles[j])
+            src2.append(len(src_table) - 1)
+            dst2.append(dst.handles[i])
+            for j in cycle:
+                done[j] = 1
+        
+        return (src_table.view(src2), dst_table.view(dst2))
+    
+    def move_files_planned(self, src, dst, **kwargs):
+        """ (self, list, list, ...) -> bool
+        
+        Same as move_files_indirectly, except that the moves follow
+        plan_moves, so intermediate names are only used for cycles.
+        
+        Returns:
+            True if success,
+            False otherwise.
+        """
+        
+        plan = self.plan_moves(src, dst)
+        if plan is None:
+            return False
+        return self.move_files_directly(plan[0], plan[1], **kwargs)
+    
+    def copy_files(self, src, dst, dest_path, link='auto', quiet=False, dirty=()):
+        """ (self, list, list, str, ...) -> None
+        
+        Writes the files src under the names dst to a new directory,
+        or to a new ZIP file if dest_path ends with '.zip'. Nothing is
+        changed in this list. The copy is built under a temporary name
+        and renamed to dest_path once complete. link is one of
+        LINK_MODES, for files copied from a directory to a directory.
+        The files dirty, named as in dst, are normalized in the copy.
+        """
+        n = misc.ensure_equal_len(src, dst)
+        assert len(set(dst)) == n
+        if os.path.lexists(dest_path):
+            raise FileExistsError(errno.EEXIST, "Destination exists", dest_path)
+        tmp_path = '{}.{}.tmp'.format(dest_path.rstrip('/' + os.sep), os.getpid())
+        try:
+            if dest_path.lower().endswith('.zip'):
+                self.write_zip_copy(src, dst, tmp_path, quiet=quiet)
+                copied = ZipFileList(tmp_path) if dirty else None
+            else:
+                os.makedirs(tmp_path)
+                self.write_dirr_copy(src, dst, tmp_path, link=link, quiet=quiet)
+                copied = FileList(list(dst), root=tmp_path) if dirty else None
+            if copied is not None:
+                copied.normalize_files(list(dirty), quiet=quiet)
+            os.rename(tmp_path, dest_path)
+            instrument.count('rename')
+        finally:
+            if os.path.isdir(tmp_path):
+                shutil.rmtree(tmp_path)
+            elif os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+    
+    def write_dirr_copy(self, src, dst, dirr, link='auto', quiet=False):
+        """ (self, list, list, str, ...) -> None """
+        raise NotImplementedError
+    
+    def write_zip_copy(self, src, dst, zip_path, quiet=False):
+        """ (self, list, list, str, ...) -> None """
+        raise NotImplementedError
+    
+    def find_unnormalized(self, names, workers=None):
+        """ (self, list, ...) -> list
+        
+        Returns the files of names whose content needs normalizing
+        (see normalize.py), in the order of names. Files are read in
+        parallel by workers processes where possible.
+        """
+        raise NotImplementedError
+    
+    def normalize_files(self, names, workers=None, quiet=False):
+        """ (self, list, ...) -> None
+        
+        Normalizes the content of the files names.
+        """
+        self.move_files_directly([], [], real=True, quiet=quiet, dirty=names)
+    
+    def shards(self, depth=1):
+        """ (self, int) -> list
+        
+        Splits the list by directory, as misc.group_by_directory does,
+        into (directory, file list) pairs in the order of the files.
+        """
+        groups = misc.group_by_directory(self._files, depth)
+        return [(x, BaseFileList(groups[x])) for x in groups]
+
+def intermediate_name(pre, src, dst, i):
+    """ (str, str, str, int) -> str
+    
+    Returns a temporary name for moving src to dst.
+    """
+    sep = '--------'
+    t0 = src.replace('/', '----').replace('\\', '------')
+    t1 = dst.replace('/', '----').replace('\\', '------')
+    return pre+sep+t0+sep+t1+sep+str(i).zfill(8)+'.testdata'
+
+def copy_destination(dirr, name):
+    """ (str, str) -> str
+    
+    Returns the path of the archive member name copied into dirr,
+    raising OSError if name is absolute, has a '..' part or resolves
+    outside dirr, so that a hostile archive cannot write elsewhere.
+    """
+    parts = name.replace('\\', '/').split('/')
+    path = os.path.join(dirr, name)
+    root = os.path.realpath(dirr)
+    if (os.path.isabs(name) or name.startswith(('/', '\\')) or '..' in parts
+            or os.path.commonpath([root, os.path.realpath(path)]) != root):
+        raise OSError(errno.EINVAL, "Archive member escapes the destination", name)
+    return path
+
+def check_link_target(dirr, path, target):
+    """ (str, str, str) -> None
+    
+    Raises OSError unless a symbolic link at path, inside dirr,
+    pointing to target would stay inside dirr.
+    """
+    root = os.path.realpath(dirr)
+    resolved = os.path.realpath(os.path.join(os.path.dirname(path), target))
+    if (os.path.isabs(target) or target.startswith('\\')
+            or os.path.commonpath([root, resolved]) != root):
+        raise OSError(errno.EINVAL, "Archive link escapes the destination", target)
 
-        return self.move_files_directly(src+mid, mid+dst, **kwargs)
+LINK_MODES = ('auto', 'reflink', 'hardlink', 'copy')
+FICLONE = 0x40049409
+
+def reflink_file(src, dst):
+    """ (str, str) -> None
+    
+    Creates dst sharing the data blocks of src (copy on write), on
+    file systems supporting it. Raises OSError otherwise.
+    """
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported", src)
+    with open(src, 'rb') as fp_src, open(dst, 'xb') as fp_dst:
+        try:
+            fcntl.ioctl(fp_dst.fileno(), FICLONE, fp_src.fileno())
+        except OSError:
+            os.remove(dst)
+            raise
+
+def copy_file_data(src, dst):
+    """ (str, str) -> None
+    
+    Copies src to a new file dst, inside the kernel with
+    os.copy_file_range where available.
+    """
+    with open(src, 'rb') as fp_src, open(dst, 'xb') as fp_dst:
+        size = os.fstat(fp_src.fileno()).st_size
+        done = 0
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while done < size:
+                    n = os.copy_file_range(fp_src.fileno(), fp_dst.fileno(), size - done,
+                                           offset_src=done, offset_dst=done)
+                    if n == 0:
+                        break
+                    done += n
+            except OSError:
+                pass
+        fp_src.seek(done)
+        fp_dst.seek(done)
+        shutil.copyfileobj(fp_src, fp_dst)
+        instrument.count('bytes_read', fp_src.tell())
+        instrument.count('bytes_written', fp_dst.tell())
+    shutil.copymode(src, dst)
+
+class FileLinker(object):
+    """
+    Links or copies files, falling back from reflinks to hardlinks to
+    copies in 'auto' mode. A method that failed once is not tried
+    again, so a file system without reflinks costs a single failure.
+    
+    Hardlinked files share their inode with the original: writing to
+    one in place changes the other.
+    
+    Methods:
+        __init__(self, link='auto')
+        link(self, src, dst)
+    """
+    
+    def __init__(self, link='auto'):
+        assert link in LINK_MODES
+        self.modes = ['reflink', 'hardlink', 'copy'] if link == 'auto' else [link]
+    
+    def link(self, src, dst):
+        """ (self, str, str) -> str
+        
+        Returns the method used.
+        """
+        while True:
+            mode = self.modes[0]
+            try:
+                if mode == 'reflink':
+                    reflink_file(src, dst)
+                elif mode == 'hardlink':
+                    os.link(src, dst)
+                else:
+                    copy_file_data(src, dst)
+                return mode
+            except OSError as e:
+                if len(self.modes) == 1 or e.errno in (errno.ENOENT, errno.EEXIST):
+                    raise
+                self.modes.pop(0)
 
 class FileList(BaseFileList):
     """
-    Moves files in the working directory.
+    Moves files in a directory, the working directory by default.
+    Names in files are relative to root.
+    
+    Real moves are recorded in a RenameJournal inside root, so that
+    an interrupted conversion can be resumed or rolled back later by
+    FileList.recover_journal.
+    
+    If the list comes from a dircache.DirCache, the cached listings
+    of the directories touched by renames are invalidated.
     """
     
+    cache = None
+    journal = None
+    
+    def __init__(self, files, root='.'):
+        self.root = root
+        super(FileList, self).__init__(files)
+    
+    def __repr__(self):
+        return 'filelist.FileList({}, root={!r})'.format(list(self.files), self.root)
+    
+    @classmethod
+    def from_directory(cls, root, cache=None, **kwargs):
+        files = misc.get_file_list_recursively(cache=cache, root=root, **kwargs)
+        file_list = cls((x for x in files if x != RenameJournal.NAME), root=root)
+        file_list.cache = cache
+        return file_list
+    
     @classmethod
     def from_working_directory(cls, **kwargs):
-        return cls(misc.get_file_list_recursively(**kwargs))
+        return cls.from_directory('.', **kwargs)
+    
+    @classmethod
+    def find_journals(cls, root, files=()):
+        """ (str, iterable) -> list
+        
+        Returns the directories holding the journal of an interrupted
+        conversion: '' for root itself, and the directories of the
+        names of files, relative to root, that are journals (those of
+        api.convert_shards).
+        """
+        journals = [''] if os.path.isfile(os.path.join(root, RenameJournal.NAME)) else []
+        suffix = '/' + RenameJournal.NAME
+        journals.extend(x[:-len(suffix)] for x in files if x.endswith(suffix))
+        return journals
+    
+    @classmethod
+    def recover_journal(cls, root, rollback=False):
+        """ (str, ...) -> bool
+        
+        Finishes the moves of an interrupted conversion in root, or
+        undoes them if rollback is True.
+        
+        Returns:
+            True if there was a journal to recover,
+            False otherwise.
+        """
+        journal = RenameJournal.load(root)
+        if journal is None:
+            return False
+        if journal.moves is not None:
+            done = journal.find_progress()
+            if rollback:
+                moves = [(y, x) for x, y, ino in reversed(journal.moves[:done])]
+            else:
+                moves = [(x, y) for x, y, ino in journal.moves[done:]]
+            for x, y in moves:
+                os.renames(os.path.join(root, x), os.path.join(root, y))
+                instrument.count('rename')
+                journal.record(x, y)
+        journal.remove()
+        return True
+    
+    def move_files_directly(self, src, dst, real=False, dirty=(), **kwargs):
+        """ (self, list, list, ...) -> bool
+        
+        Same as BaseFileList.move_files_directly. Real moves are
+        journaled; the journal is removed once the files are either
+        all moved or all back in place. The files dirty, named as after
+        the moves, are then normalized.
+        """
+        if not real:
+            return super(FileList, self).move_files_directly(src, dst, **kwargs)
+        self.journal = RenameJournal.create(self.root, src, dst)
+        try:
+            success = super(FileList, self).move_files_directly(src, dst, real=True, **kwargs)
+        finally:
+            self.journal.close()
+            journal, self.journal = self.journal, None
+        journal.remove()
+        if success and dirty:
+            self.normalize_files(list(dirty), quiet=kwargs.get('quiet', False))
+        return success
+    
+    def shards(self, depth=1):
+        """ (self, int) -> list
+        
+        Same as BaseFileList.shards, every file list being rooted at
+        its directory, with its own journal, and sharing this cache.
+        """
+        groups = misc.group_by_directory(self._files, depth)
+        shards = []
+        for x in groups:
+            shard = FileList(groups[x], root=os.path.join(self.root, x) if x else self.root)
+            shard.cache = self.cache
+            shard.display_prefix = self.display_prefix + x + '/' if x else self.display_prefix
+            shards.append((x, shard))
+        return shards
+    
+    def find_unnormalized(self, names, workers=None):
+        dirty, read = normalize.scan_files(self.root, names, workers)
+        instrument.count('bytes_read', read)
+        return dirty
+    
+    def normalize_files(self, names, workers=None, quiet=False):
+        with instrument.stage('normalize'):
+            if not quiet:
+                for name in names:
+                    print("Normalizing '{}{}'".format(self.display_prefix, name))
+            try:
+                read, written = normalize.normalize_files(self.root, names, workers)
+            finally:
+                if self.cache is not None:
+                    for name in names:
+                        self.cache.invalidate(os.path.join(self.root, name))
+            instrument.count('bytes_read', read)
+            instrument.count('bytes_written', written)
+            instrument.count('rename', len(names))
         
     def really_renames(self, src, dst):
         """ (self, str, str) -> bool """
+        path_src = os.path.join(self.root, src)
+        path_dst = os.path.join(self.root, dst)
         try:
-            os.renames(src, dst)
+            instrument.count('rename')
+            os.renames(path_src, path_dst)
         except OSError as e:
             print(e.errno, file=sys.stderr)
             print(e, file=sys.stderr)
             return False
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(path_src)
+                self.cache.invalidate(path_dst)
+        if self.journal is not None:
+            self.journal.record(src, dst)
         return True
+    
+    def write_dirr_copy(self, src, dst, dirr, link='auto', quiet=False):
+        linker = FileLinker(link)
+        for x, y in zip(src, dst):
+            path = os.path.join(dirr, y)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            mode = linker.link(os.path.join(self.root, x), path)
+            if not quiet:
+                print("Copying '{}' -> '{}' ({})".format(x, y, mode))
+    
+    def write_zip_copy(self, src, dst, zip_path, quiet=False):
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as z:
+            for x, y in zip(src, dst):
+                if not quiet:
+                    print("Writing data of '{}'".format(y))
+                path = os.path.join(self.root, x)
+                z.write(path, arcname=y)
+                instrument.count('bytes_read', os.path.getsize(path))
+
+class RenameJournal(object):
+    """
+    Append-only journal of a sequence of moves inside a directory.
+    
+    The journal starts with the planned moves, each with the inode of
+    the file being moved, then 'begin', then the number of moves done
+    after each move. It is fsync'd before the first move and then
+    every BATCH moves, so the recorded progress may lag behind (or,
+    after a system crash, run ahead of) the real one; find_progress
+    settles it by checking where the moved inodes actually are.
+    
+    Methods:
+        create(cls, root, src, dst)
+        load(cls, root)
+        record(self, src, dst)
+        find_progress(self)
+        close(self)
+        remove(self)
+    """
+    
+    NAME = '.testfmt-journal'
+    BATCH = 256
+    
+    def __init__(self, root, moves, done=0):
+        self.root = root
+        self.moves = moves
+        self.done = done
+        self.pending = 0
+        self.by_ino = None
+        self.fp = None
+    
+    def __repr__(self):
+        return 'filelist.RenameJournal({!r}, {} move(s), done={})'.format(
+            self.root, len(self.moves or []), self.done)
+    
+    @classmethod
+    def create(cls, root, src, dst):
+        """ (str, list, list) -> RenameJournal
+        Writes the planned moves and fsyncs them. """
+        n = misc.ensure_equal_len(src, dst)
+        where = {}
+        moves = []
+        for i in range(n):
+            if src[i] in where:
+                ino = where.pop(src[i])
+            else:
+                try:
+                    instrument.count('stat')
+                    ino = os.stat(os.path.join(root, src[i])).st_ino
+                except OSError:
+                    ino = None
+            where[dst[i]] = ino
+            moves.append((src[i], dst[i], ino))
+        
+        journal = cls(root, moves)
+        journal.fp = open(os.path.join(root, cls.NAME), 'w')
+        journal.fp.write(json.dumps({'version': 1, 'moves': n}) + '\n')
+        for move in moves:
+            journal.fp.write(json.dumps(move) + '\n')
+        journal.fp.write('begin\n')
+        journal.sync()
+        return journal
+    
+    @classmethod
+    def load(cls, root):
+        """ (str) -> RenameJournal or None
+        Reads the journal in root. Its moves are None if the plan was
+        not completely written, since nothing has been moved then. """
+        path = os.path.join(root, cls.NAME)
+        try:
+            with open(path) as fp:
+                lines = fp.read().split('\n')
+        except OSError:
+            return None
+        journal = cls(root, None)
+        try:
+            n = json.loads(lines[0])['moves']
+            if lines[n+1] != 'begin':
+                return journal
+            moves = [tuple(json.loads(x)) for x in lines[1:n+1]]
+        except (ValueError, KeyError, IndexError, TypeError):
+            return journal
+        done = 0
+        for x in lines[n+2:]:
+            if x.startswith('done '):
+                done = int(x[5:])
+        journal = cls(root, moves, done)
+        journal.fp = open(path, 'a')
+        return journal
+    
+    def sync(self):
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+        self.pending = 0
+    
+    def record(self, src, dst):
+        """ (self, str, str) -> None
+        Records a move, either the next planned one or the undoing of
+        the last one. """
+        if self.done < len(self.moves) and self.moves[self.done][:2] == (src, dst):
+            self.done += 1
+        elif self.done > 0 and self.moves[self.done-1][:2] == (dst, src):
+            self.done -= 1
+        else:
+            return
+        self.fp.write('done {}\n'.format(self.done))
+        self.pending += 1
+        if self.pending >= self.BATCH:
+            self.sync()
+    
+    def is_done(self, i):
+        """ (self, int) -> bool
+        Checks if the file moved by move i is at its destination, or
+        at the destination of a later move of the same file. """
+        ino = self.moves[i][2]
+        if ino is None:
+            return False
+        if self.by_ino is None:
+            self.by_ino = {}
+            for j, move in enumerate(self.moves):
+                self.by_ino.setdefault(move[2], []).append(j)
+        for j in self.by_ino[ino]:
+            if j < i:
+                continue
+            try:
+                instrument.count('stat')
+                if os.stat(os.path.join(self.root, self.moves[j][1])).st_ino == ino:
+                    return True
+            except OSError:
+                pass
+        return False
+    
+    def find_progress(self):
+        """ (self) -> int
+        Returns the number of moves actually done. """
+        i = self.done
+        if i < len(self.moves) and self.is_done(i):
+            while i < len(self.moves) and self.is_done(i):
+                i += 1
+        else:
+            while i > 0 and not self.is_done(i-1):
+                i -= 1
+        self.done = i
+        return i
+    
+    def close(self):
+        if self.fp is not None:
+            self.sync()
+            self.fp.close()
+            self.fp = None
+    
+    def remove(self):
+        self.close()
+        os.remove(os.path.join(self.root, self.NAME))
 
 class ZipFileList(BaseFileList):
     
@@ -161,9 +800,11 @@ class ZipFileList(BaseFileList):
     Moves files in a ZIP file.
     """
     
-    def __init__(self, zip_path):
+    def __init__(self, zip_path, in_place=False):
         self.src_path = zip_path
-        files = ZipFile(self.src_path, 'r').namelist()
+        self.in_place = in_place
+        recover_zip_journal(self.src_path)
+        files = zipfile.ZipFile(self.src_path, 'r').namelist()
         super(ZipFileList, self).__init__(files)
   
     def really_renames(self, src, dst):
@@ -174,39 +815,671 @@ class ZipFileList(BaseFileList):
         self.old_name[dst] = self.old_name.pop(src)
         return True
     
-    def apply_changes(self, quiet=False):
-        src_path = self.src_path
-        dst_path = src_path + datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    def apply_changes(self, quiet=False, recompress=False, in_place=False, dirty=()):
+        """ (self, ...) -> None
+        
+        Rewrites the ZIP file with the new names and swaps it in.
+        By default the compressed data of each member is copied as is;
+        with recompress=True every member is inflated and deflated again.
+        With in_place=True the ZIP file is renamed in place instead,
+        unless there are dirty members (named as after the moves) to
+        normalize during the rewrite.
+        """
+        with instrument.stage('zip_rewrite'):
+            if in_place and not dirty and self.rename_in_place(quiet=quiet):
+                return
+            
+            src_path = self.src_path
+            dst_path = src_path + datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+            
+            try:
+                if recompress:
+                    self.write_recompressed(dst_path, quiet=quiet, dirty=dirty)
+                else:
+                    self.write_raw(dst_path, quiet=quiet, dirty=dirty)
+                os.rename(src_path, dst_path + '.backup')
+                os.rename(dst_path, src_path)
+                os.remove(dst_path + '.backup')
+                instrument.count('rename', 2)
+            finally:
+                if os.path.isfile(dst_path):
+                    os.remove(dst_path)
+                if not os.path.isfile(src_path) and os.path.isfile(dst_path + '.backup'):
+                    os.rename(dst_path + '.backup', src_path)
+    
+    def write_recompressed(self, dst_path, quiet=False, dirty=()):
+        """ (self, str, ...) -> None
+        
+        Writes the renamed members to dst_path, decompressing and
+        compressing every member, and normalizing the dirty ones.
+        Both archives are fully tested.
+        """
+        with zipfile.ZipFile(self.src_path, 'r') as src, zipfile.ZipFile(dst_path, 'w', zipfile.ZIP_DEFLATED) as dst:
+            assert src.testzip() == None
+            for name in self.old_name:
+                if not quiet:
+                    print("Writing data of '{}'".format(name))
+                data = src.read(self.old_name[name])
+                if name in dirty:
+                    data = normalize.normalize_bytes(data)
+                info = src.getinfo(self.old_name[name])
+                instrument.count('bytes_read', info.compress_size)
+                info.filename = name
+                dst.writestr(info, data)
+                instrument.count('bytes_written', dst.getinfo(name).compress_size)
+        
+        with zipfile.ZipFile(dst_path, 'r') as z:
+            assert z.testzip() == None
+    
+    def write_raw(self, dst_path, quiet=False, dirty=()):
+        """ (self, str, ...) -> None
+        
+        Writes the renamed members to dst_path by copying their
+        compressed bytes in chunks, so memory use does not depend on
+        member sizes. CRCs and sizes are checked against the local
+        headers and the new central directory, without inflating data.
+        The dirty members are streamed through normalize.Normalizer
+        and compressed again instead. Falls back to write_recompressed
+        if this zipfile module can not append raw members.
+        """
+        expected = {}
+        with open(self.src_path, 'rb') as fp, zipfile.ZipFile(self.src_path, 'r') as src, zipfile.ZipFile(dst_path, 'w') as dst:
+            raw = ZipRawWriter(dst) if ZipRawWriter.supported(dst) else None
+            for name in self.old_name:
+                if raw is None:
+                    break
+                if not quiet:
+                    print("Writing data of '{}'".format(name))
+                info = src.getinfo(self.old_name[name])
+                if name in dirty:
+                    new_info = zipfile.ZipInfo(name, info.date_time)
+                    new_info.compress_type = info.compress_type
+                    new_info.external_attr = info.external_attr
+                    new_info.comment = info.comment
+                    new_info.file_size = info.file_size
+                    with src.open(info) as fp_src, dst.open(new_info, 'w') as fp_dst:
+                        read, written = normalize.normalize_stream(fp_src, fp_dst)
+                    instrument.count('bytes_read', info.compress_size)
+                    instrument.count('bytes_written', new_info.compress_size)
+                    expected[name] = (new_info.CRC, new_info.compress_size, new_info.file_size)
+                    continue
+                new_info = copy.copy(info)
+                new_info.filename = name
+                raw.write(new_info, fp, zip_data_offset(fp, info))
+                dst.filelist.append(new_info)
+                expected[name] = (info.CRC, info.compress_size, info.file_size)
+            if raw is not None:
+                raw.finish()
+        
+        if raw is None:
+            return self.write_recompressed(dst_path, quiet=quiet, dirty=dirty)
+        with open(dst_path, 'rb') as fp, zipfile.ZipFile(dst_path, 'r') as dst:
+            for info in dst.infolist():
+                if expected.get(info.filename) != (info.CRC, info.compress_size, info.file_size):
+                    raise zipfile.BadZipFile("Bad metadata of '{}'".format(info.filename))
+                zip_data_offset(fp, info)
+    
+    def rename_in_place(self, quiet=False):
+        """ (self, ...) -> bool
+        
+        Renames members without rewriting the ZIP file. Local headers
+        are patched where the new name fits, the other members are
+        copied after the last one, and a new central directory is
+        written. Overwritten bytes are saved to a journal first, so an
+        interrupted rename is rolled back by recover_zip_journal.
         
+        Returns False, without changing anything, if this zipfile
+        module can not append raw members (see ZipRawWriter).
+        """
+        path = self.src_path
+        rename = {old: new for new, old in self.old_name.items() if new != old}
+        if not rename:
+            return True
+        
+        patches, moved = [], set()
+        with open(path, 'rb') as fp, zipfile.ZipFile(path, 'r') as z:
+            if not ZipRawWriter.supported(z):
+                return False
+            for info in z.infolist():
+                if info.filename not in rename:
+                    continue
+                patch = zip_local_header_patch(fp, info, rename[info.filename])
+                if patch is None:
+                    moved.add(info.filename)
+                else:
+                    patches.append(patch)
+            fp.seek(z.start_dir)
+            tail = fp.read()
+            size = fp.tell()
+            instrument.count('bytes_read', len(tail))
+        
+        write_zip_journal(path, size, [(offset, old) for offset, old, new in patches] + [(size - len(tail), tail)])
         try:
-            with ZipFile(src_path, 'r') as src, ZipFile(dst_path, 'w', zipfile.ZIP_DEFLATED) as dst:
-                assert src.testzip() == None
-                for name in self.old_name:
+            with open(path, 'r+b') as fp:
+                for offset, old, new in patches:
+                    fp.seek(offset)
+                    fp.write(new)
+                    instrument.count('bytes_written', len(new))
+            
+            with open(path, 'rb') as src, zipfile.ZipFile(path, 'a') as z:
+                raw = ZipRawWriter(z)
+                for info in z.filelist:
+                    if info.filename not in rename:
+                        continue
+                    name = rename[info.filename]
                     if not quiet:
-                        print("Writing data of '{}'".format(name))
-                    data = src.read(self.old_name[name])
-                    info = src.getinfo(self.old_name[name])
-                    info.filename = name
-                    dst.writestr(info, data)
+                        print("Renaming '{}' -> '{}'".format(info.filename, name))
+                    if info.filename in moved:
+                        offset = zip_data_offset(src, info)
+                        info.filename = name
+                        raw.write(info, src, offset)
+                    else:
+                        info.filename = name
+                raw.finish()
             
-            assert ZipFile(dst_path, 'r').testzip() == None
-            os.rename(src_path, dst_path + '.backup')
-            os.rename(dst_path, src_path)
-            os.remove(dst_path + '.backup')
+            with open(path, 'r+b') as fp:
+                os.fsync(fp.fileno())
+            with open(path, 'rb') as fp, zipfile.ZipFile(path, 'r') as z:
+                if set(z.namelist()) != set(self.old_name):
+                    raise zipfile.BadZipFile("Unexpected names in '{}'".format(path))
+                for info in z.infolist():
+                    zip_data_offset(fp, info)
+        except BaseException:
+            recover_zip_journal(path)
+            raise
+        os.remove(path + '.journal')
+        return True
+    
+    def write_dirr_copy(self, src, dst, dirr, link='auto', quiet=False):
+        with zipfile.ZipFile(self.src_path, 'r') as z:
+            for x, y in zip(src, dst):
+                path = copy_destination(dirr, y)
+                if y.endswith('/'):
+                    os.makedirs(path, exist_ok=True)
+                    continue
+                if not quiet:
+                    print("Extracting '{}' -> '{}'".format(x, y))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with z.open(x) as fp_src, open(path, 'xb') as fp_dst:
+                    shutil.copyfileobj(fp_src, fp_dst)
+                    instrument.count('bytes_written', fp_dst.tell())
+    
+    def write_zip_copy(self, src, dst, zip_path, quiet=False):
+        self.old_name = dict(zip(dst, src))
+        try:
+            self.write_raw(zip_path, quiet=quiet)
         finally:
-            if os.path.isfile(dst_path):
-                os.remove(dst_path)
-            if not os.path.isfile(src_path) and os.path.isfile(dst_path + '.backup'):
-                os.rename(dst_path + '.backup', src_path)
+            del self.old_name
     
-    def move_files_directly(self, src, dst, **kwargs):
+    def find_unnormalized(self, names, workers=None):
+        dirty, read = normalize.scan_zip_members(self.src_path, names, workers)
+        instrument.count('bytes_read', read)
+        return dirty
+    
+    def move_files_directly(self, src, dst, dirty=(), **kwargs):
         self.old_name = {x: x for x in self.files}
-        super(ZipFileList, self).move_files_directly(src, dst, **kwargs)
-        if kwargs.get('real', False):
-            self.apply_changes()
-        del self.old_name
+        try:
+            success = super(ZipFileList, self).move_files_directly(src, dst, **kwargs)
+            if success and kwargs.get('real', False):
+                self.apply_changes(quiet=kwargs.get('quiet', False), in_place=self.in_place,
+                                   dirty=set(dirty))
+        finally:
+            del self.old_name
+        return success
+    
+ZIP_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+ZIP_LOCAL_SIGNATURE = b'PK\x03\x04'
+ZIP_DATA_DESCRIPTOR = 0x08
+ZIP_UTF8_FILENAME = 0x800
+ZIP64_EXTRA = 0x0001
+ZIP_PADDING_EXTRA = 0xD935
+ZIP_DROPPABLE_EXTRA = (0x5455, 0x7875, ZIP_PADDING_EXTRA)
+
+class ZipRawWriter(object):
+    """
+    Appends members to a ZipFile opened for writing or appending by
+    copying their compressed bytes, which zipfile has no public API
+    for. This is the only code relying on private attributes of
+    ZipFile, those in ATTRIBUTES: callers check supported() first and
+    fall back to ZipFileList.write_recompressed without them.
+    
+    Methods:
+        supported(cls, z)
+        __init__(self, z)
+        write(self, info, src, offset)
+        finish(self)
+    """
+    
+    ATTRIBUTES = ('fp', 'filelist', 'NameToInfo', 'start_dir', '_didModify')
+    
+    @classmethod
+    def supported(cls, z):
+        """ (cls, ZipFile) -> bool """
+        return all(hasattr(z, x) for x in cls.ATTRIBUTES)
+    
+    def __init__(self, z):
+        assert self.supported(z)
+        self.z = z
+    
+    def write(self, info, src, offset):
+        """ (self, ZipInfo, file, int) -> None
+        
+        Writes the local header of info at the end of the ZIP file,
+        without data descriptor or ZIP64 extra field, followed by the
+        compressed data of info at offset in src. The caller adds info
+        to z.filelist unless it is there already.
+        """
+        z = self.z
+        info.flag_bits &= ~ZIP_DATA_DESCRIPTOR
+        info.extra = strip_zip_extra(info.extra, (ZIP64_EXTRA,))
+        info.header_offset = z.fp.tell()
+        header = info.FileHeader()
+        z.fp.write(header)
+        instrument.count('bytes_written', len(header))
+        src.seek(offset)
+        misc.copy_bytes(src, z.fp, info.compress_size)
+    
+    def finish(self):
+        """ (self) -> None
+        
+        Makes ZipFile write the central directory of z.filelist after
+        the last member on close.
+        """
+        z = self.z
+        z.NameToInfo = {info.filename: info for info in z.filelist}
+        z.start_dir = z.fp.tell()
+        z._didModify = True
+
+def zip_data_offset(fp, info):
+    """ (file, ZipInfo) -> int
+    
+    Reads the local header of a ZIP member and returns the offset
+    of its compressed data. The name and the CRC in the local header
+    are checked against the central directory (the CRC only if it is
+    not in a data descriptor).
+    """
+    fp.seek(info.header_offset)
+    header = fp.read(ZIP_LOCAL_HEADER.size)
+    if len(header) != ZIP_LOCAL_HEADER.size or header[:4] != ZIP_LOCAL_SIGNATURE:
+        raise zipfile.BadZipFile("Bad local header of '{}'".format(info.filename))
+    fields = ZIP_LOCAL_HEADER.unpack(header)
+    flag_bits, crc, name_len, extra_len = fields[3], fields[7], fields[10], fields[11]
+    if not flag_bits & ZIP_DATA_DESCRIPTOR and crc != info.CRC:
+        raise zipfile.BadZipFile("Bad CRC of '{}'".format(info.filename))
+    encoding = 'utf-8' if flag_bits & ZIP_UTF8_FILENAME else 'cp437'
+    if fp.read(name_len) != info.orig_filename.encode(encoding):
+        raise zipfile.BadZipFile("Bad local name of '{}'".format(info.filename))
+    return info.header_offset + ZIP_LOCAL_HEADER.size + name_len + extra_len
+
+def zip_local_header_patch(fp, info, name):
+    """ (file, ZipInfo, str) -> (int, bytes, bytes) or None
+    
+    Builds a local header of a ZIP member with a new name, taking
+    exactly the space of the current one. Informational extra
+    records are dropped and the rest is filled with padding.
+    
+    Returns:
+        (offset, current bytes, new bytes),
+        None if the new name does not fit.
+    """
+    fp.seek(info.header_offset)
+    header = fp.read(ZIP_LOCAL_HEADER.size)
+    if len(header) != ZIP_LOCAL_HEADER.size or header[:4] != ZIP_LOCAL_SIGNATURE:
+        raise zipfile.BadZipFile("Bad local header of '{}'".format(info.filename))
+    fields = list(ZIP_LOCAL_HEADER.unpack(header))
+    name_len, extra_len = fields[10], fields[11]
+    rest = fp.read(name_len + extra_len)
+    extra = strip_zip_extra(rest[name_len:], ZIP_DROPPABLE_EXTRA)
+    
+    try:
+        encoded = name.encode('ascii')
+    except UnicodeEncodeError:
+        encoded = name.encode('utf-8')
+        fields[3] |= ZIP_UTF8_FILENAME
+    
+    free = len(rest) - len(encoded) - len(extra)
+    if free < 0 or 0 < free < 4:
+        return None
+    if free > 0:
+        extra += struct.pack('<HH', ZIP_PADDING_EXTRA, free - 4) + b'\0' * (free - 4)
+    fields[10], fields[11] = len(encoded), len(extra)
+    return (info.header_offset, header + rest, ZIP_LOCAL_HEADER.pack(*fields) + encoded + extra)
+
+def strip_zip_extra(extra, ids):
+    """ (bytes, tuple) -> bytes
+    
+    Removes the records with the given ids from an extra field.
+    """
+    rslt = b''
+    i = 0
+    while i + 4 <= len(extra):
+        tp, ln = struct.unpack('<HH', extra[i:i+4])
+        if tp not in ids:
+            rslt += extra[i:i+4+ln]
+        i += 4 + ln
+    return rslt
+
+def write_zip_journal(zip_path, size, patches):
+    """ (str, int, list) -> None
+    
+    Saves the original size of a ZIP file and the original bytes at
+    some offsets, before they are overwritten.
+    """
+    data = {'size': size, 'patches': [[offset, old.hex()] for offset, old in patches]}
+    with open(zip_path + '.journal.tmp', 'w') as fp:
+        json.dump(data, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(zip_path + '.journal.tmp', zip_path + '.journal')
+
+def recover_zip_journal(zip_path):
+    """ (str) -> bool
+    
+    Restores a ZIP file from its journal if there is one.
+    
+    Returns:
+        True if the ZIP file has been restored,
+        False otherwise.
+    """
+    if not os.path.isfile(zip_path):
+        return False
+    if os.path.isfile(zip_path + '.journal.tmp'):
+        os.remove(zip_path + '.journal.tmp')
+    if not os.path.isfile(zip_path + '.journal'):
+        return False
+    with open(zip_path + '.journal') as fp:
+        data = json.load(fp)
+    with open(zip_path, 'r+b') as fp:
+        for offset, old in data['patches']:
+            fp.seek(offset)
+            fp.write(bytes.fromhex(old))
+        fp.truncate(data['size'])
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.remove(zip_path + '.journal')
+    return True
+
+TAR_MAGIC = [(b'\x1f\x8b', 'gz'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz'), (b'\x28\xb5\x2f\xfd', 'zst')]
+TAR_SUFFIXES = {'gz': ('.tar.gz', '.tgz'), 'bz2': ('.tar.bz2', '.tbz2'),
+                'xz': ('.tar.xz', '.txz'), 'zst': ('.tar.zst', '.tzst'), '': ('.tar',)}
+TAR_CHUNK_SIZE = 1 << 20
+TAR_GZIP_LEVEL = 6
+TAR_ZSTD_LEVEL = 3
+
+def tar_compression(path):
+    """ (str) -> str or None
+    
+    Returns '', 'gz', 'bz2', 'xz' or 'zst' if path is a tar file
+    compressed that way, None otherwise. Only the first header is
+    read. Without the zstandard package, zstd files are taken for tar
+    files by their name.
+    """
+    try:
+        with open(path, 'rb') as fp:
+            magic = fp.read(6)
+    except OSError:
+        return None
+    compression = ''
+    for prefix, name in TAR_MAGIC:
+        if magic.startswith(prefix):
+            compression = name
+    if compression == 'zst' and zstandard is None:
+        return 'zst' if path.lower().endswith(TAR_SUFFIXES['zst']) else None
+    try:
+        with open_tar_stream(path, compression) as tar:
+            tar.next()
+    except (tarfile.TarError, OSError, EOFError, zlib.error, lzma.LZMAError):
+        return None
+    except Exception as e:
+        if zstandard is not None and isinstance(e, zstandard.ZstdError):
+            return None
+        raise
+    return compression
+
+@contextlib.contextmanager
+def open_tar_stream(path, compression, write=False):
+    """ (str, str, ...) -> context manager of tarfile.TarFile
+    
+    Opens a tar file for reading its members in order, or for writing
+    a new one, compressed the given way ('' for none). Data is read and
+    written in chunks of TAR_CHUNK_SIZE, never whole members.
+    """
+    fp = open(path, 'wb' if write else 'rb')
+    stream = None
+    try:
+        if compression == 'gz':
+            if write:
+                stream = gzip.GzipFile(fileobj=fp, mode='wb', compresslevel=TAR_GZIP_LEVEL)
+            else:
+                stream = gzip.GzipFile(fileobj=fp, mode='rb')
+        elif compression == 'bz2':
+            stream = bz2.BZ2File(fp, 'wb' if write else 'rb')
+        elif compression == 'xz':
+            stream = lzma.LZMAFile(fp, 'wb' if write else 'rb')
+        elif compression == 'zst':
+            if zstandard is None:
+                raise tarfile.CompressionError("The zstandard package is needed for '{}'".format(path))
+            if write:
+                stream = zstandard.ZstdCompressor(level=TAR_ZSTD_LEVEL).stream_writer(fp, closefd=False)
+            else:
+                stream = zstandard.ZstdDecompressor().stream_reader(fp, closefd=False)
+        if stream is None and not write:
+            # Uncompressed tar files are read with seeks over member data,
+            # so listing them reads the headers only.
+            tar = tarfile.open(fileobj=fp, mode='r:')
+        else:
+            tar = tarfile.open(fileobj=stream or fp, mode='w|' if write else 'r|',
+                               bufsize=TAR_CHUNK_SIZE)
+        tar.copybufsize = TAR_CHUNK_SIZE
+        try:
+            yield tar
+        finally:
+            tar.close()
+    finally:
+        if stream is not None:
+            stream.close()
+        fp.close()
+
+def tar_renamed_info(info, name, rename):
+    """ (TarInfo, str, dict) -> TarInfo
+    
+    Returns a copy of info named name, with hard link targets renamed
+    as in rename. Stale pax path headers are dropped.
+    """
+    info = copy.copy(info)
+    info.pax_headers = dict(info.pax_headers)
+    if name != info.name:
+        info.name = name
+        info.pax_headers.pop('path', None)
+    if info.islnk() and info.linkname in rename:
+        info.linkname = rename[info.linkname]
+        info.pax_headers.pop('linkpath', None)
+    return info
+
+class TarFileList(BaseFileList):
+    """
+    Moves files in a tar file, uncompressed or compressed with gzip,
+    bzip2, xz or zstd (the latter needs the zstandard package).
+    
+    Members other than directories are listed from their headers.
+    Renames are applied by streaming the archive once into a new one
+    with the same compression, which then replaces it.
+    
+    Properties:
+        links (dict): hard link name -> name of the member holding its data
+    """
+    
+    def __init__(self, tar_path, compression=None):
+        self.src_path = tar_path
+        self.compression = tar_compression(tar_path) if compression is None else compression
+        if self.compression is None:
+            raise tarfile.ReadError("Not a tar file: '{}'".format(tar_path))
+        files = []
+        self.links = {}
+        with open_tar_stream(tar_path, self.compression) as tar:
+            for info in tar:
+                if info.islnk():
+                    self.links[info.name] = info.linkname
+                if not info.isdir():
+                    files.append(info.name)
+        super(TarFileList, self).__init__(files)
+    
+    def __repr__(self):
+        return 'filelist.TarFileList({!r})'.format(self.src_path)
+    
+    def really_renames(self, src, dst):
+        if src == dst:
+            return True
+        if (dst in self.old_name) or (src not in self.old_name):
+            return False
+        self.old_name[dst] = self.old_name.pop(src)
         return True
     
+    def apply_changes(self, quiet=False, dirty=()):
+        """ (self, ...) -> None
+        
+        Streams the tar file into a new one with the new names and
+        swaps it in, normalizing the dirty members (named as after the
+        moves) on the way.
+        """
+        rename = {old: new for new, old in self.old_name.items() if new != old}
+        dirty = {self.links.get(self.old_name[x], self.old_name[x]) for x in dirty}
+        if not rename and not dirty:
+            return
+        tmp_path = '{}.{}.tmp'.format(self.src_path, os.getpid())
+        with instrument.stage('tar_rewrite'):
+            try:
+                self.write_renamed(tmp_path, rename, quiet=quiet, dirty=dirty)
+                shutil.copymode(self.src_path, tmp_path)
+                os.replace(tmp_path, self.src_path)
+                instrument.count('rename')
+            finally:
+                if os.path.lexists(tmp_path):
+                    os.remove(tmp_path)
+    
+    def write_renamed(self, dst_path, rename, quiet=False, dirty=()):
+        """ (self, str, dict, ...) -> None
+        
+        The dirty members, named as before the moves, are normalized
+        through a temporary file, since their new size goes first.
+        """
+        with open_tar_stream(self.src_path, self.compression) as src, \
+                open_tar_stream(dst_path, self.compression, write=True) as dst:
+            for info in src:
+                name = rename.get(info.name, info.name)
+                if name != info.name and not quiet:
+                    print("Renaming '{}' -> '{}'".format(info.name, name))
+                new_info = tar_renamed_info(info, name, rename)
+                if info.isreg() and info.name in dirty:
+                    new_info.pax_headers.pop('size', None)
+                    with src.extractfile(info) as fp_src, tempfile.TemporaryFile() as fp_tmp:
+                        read, new_info.size = normalize.normalize_stream(fp_src, fp_tmp)
+                        fp_tmp.seek(0)
+                        dst.addfile(new_info, fp_tmp)
+                    instrument.count('bytes_written', new_info.size)
+                elif info.isreg():
+                    dst.addfile(new_info, src.extractfile(info))
+                    instrument.count('bytes_written', info.size)
+                else:
+                    dst.addfile(new_info)
+    
+    def iter_data(self, names):
+        """ (self, iterable) -> iterator of (list, TarInfo, file)
+        
+        Reads the members names in one pass. Hard links share the data
+        of the member they point to, so every piece of data comes once
+        with all the names in names holding it, and the TarInfo of the
+        member it is read from. The file is None for symbolic links.
+        """
+        groups = {}
+        for name in set(names):
+            groups.setdefault(self.links.get(name, name), []).append(name)
+        with open_tar_stream(self.src_path, self.compression) as tar:
+            for info in tar:
+                group = groups.pop(info.name, None) if not info.islnk() else None
+                if group is None:
+                    continue
+                if info.isreg():
+                    with tar.extractfile(info) as fp:
+                        yield (sorted(group), info, fp)
+                elif info.issym():
+                    yield (sorted(group), info, None)
+    
+    def write_dirr_copy(self, src, dst, dirr, link='auto', quiet=False):
+        new_name = dict(zip(src, dst))
+        for names, info, fp in self.iter_data(src):
+            first = None
+            for x in names:
+                path = copy_destination(dirr, new_name[x])
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if not quiet:
+                    print("Extracting '{}' -> '{}'".format(x, new_name[x]))
+                if fp is None:
+                    check_link_target(dirr, path, info.linkname)
+                    os.symlink(info.linkname, path)
+                elif first is not None:
+                    os.link(first, path)
+                else:
+                    with open(path, 'xb') as fp_dst:
+                        shutil.copyfileobj(fp, fp_dst, TAR_CHUNK_SIZE)
+                        instrument.count('bytes_written', fp_dst.tell())
+                    os.chmod(path, info.mode & 0o777)
+                    first = path
+    
+    def write_zip_copy(self, src, dst, zip_path, quiet=False):
+        new_name = dict(zip(src, dst))
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as z:
+            for names, info, fp in self.iter_data(src):
+                first = None
+                for x in names:
+                    if not quiet:
+                        print("Writing data of '{}'".format(new_name[x]))
+                    date_time = datetime.datetime.fromtimestamp(info.mtime).timetuple()[:6]
+                    zip_info = zipfile.ZipInfo(new_name[x], date_time)
+                    zip_info.compress_type = zipfile.ZIP_DEFLATED
+                    if fp is None:
+                        # Symbolic links are stored the way Info-ZIP does.
+                        zip_info.external_attr = 0o120777 << 16
+                        z.writestr(zip_info, info.linkname)
+                    elif first is not None:
+                        zip_info.external_attr = (0o100000 | info.mode & 0o777) << 16
+                        with z.open(zip_info, 'w', force_zip64=True) as fp_dst:
+                            first.seek(0)
+                            shutil.copyfileobj(first, fp_dst, TAR_CHUNK_SIZE)
+                    else:
+                        zip_info.external_attr = (0o100000 | info.mode & 0o777) << 16
+                        with z.open(zip_info, 'w', force_zip64=True) as fp_dst:
+                            if len(names) > 1:
+                                # Hard linked data is written once per name.
+                                first = tempfile.TemporaryFile()
+                                shutil.copyfileobj(fp, first, TAR_CHUNK_SIZE)
+                                first.seek(0)
+                                shutil.copyfileobj(first, fp_dst, TAR_CHUNK_SIZE)
+                            else:
+                                shutil.copyfileobj(fp, fp_dst, TAR_CHUNK_SIZE)
+                if first is not None:
+                    first.close()
+    
+    def find_unnormalized(self, names, workers=None):
+        dirty = set()
+        for group, info, fp in self.iter_data(names):
+            if fp is not None:
+                x, read = normalize.scan_stream(fp)
+                instrument.count('bytes_read', read)
+                if x:
+                    dirty.update(group)
+        return [x for x in names if x in dirty]
+    
+    def move_files_directly(self, src, dst, dirty=(), **kwargs):
+        self.old_name = {x: x for x in self.files}
+        try:
+            success = super(TarFileList, self).move_files_directly(src, dst, **kwargs)
+            if success and kwargs.get('real', False):
+                self.apply_changes(quiet=kwargs.get('quiet', False), dirty=dirty)
+        finally:
+            del self.old_name
+        return success
+
 if __name__ == '__main__':
     print(BaseFileList(['a', 'b', 'c']))
     assert BaseFileList(['a', 'b', 'c']).move_file('a', 'a', quiet=True) == True
@@ -219,3 +1492,8 @@ if __name__ == '__main__':
     assert BaseFileList(['a', 'b', 'c']).move_files_directly(['a', 'b'], ['d', 'd'], quiet=True) == False
     assert BaseFileList(['a', 'b', 'c']).move_files_directly(['a', 'b', 'c'], ['c', 'd', 'e'], quiet=True) == False
     assert BaseFileList(['a', 'b', 'c']).move_files_indirectly(['a', 'b', 'c'], ['c', 'd', 'e'], quiet=True) == True
+    assert BaseFileList(['a', 'b']).plan_moves(['a', 'b'], ['b', 'c']) == (['b', 'a'], ['c', 'b'])
+    assert BaseFileList(['a', 'b', 'c']).plan_moves(['a', 'b'], ['b', 'c']) == None
+    assert BaseFileList(['a', 'b', 'c']).move_files_planned(['a', 'b', 'c'], ['c', 'd', 'e'], quiet=True) == True
+    assert BaseFileList(['a', 'b', 'c']).move_files_planned(['a', 'b', 'c'], ['b', 'c', 'a'], quiet=True) == True
+    assert BaseFileList(['a', 'b', 'a']).move_files_directly(['a', 'a'], ['d', 'e'], quiet=True) == True
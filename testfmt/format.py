@@ -1,5 +1,10 @@
 #!/usr/bin/env python3
 
+import re
+import itertools
+
+CHUNK_SIZE = 1 << 12
+
 class Format:
     
     def __init__(self, prefix, inffmt, suffix):
@@ -49,13 +54,107 @@ class Format:
     def text(self, infix, index=0):
         infix = self.format_infix(infix, self.inffmt, index=index)
         return self.prefix + infix + self.suffix
+    
+    def compile(self):
+        return CompiledFormat(self)
+
+class CompiledFormat:
+    """
+    A Format compiled to a regular expression, with methods working
+    on whole lists of texts at once.
+    """
+    
+    def __init__(self, fmt):
+        self.format = fmt
+        self.pattern = re.compile(
+            re.escape(fmt.prefix) + '(.*)' + re.escape(fmt.suffix), re.DOTALL)
+    
+    def __repr__(self):
+        return 'CompiledFormat(%s)' % self.format
+    
+    def match_list(self, texts):
+        """ (list) -> list
+        Returns [self.format.match(x) for x in texts]. """
+        fullmatch = self.pattern.fullmatch
+        return [fullmatch(x) is not None for x in texts]
+    
+    def infix_list(self, texts):
+        """ (list) -> list
+        Returns the infix of each text, or None if it does not match. """
+        fullmatch = self.pattern.fullmatch
+        return [m and m.group(1) for m in map(fullmatch, texts)]
+    
+    def text_list(self, infixes, numbered=True, start=0):
+        """ (list, ...) -> list
+        Returns [self.format.text(infixes[i], start + i) for i in ...],
+        or with index 0 for all if numbered is False. """
+        fmt = self.format
+        prefix, suffix = fmt.prefix, fmt.suffix
+        if fmt.inffmt == '':
+            return [prefix + x + suffix for x in infixes]
+        if not numbered:
+            return [fmt.text(x, 0) for x in infixes]
+        return [prefix + fmt.format_infix(x, fmt.inffmt, i) + suffix
+                for i, x in enumerate(infixes, start)]
+
+class FormatIndex:
+    """
+    Finds every format of a list matching a text in one lookup.
+
+    Formats are bucketed by suffix, then by prefix, so the cost of
+    matching a text depends on the number of distinct suffix lengths
+    rather than on the number of formats.
+    """
+
+    def __init__(self, formats):
+        self.formats = list(formats)
+        self.buckets = {}
+        for i, fmt in enumerate(self.formats):
+            prefixes = self.buckets.setdefault(fmt.suffix, {})
+            prefixes.setdefault(fmt.prefix, []).append(i)
+        self.suffix_lengths = sorted(set(map(len, self.buckets)))
+
+    def __repr__(self):
+        return 'FormatIndex(%s)' % self.formats
+
+    def matches(self, text):
+        """ (str) -> list
+        Returns the indices of all formats matching text. """
+        rslt = []
+        n = len(text)
+        for k in self.suffix_lengths:
+            if k > n:
+                break
+            prefixes = self.buckets.get(text[n-k:])
+            if prefixes is None:
+                continue
+            for prefix, ids in prefixes.items():
+                if len(prefix) + k <= n and text.startswith(prefix):
+                    rslt.extend(ids)
+        return rslt
 
 def convert_format(text, fmt1, fmt2, index=0):
     infix = fmt1.infix(text)
     return fmt2.text(infix, index)
 
 def convert_format_list(items, fmt1, fmt2):
-    return [convert_format(items[i], fmt1, fmt2, i) for i in range(len(items))]
+    return list(iter_convert_format_list(items, fmt1, fmt2))
+
+def iter_convert_format_list(items, fmt1, fmt2, chunk_size=CHUNK_SIZE):
+    """ (iterable, Format, Format, ...) -> iterator
+    Yields the texts of convert_format_list chunk by chunk, so that
+    only one chunk of infixes is kept at a time. """
+    compiled1, compiled2 = fmt1.compile(), fmt2.compile()
+    items = iter(items)
+    start = 0
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+        if not chunk:
+            return
+        infixes = compiled1.infix_list(chunk)
+        assert None not in infixes
+        yield from compiled2.text_list(infixes, start=start)
+        start += len(chunk)
     
 if __name__ == '__main__':
     print(Format.from_string('t*.in'))
@@ -70,5 +169,7 @@ if __name__ == '__main__':
     print(Format.from_string('a*a').infix('aa'))
     print(Format.from_string('a*a').text('aa'))
     print(Format.from_string('a*a').text('bb'))
+    print(Format.from_string('a*a').compile().infix_list(['aaa', 'aa', 'a']))
+    print(FormatIndex(map(Format.from_string, ['*.in', 't*.in', '*', 'x*'])).matches('t1.in'))
     
     
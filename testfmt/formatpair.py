@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-import format
+from testfmt import format
 from functools import total_ordering
 
 class FormatPair:
@@ -27,7 +27,7 @@ class FormatPair:
     def __eq__(this, that):
         return this.__dict__ == that.__dict__
     
-ALL_KNOWN_FORMAT_PAIRS = list(map(FormatPair.from_string, [
+KNOWN_FORMAT_PAIRS = [
     '*|*.a',
     '*.in|*.ok',
     '*.inp|*.out',
@@ -36,13 +36,21 @@ ALL_KNOWN_FORMAT_PAIRS = list(map(FormatPair.from_string, [
     '*.in|*.a',
     'debug.in.*|debug.out.*',
     'in.*|ans.*',
-]))
+]
+
+def __getattr__(name):
+    # ALL_KNOWN_FORMAT_PAIRS is built from KNOWN_FORMAT_PAIRS on first use.
+    global ALL_KNOWN_FORMAT_PAIRS
+    if name == 'ALL_KNOWN_FORMAT_PAIRS':
+        ALL_KNOWN_FORMAT_PAIRS = list(map(FormatPair.from_string, KNOWN_FORMAT_PAIRS))
+        return ALL_KNOWN_FORMAT_PAIRS
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 DEFAULT_IFMT = format.Format.from_string('*00*.in')
 DEFAULT_OFMT = format.Format.from_string('*00*.ok')
 
 if __name__ == '__main__':
-    print(ALL_KNOWN_FORMAT_PAIRS)
+    print(__getattr__('ALL_KNOWN_FORMAT_PAIRS'))
     print(map(str, ALL_KNOWN_FORMAT_PAIRS))
     assert FormatPair.from_string('*|*') == FormatPair.from_string('*|*')
     assert FormatPair.from_string('*|*') != FormatPair.from_string('*|*.a')
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+""" instrument.py
+
+Stage timing and I/O counters.
+
+Nothing is measured until a hook is added: stage() and count() then
+cost a single check. A hook is called as hook(name, stats) at the end
+of every stage, where stats maps 'seconds' and every name of COUNTERS
+to what was spent in the stage. Counters are process-wide: a stage
+also counts the work of other threads running at the same time, and
+an outer stage includes its inner stages.
+
+Usage:
+    with instrument.Profiler() as profiler:
+        api.convert('apple/')
+    misc.output_profile(profiler.rows())
+
+    instrument.add_hook(lambda name, stats: print(name, stats['seconds']))
+"""
+
+import time
+import threading
+import contextlib
+
+COUNTERS = ('stat', 'listdir', 'rename', 'bytes_read', 'bytes_written')
+
+_hooks = []
+_counters = dict.fromkeys(COUNTERS, 0)
+_lock = threading.Lock()
+
+def add_hook(hook):
+    """ (function) -> None """
+    with _lock:
+        _hooks.append(hook)
+
+def remove_hook(hook):
+    """ (function) -> None """
+    with _lock:
+        _hooks.remove(hook)
+
+def count(name, n=1):
+    """ (str, ...) -> None
+
+    Adds n to the counter name, one of COUNTERS.
+    """
+    if _hooks:
+        with _lock:
+            _counters[name] += n
+
+def snapshot():
+    """ () -> dict """
+    with _lock:
+        return dict(_counters)
+
+@contextlib.contextmanager
+def stage(name):
+    """ (str) -> context manager
+
+    Measures the enclosed code and passes the result to the hooks.
+    """
+    if not _hooks:
+        yield
+        return
+    before = snapshot()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = {'seconds': time.perf_counter() - start}
+        after = snapshot()
+        for x in COUNTERS:
+            stats[x] = after[x] - before[x]
+        with _lock:
+            hooks = list(_hooks)
+        for hook in hooks:
+            hook(name, stats)
+
+class Profiler(object):
+    """
+    A hook adding up the stats of every stage by name.
+
+    Properties:
+        stages (dict): name -> dict of 'calls', 'seconds' and COUNTERS,
+            in the order the stages first ended
+
+    Methods:
+        __call__(self, name, stats)
+        __enter__(self), __exit__(self, *args): adds and removes the hook
+        rows(self)
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return 'instrument.Profiler({} stage(s))'.format(len(self.stages))
+
+    def __call__(self, name, stats):
+        with self.lock:
+            total = self.stages.get(name)
+            if total is None:
+                total = self.stages[name] = dict.fromkeys(('calls', 'seconds') + COUNTERS, 0)
+            total['calls'] += 1
+            for x in stats:
+                total[x] += stats[x]
+
+    def __enter__(self):
+        add_hook(self)
+        return self
+
+    def __exit__(self, *args):
+        remove_hook(self)
+
+    def rows(self):
+        """ (self) -> list
+
+        Returns one dict per stage, with its name under 'stage'.
+        """
+        with self.lock:
+            return [dict(stage=name, **total) for name, total in self.stages.items()]
+
+if __name__ == '__main__':
+    with stage('nothing'):
+        count('stat')
+    assert snapshot()['stat'] == 0
+    with Profiler() as profiler:
+        for i in range(2):
+            with stage('outer'):
+                count('rename')
+                with stage('inner'):
+                    count('bytes_read', 10)
+    assert [x['stage'] for x in profiler.rows()] == ['inner', 'outer']
+    assert profiler.stages['outer']['calls'] == 2
+    assert profiler.stages['outer']['rename'] == 2
+    assert profiler.stages['outer']['bytes_read'] == 20
+    assert profiler.stages['inner']['rename'] == 0
+    assert _hooks == []
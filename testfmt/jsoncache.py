@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+""" jsoncache.py
+
+JsonCache, default_path
+
+The storage shared by dircache.DirCache and dedup.HashCache.
+
+Usage:
+    class NameCache(JsonCache):
+        FIELD = 'names'
+    cache = NameCache(default_path('names.json'))
+    cache.put(key, [size, stamp, name])
+    cache.save()
+"""
+
+import os
+import time
+import threading
+
+from testfmt import misc
+
+json = misc.lazy_import('json')
+tempfile = misc.lazy_import('tempfile')
+
+def default_path(name):
+    """ (str) -> str
+    Returns the path of the cache file name in the user cache directory. """
+    return os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache')),
+        'testfmt', name)
+
+class JsonCache(object):
+    """
+    Keeps entries, lists keyed by strings, in a JSON file between runs.
+
+    The last item of an entry is a use clock, so that at most
+    max_entries are kept: the least recently used ones are evicted on
+    save. The file is written atomically through a temporary file of
+    its own, since several instances, in this process or not, may
+    save the same path. A file of another VERSION is ignored.
+
+    Entries stamped with an mtime should not be stored while racy()
+    holds, since a change in the same mtime tick would go unnoticed.
+
+    Subclasses set FIELD, the name of the entries in the file.
+
+    Methods:
+        __init__(self, path, max_entries=100000)
+        get(self, key)
+        put(self, key, entry)
+        remove(self, key)
+        racy(cls, mtime_ns)
+        save(self)
+    """
+
+    VERSION = 1
+    FIELD = 'entries'
+    RACY_SECONDS = 2
+
+    def __init__(self, path, max_entries=100000):
+        self.path = os.path.abspath(path)
+        self.max_entries = max_entries
+        self.entries = {}
+        self.clock = 0
+        self.lock = threading.Lock()
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+            if data.get('version') == self.VERSION:
+                self.entries = data[self.FIELD]
+                self.clock = max([x[-1] for x in self.entries.values()] + [0])
+        except (OSError, ValueError, KeyError, TypeError, IndexError):
+            self.entries = {}
+
+    def __repr__(self):
+        return '{}.{}({!r})'.format(type(self).__module__.rpartition('.')[2], type(self).__name__, self.path)
+
+    def get(self, key):
+        """ (self, str) -> list or None
+        Returns the entry of key, without its clock, marking it used. """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.clock += 1
+            entry[-1] = self.clock
+            return entry[:-1]
+
+    def put(self, key, entry):
+        """ (self, str, list) -> None """
+        with self.lock:
+            self.clock += 1
+            self.entries[key] = list(entry) + [self.clock]
+
+    def remove(self, key):
+        """ (self, str) -> None """
+        with self.lock:
+            self.entries.pop(key, None)
+
+    @classmethod
+    def racy(cls, mtime_ns):
+        """ (cls, int) -> bool
+        Checks if something with this mtime may change again unnoticed. """
+        return time.time() - mtime_ns / 1e9 <= cls.RACY_SECONDS
+
+    def save(self):
+        """ (self) -> None
+
+        Writes the cache atomically, evicting old entries first.
+        """
+        with self.lock:
+            if len(self.entries) > self.max_entries:
+                keys = sorted(self.entries, key=lambda x: self.entries[x][-1])
+                for x in keys[:len(self.entries) - self.max_entries]:
+                    del self.entries[x]
+            data = {'version': self.VERSION, self.FIELD: self.entries}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + '.',
+                                            suffix='.tmp', dir=os.path.dirname(self.path))
+            try:
+                with os.fdopen(fd, 'w') as fp:
+                    json.dump(data, fp)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+if __name__ == '__main__':
+    assert default_path('x.json').endswith(os.path.join('testfmt', 'x.json'))
+    assert JsonCache.racy(time.time_ns()) and not JsonCache.racy(0)
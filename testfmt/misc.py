@@ -1,6 +1,43 @@
 #!/usr/bin/env python3
 
 import os
+import re
+import sys
+import heapq
+import types
+import fnmatch
+import itertools
+import importlib.util
+import contextlib
+
+from testfmt import instrument
+from testfmt.nametable import NameView
+
+class LazyModule(types.ModuleType):
+    """
+    Stands for a module imported on first attribute access, so that
+    the command line does not load what it does not use. Every access
+    goes through importlib.import_module, which waits for a module
+    another thread is still importing, so this is thread-safe.
+    """
+    
+    def __repr__(self):
+        return 'misc.LazyModule({!r})'.format(self.__name__)
+    
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.__name__), attr)
+
+def lazy_import(name, optional=False):
+    """ (str, ...) -> LazyModule or None
+    
+    Returns None if optional is True and there is no such module.
+    """
+    if optional and importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name)
+
+json = lazy_import('json')
+futures = lazy_import('concurrent.futures')
 
 def ensure_equal_len(lst, *args):
     """ (list, ...) -> int
@@ -13,53 +50,271 @@ def ensure_equal_len(lst, *args):
         assert len(x) == n
     return n
 
-def get_file_list_and_dirr_list(path):
-    """ (str) -> (list, list)
+def get_file_list_and_dirr_list(path, root='.'):
+    """ (str, ...) -> (list, list)
     
     List all files and directories DIRECTLY inside a path.
+    path and the results are relative to root.
     """
+    files, dirrs = [], []
     try:
-        found = os.listdir(path)
-        if path != '.':
-            found = [os.path.join(path, x) for x in found]
+        with os.scandir(os.path.join(root, path)) as it:
+            instrument.count('listdir')
+            for entry in it:
+                x = entry.name if path == '.' else os.path.join(path, entry.name)
+                try:
+                    if entry.is_file():
+                        files.append(x)
+                    elif entry.is_dir():
+                        dirrs.append(x)
+                except OSError:
+                    pass
     except OSError:
-        found = []
-        
-    files = [x for x in found if os.path.isfile(x)]
-    dirrs = [x for x in found if os.path.isdir(x)]
+        pass
     return (files, dirrs)
 
-def get_file_list_recursively(depth=2):
+def match_globs(path, patterns):
+    """ (str, list) -> bool
+    
+    Checks if a path or its base name matches any of the patterns.
+    """
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(path, x) or fnmatch.fnmatch(name, x) for x in patterns)
+
+def list_directory(path, level, depth=2, include=None, exclude=None, cache=None, root='.'):
+    """ (str, int, ...) -> (list, list)
+    
+    Lists the files and the subdirectories to visit of a directory at
+    the given level, for get_file_list_recursively.
+    """
+    if cache is not None:
+        (files, dirrs) = cache.list(path, root=root)
+    else:
+        (files, dirrs) = get_file_list_and_dirr_list(path, root=root)
+    if exclude:
+        files = [x for x in files if not match_globs(x, exclude)]
+        dirrs = [x for x in dirrs if not match_globs(x, exclude)]
+    if include:
+        files = [x for x in files if match_globs(x, include)]
+    if depth is None:
+        instrument.count('stat', len(dirrs))
+        dirrs = [x for x in dirrs if not os.path.islink(os.path.join(root, x))]
+    elif level + 1 >= depth:
+        dirrs = []
+    return (files, dirrs)
+
+def check_depth(depth):
+    """ (int or None) -> None
+    
+    Raises ValueError unless depth is a number of directory levels,
+    0 or more, or None for no limit.
+    """
+    if depth is not None and depth < 0:
+        raise ValueError("depth must be 0 or more, or None for no limit, not {}".format(depth))
+
+def get_file_list_recursively(depth=2, include=None, exclude=None, workers=None, cache=None, root='.'):
     """ (...) -> list
     
-    List all files recursively.
+    List all files recursively, relative to root.
+    
+    Directories are read in parallel by a thread pool of workers when
+    there are several to read.
+    depth is the number of directory levels to read, None for no limit
+    (symbolic links to directories are not followed then); a negative
+    depth raises ValueError.
+    Files are kept if they match any include pattern (when given) and
+    no exclude pattern. Directories matching an exclude pattern are
+    skipped. If a dircache.DirCache is given, unchanged directories
+    are listed from it.
     """
-    curr = ['.']
-    succ = []
     rslt = []
     
-    for i in range(depth):
-        for path in curr:
-            (files, dirrs) = get_file_list_and_dirr_list(path)
-            succ.extend(dirrs)
-            rslt.extend(files)
-        curr = succ
-        succ = []
+    def visit(path, level):
+        (files, dirrs) = list_directory(path, level, depth, include, exclude, cache, root)
+        return (files, dirrs, level)
+    
+    if depth is not None and depth <= 0:
+        check_depth(depth)
+        return rslt
+    # Directories are listed here while there is only one to list, so
+    # the thread pool is only started for testsets with several.
+    (files, dirrs, level) = visit('.', 0)
+    rslt.extend(files)
+    while len(dirrs) == 1:
+        (files, dirrs, level) = visit(dirrs[0], level + 1)
+        rslt.extend(files)
+    if dirrs:
+        with futures.ThreadPoolExecutor(workers) as executor:
+            pending = {executor.submit(visit, x, level + 1) for x in dirrs}
+            while pending:
+                done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    (files, dirrs, level) = future.result()
+                    rslt.extend(files)
+                    pending.update(executor.submit(visit, x, level + 1) for x in dirrs)
     return list(sorted(rslt))
 
+def iter_file_list_sorted(key=None, depth=2, include=None, exclude=None, workers=None, cache=None, root='.'):
+    """ (function, ...) -> iterator
+    
+    Yields the same files as get_file_list_recursively, sorted by key
+    (the names themselves by default) and then by name, as soon as no
+    directory left to list can hold a smaller one.
+    
+    The sorted files of every listed directory are merged with the
+    directories still to list in a heap. A directory 'd' is keyed by
+    'd/', which sorts before all its descendants under both plain and
+    human_key order, so files come out in order while deeper
+    directories are still being listed. Directories are listed ahead
+    of time by a thread pool of workers, started once several are
+    found; the root and lone subdirectories are listed in this thread.
+    """
+    key = key or (lambda x: x)
+    if depth is not None and depth <= 0:
+        check_depth(depth)
+        return
+    with contextlib.ExitStack() as stack:
+        executor = []
+        def submit(path, level):
+            if not executor:
+                executor.append(stack.enter_context(futures.ThreadPoolExecutor(workers)))
+            return executor[0].submit(list_directory, path, level, depth, include, exclude, cache, root)
+        # (key, name, run or None, listing or future or index, level)
+        heap = [(key(''), '', None, list_directory('.', 0, depth, include, exclude, cache, root), 0)]
+        while heap:
+            (k, name, run, i, level) = heapq.heappop(heap)
+            if run is None:
+                (files, dirrs) = i if isinstance(i, tuple) else i.result()
+                files = sorted(files)
+                run = sorted(zip(map(key, files), files))
+                if run:
+                    heapq.heappush(heap, (run[0][0], run[0][1], run, 0, 0))
+                for x in dirrs:
+                    if len(dirrs) == 1 and not executor:
+                        listing = list_directory(x, level + 1, depth, include, exclude, cache, root)
+                    else:
+                        listing = submit(x, level + 1)
+                    heapq.heappush(heap, (key(x + '/'), x + '/', None, listing, level + 1))
+                continue
+            j = i + 1
+            if heap:
+                bound = heap[0][:2]
+                while j < len(run) and run[j] < bound:
+                    j += 1
+            else:
+                j = len(run)
+            for x in run[i:j]:
+                yield x[1]
+            if j < len(run):
+                heapq.heappush(heap, (run[j][0], run[j][1], run, j, 0))
+
+def copy_bytes(src, dst, size, chunk_size=1<<20):
+    """ (file, file, int, ...) -> None
+    
+    Copies exactly size bytes from src to dst, chunk by chunk.
+    """
+    while size > 0:
+        data = src.read(min(size, chunk_size))
+        if not data:
+            raise EOFError("Unexpected end of file")
+        dst.write(data)
+        instrument.count('bytes_read', len(data))
+        instrument.count('bytes_written', len(data))
+        size -= len(data)
+
 def join_alternatively(lst1, lst2):
     """ (list, list) -> list
     
     Returns (lst1[0], lst2[0], lst1[1], lst2[1], ...)
+    Two views of the same NameTable are joined into a view.
     
     """
     n = ensure_equal_len(lst1, lst2)
+    if isinstance(lst1, NameView) and isinstance(lst2, NameView) and lst1.table is lst2.table:
+        return lst1.interleave(lst2)
     rslt = []
     for i in range(n):
         rslt.append(lst1[i])
         rslt.append(lst2[i])
     return rslt
 
+def iter_alternatively(it1, it2):
+    """ (iterable, iterable) -> iterator
+    
+    Same as join_alternatively for iterables of the same length.
+    """
+    return itertools.chain.from_iterable(zip(it1, it2))
+
+def group_by_directory(names, depth=1):
+    """ (iterable, int) -> dict
+
+    Groups names by their first depth directories, '' for the names
+    above that depth, keeping their order. The names of a group are
+    relative to its directory:
+        {'': ['1.in'], 'a': ['1.in', 'b/2.in']} for depth 1
+    """
+    groups = {}
+    for x in names:
+        parts = x.split('/', depth)
+        if len(parts) > depth:
+            groups.setdefault('/'.join(parts[:depth]), []).append(parts[depth])
+        else:
+            groups.setdefault('/'.join(parts[:-1]), []).append(parts[-1])
+    return groups
+
+LINES_PER_WRITE = 4096
+
+def write_lines(lines, end='\n', file=None):
+    """ (iterable, ...) -> None
+
+    Writes lines, each followed by end, to file (sys.stdout by
+    default) in chunks of LINES_PER_WRITE lines, flushing after every
+    chunk so that readers of a pipe get results early.
+    """
+    file = file or sys.stdout
+    chunk = []
+    for x in lines:
+        chunk.append(x)
+        if len(chunk) == LINES_PER_WRITE:
+            file.write(end.join(chunk) + end)
+            file.flush()
+            chunk = []
+    if chunk:
+        file.write(end.join(chunk) + end)
+    file.flush()
+
+def output_file_list(files, output_format='text'):
+    """ (iterable, ...) -> None
+
+    Prints files as they come, one per line ('text'), each followed
+    by a NUL character ('nul'), or as JSON lines ('jsonl'):
+        {"path": "1.inp"}
+    """
+    if output_format == 'nul':
+        write_lines(files, end='\0')
+    elif output_format == 'jsonl':
+        write_lines(json.dumps({'path': x}) for x in files)
+    else:
+        write_lines(files)
+
+def output_detect_records(ifiles, ofiles, output_format='nul', groups=None):
+    """ (list, list, ...) -> None
+
+    Prints test cases for other programs, as input and output files
+    each followed by a NUL character ('nul'), or as JSON lines
+    ('jsonl'), followed by the groups of duplicates if given:
+        {"input": "1.inp", "output": "1.out"}
+        {"duplicates": [["1.inp", "1.out"], ["5.inp", "5.out"]]}
+    """
+    n = ensure_equal_len(ifiles, ofiles)
+    if output_format == 'nul':
+        write_lines(join_alternatively(ifiles, ofiles), end='\0')
+        return
+    write_lines(json.dumps({'input': ifiles[i], 'output': ofiles[i]}) for i in range(n))
+    if groups:
+        write_lines(json.dumps({'duplicates': [[ifiles[i], ofiles[i]] for i in group]})
+                    for group in groups)
+
 def output_detect_result(ifiles, ofiles, is_simple=False):
     """
     Print ifiles and ofiles under the following formats.
@@ -78,12 +333,9 @@ def output_detect_result(ifiles, ofiles, is_simple=False):
     """
     n = ensure_equal_len(ifiles, ofiles)
     if is_simple:
-        for i in range(n):
-            print(ifiles[i])
-            print(ofiles[i])
+        write_lines(join_alternatively(ifiles, ofiles))
     else:
-        for i in range(n):
-            print("'{}', '{}'".format(ifiles[i], ofiles[i]))
+        write_lines("'{}', '{}'".format(ifiles[i], ofiles[i]) for i in range(n))
 
         if n==0:
             print("No test cases have been found.")
@@ -115,12 +367,22 @@ def output_src_and_dst(src, dst, is_simple=False):
     """
     n = ensure_equal_len(src, dst)
     if is_simple:
-        for i in range(n):
-            print(src[i])
-            print(dst[i])
+        write_lines(join_alternatively(src, dst))
     else:
-        for i in range(n):
-            print("'{}' -> '{}'".format(src[i], dst[i]))
+        write_lines("'{}' -> '{}'".format(src[i], dst[i]) for i in range(n))
+
+def output_move_plan(src, dst, is_simple=False):
+    """ (list, list) -> None
+
+    Prints the file operations that will actually be performed,
+    including moves through intermediate names, in the normal format.
+    """
+    if is_simple:
+        return
+    n = ensure_equal_len(src, dst)
+    print("")
+    print("Planned file operation(s): {}.".format(n))
+    write_lines("'{}' -> '{}'".format(src[i], dst[i]) for i in range(n))
 
 def output_preview_result(success, num_test_cases, simple=False):
     """
@@ -140,7 +402,7 @@ def output_preview_result(success, num_test_cases, simple=False):
     print("- NO file operations are performed.")
     print("- Test data is NOT changed.")
 
-def output_convert_result(success, num_test_cases, is_simple=False):
+def output_convert_result(success, num_test_cases, is_simple=False, shards=False):
     """
     Display relevant information after converting.
     """
@@ -151,10 +413,33 @@ def output_convert_result(success, num_test_cases, is_simple=False):
     print("Number of test case(s): {}.".format(num_test_cases))
     if success:
         print("OK. All file operations have been done.")
+    elif shards:
+        print("FAILED. Some file operation failed.")
+        print("The directories that failed have been recovered to their original state.")
     else:
         print("FAILED. Some file operation failed.")
         print("The test data has been recovered to its original state.")
 
+def output_shards(shards, is_simple=False, success=None):
+    """ (list, ...) -> None
+
+    Prints the format pair and the number of test cases of every
+    (directory, DetectResult) of api.detect_shards, followed by
+    whether its moves have been done if success, a list of bool, is
+    given. Nothing is printed in simple format.
+
+    Normal format:
+        'a/': (*.inp, *.out), 2 test case(s). OK.
+        'b/': (in.*, ans.*), 1 test case(s). FAILED.
+    """
+    if is_simple:
+        return
+    print("")
+    for i, (shard, result) in enumerate(shards):
+        status = '' if success is None else ' OK.' if success[i] else ' FAILED.'
+        print("'{}': ({}, {}), {} test case(s).{}".format(
+            shard + '/' if shard else './', result.sifmt, result.sofmt, result.num_test_cases, status))
+
 def output_status_on_checking_failed(num_test_cases):
     print("")
     print("Number of test case(s): {}.".format(num_test_cases))
@@ -162,12 +447,162 @@ def output_status_on_checking_failed(num_test_cases):
     print("No file operations have been performed.")
     print("The original test data is not modified.")
 
+def output_pending_journals(root, journals):
+    """ (str, list) -> None
+
+    Warns on stderr about the directories of root, '' for root
+    itself, holding the journal of an interrupted conversion.
+    """
+    for x in journals:
+        path = os.path.join(root, x) if x else root
+        print("Warning: an interrupted conversion is pending in '{}'.".format(path), file=sys.stderr)
+        print("Run convert to resume it, or convert --rollback to roll it back.", file=sys.stderr)
+
 def output_when_no_test_cases_found(is_simple=False):
     if is_simple:
         return
     print("No test cases have been found.")
     print("There is nothing to be done.")
 
+def output_duplicates(groups, ifiles, ofiles, is_simple=False):
+    """ (list, list, list) -> None
+
+    Prints the groups of byte-identical test cases.
+
+    Simple format (one group per line):
+        1.inp	5.inp
+
+    Normal format:
+        '1.inp', '1.out' = '5.inp', '5.out'
+
+        Number of duplicate test case(s): 1.
+    """
+    if is_simple:
+        for group in groups:
+            print('\t'.join(ifiles[i] for i in group))
+        return
+    print("")
+    for group in groups:
+        print(' = '.join("'{}', '{}'".format(ifiles[i], ofiles[i]) for i in group))
+    if groups:
+        print("")
+    print("Number of duplicate test case(s): {}.".format(sum(len(x) - 1 for x in groups)))
+
+def output_dropped_tests(dropped, is_simple=False):
+    """ (list) -> None
+
+    Prints the duplicate test cases left out of a conversion.
+    """
+    if is_simple or not dropped:
+        return
+    print("")
+    print("Dropped duplicate test case(s): {}.".format(len(dropped)))
+    for ifile, ofile in dropped:
+        print("'{}', '{}'".format(ifile, ofile))
+
+def output_normalized(names, is_simple=False):
+    """ (list) -> None
+
+    Prints the test files whose content is normalized.
+    """
+    if is_simple or not names:
+        return
+    print("")
+    print("Normalized file(s): {}.".format(len(names)))
+    write_lines("'{}'".format(x) for x in names)
+
+def output_profile(rows, as_json=False):
+    """ (list, ...) -> None
+
+    Prints the rows of an instrument.Profiler to stderr, as JSON or
+    under the following format:
+
+        Stage        Calls   Seconds   stat listdir rename  bytes_read bytes_written
+        list             1    0.0125     0      12      0           0             0
+    """
+    if as_json:
+        print(json.dumps({'stages': rows}), file=sys.stderr)
+        return
+    print("{:12} {:>5} {:>9} {:>6} {:>7} {:>6} {:>11} {:>13}".format(
+        'Stage', 'Calls', 'Seconds', 'stat', 'listdir', 'rename', 'bytes_read', 'bytes_written'),
+        file=sys.stderr)
+    for x in rows:
+        print("{:12} {:>5} {:>9.4f} {:>6} {:>7} {:>6} {:>11} {:>13}".format(
+            x['stage'], x['calls'], x['seconds'], x['stat'], x['listdir'], x['rename'],
+            x['bytes_read'], x['bytes_written']), file=sys.stderr)
+
+def read_manifest(path):
+    """ (str) -> list
+    
+    Reads one path per line, skipping blank lines and '#' comments.
+    Relative paths are relative to the directory of the manifest.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path) as fp:
+        lines = [x.strip() for x in fp]
+    return [os.path.join(base, x) for x in lines if x and not x.startswith('#')]
+
+def output_batch_target(path, status, output, is_simple=False):
+    """
+    Display the output of one target of a batch.
+    """
+    if is_simple:
+        print("{}\t{}".format(status, path))
+        return
+    print("=== {} ===".format(path))
+    print(output, end='' if output.endswith('\n') else '\n')
+    print("")
+
+def output_batch_result(results, is_simple=False):
+    """
+    Display a summary of a batch: one line per target.
+    """
+    if is_simple:
+        return
+    failed = [x for x in results if x[1] != 0]
+    for path, status, output in results:
+        print("{} {}".format('OK.    ' if status == 0 else 'FAILED.', path))
+    print("")
+    print("Number of target(s): {}.".format(len(results)))
+    print("Number of failed target(s): {}.".format(len(failed)))
+
+def output_watch_events(events, is_simple=False, output_format='text'):
+    """ (list, ...) -> None
+
+    Prints the events of watch.Watch.events as they come, under the
+    following formats, or as JSON lines ('jsonl') like
+    {"event": "pair", "input": "1.in", "output": "1.out"}.
+
+    Simple format:
+        * *.in *.out
+        + 1.in 1.out
+        - 1.in 1.out
+        = 0
+
+    Normal format:
+        Detected format pair: (*.in, *.out).
+        + '1.in', '1.out'
+        - '1.in', '1.out'
+        Settled. Number of test case(s): 0.
+    """
+    def line(event):
+        kind = event[0]
+        if output_format == 'jsonl':
+            if kind == 'format':
+                return json.dumps({'event': kind, 'sifmt': str(event[1]), 'sofmt': str(event[2])})
+            if kind == 'stable':
+                return json.dumps({'event': kind, 'test_cases': event[1]})
+            return json.dumps({'event': kind, 'input': event[1], 'output': event[2]})
+        sign = {'format': '*', 'pair': '+', 'unpair': '-', 'stable': '='}[kind]
+        if is_simple:
+            return ' '.join([sign] + list(map(str, event[1:])))
+        if kind == 'format':
+            return "Detected format pair: ({}, {}).".format(event[1], event[2])
+        if kind == 'stable':
+            return "Settled. Number of test case(s): {}.".format(event[1])
+        return "{} '{}', '{}'".format(sign, event[1], event[2])
+    write_lines(map(line, events))
+
 def cmp_general(x, y):
     """ (any, any) -> int
     Returns 0 if x==y, -1 if x<y, 1 if x>y """
@@ -198,6 +633,25 @@ def cmp_human(x, y):
             i += 1
             j += 1
 
+DIGIT_RUN = re.compile(r'([0-9]+)')
+
+def human_key(x):
+    """ (str) -> tuple
+    
+    Returns a sort key giving the same order as cmp_human.
+    
+    The key alternates text runs and numbers. A text run followed by
+    a number ends with '0', so it compares against the next text run
+    the way a digit would, character by character.
+    Only ASCII digits are read as numbers.
+    """
+    parts = DIGIT_RUN.split(x)
+    for i in range(0, len(parts) - 1, 2):
+        parts[i] += '0'
+    for i in range(1, len(parts), 2):
+        parts[i] = int(parts[i])
+    return tuple(parts)
+
 if __name__ == '__main__':
     assert cmp_human('1', '01') == 0
     assert cmp_human('10.in', '1.in') == 1
@@ -205,3 +659,7 @@ if __name__ == '__main__':
     assert cmp_human('1a.in', '1aa.in') == -1
     assert cmp_human('a1.in', 'a10.in') == -1
     assert cmp_human('A_1.in', 'AA_1.in') == 1
+    assert human_key('1') == human_key('01')
+    assert human_key('a1.in') < human_key('a10.in')
+    assert human_key('a.in') < human_key('a1.in')
+    assert group_by_directory(['1.in', 'a/1.in', 'a/b/2.in']) == {'': ['1.in'], 'a': ['1.in', 'b/2.in']}
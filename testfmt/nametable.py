@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+
+""" nametable.py
+
+NameTable, NameView, view_of, has_duplicates
+
+A NameTable keeps a million file names in a fraction of the memory of
+a list: every directory prefix is stored once, and a name only as the
+id of its prefix and its base name. Names are known by their position,
+their handle, which renames keep, so pairing and planning can work on
+arrays of handles instead of lists and sets of names.
+
+Usage:
+    table = NameTable(['a/1.in', 'a/1.out', 'b/1.in'])
+    h = table.find('a/1.out')
+    table[h] = 'a/01.ok'
+    snapshot = table.copy()
+    ifiles = snapshot.view(array.array('I', [0, 2]))
+"""
+
+import array
+import operator
+import itertools
+import collections.abc
+
+class NameSequence(collections.abc.Sequence):
+    """
+    Read-only list behaviour shared by NameTable and NameView, with
+    the methods of collections.abc.Sequence (index, count, ...).
+    Slices and sums are plain lists.
+    """
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, NameSequence)):
+            return NotImplemented
+        return len(self) == len(other) and all(map(operator.eq, self, other))
+
+    __hash__ = None
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __repr__(self):
+        return 'nametable.{}({!r})'.format(type(self).__name__, list(self))
+
+class NameTable(NameSequence):
+    """
+    A compact list of file names.
+
+    Name h is dirs[ids[h]] + bases[h]: each directory prefix ('a/b/',
+    '' for the top level) is interned once in dirs, ids is an array.
+    The index from names to handles, one dict of base names per
+    directory, is only built by the first lookup. Names may appear
+    more than once; lookups give the first one.
+
+    A copy shares the storage of the original until either of them
+    is changed, so it serves as a cheap snapshot.
+
+    Methods:
+        __init__(self, names=())
+        append(self, name)
+        extend(self, names)
+        remove(self, name)
+        find(self, name)
+        index(self, name)
+        has_duplicates(self)
+        sort(self, key=None)
+        copy(self)
+        shares_storage(self, other)
+        view(self, handles)
+    """
+
+    def __init__(self, names=()):
+        self._dirs = ['']
+        self._dir_ids = {'': 0}
+        self._ids = array.array('I')
+        self._bases = []
+        self._lookup = None
+        self._dups = None
+        self._shared = False
+        self.extend(names)
+
+    def __len__(self):
+        return len(self._bases)
+
+    def __getitem__(self, h):
+        if isinstance(h, slice):
+            return list(map(operator.add, map(self._dirs.__getitem__, self._ids[h]), self._bases[h]))
+        return self._dirs[self._ids[h]] + self._bases[h]
+
+    def __iter__(self):
+        return map(operator.add, map(self._dirs.__getitem__, self._ids), self._bases)
+
+    def __contains__(self, name):
+        return isinstance(name, str) and self.find(name) >= 0
+
+    def __setitem__(self, h, name):
+        """ (self, int, str) -> None
+        Renames the name of handle h. """
+        self._own()
+        h = range(len(self))[h]
+        d, base = self._intern(name)
+        if self._lookup is not None:
+            self._remove(h, self._ids[h], self._bases[h])
+        self._ids[h] = d
+        self._bases[h] = base
+        if self._lookup is not None:
+            self._add(h, d, base)
+
+    def append(self, name):
+        """ (self, str) -> None """
+        self.extend((name,))
+
+    def extend(self, names):
+        """ (self, iterable) -> None """
+        self._own()
+        dirs, dir_ids, ids, bases = self._dirs, self._dir_ids, self._ids, self._bases
+        start = len(bases)
+        for name in names:
+            head, sep, base = name.rpartition('/')
+            d = dir_ids.get(head if head or not sep else None)
+            if d is None:
+                d = self._intern(name)[0]
+            ids.append(d)
+            bases.append(base)
+        if self._lookup is not None:
+            for h in range(start, len(bases)):
+                self._add(h, ids[h], bases[h])
+
+    def remove(self, name):
+        """ (self, str) -> None
+        Removes name, raising ValueError if it is not in the table. The
+        last name takes its handle, so the order is not kept but this
+        takes constant time. """
+        h = self.index(name)
+        self._own()
+        last = len(self._bases) - 1
+        if self._ids[h] == self._ids[last] and self._bases[h] == self._bases[last]:
+            h = last
+        if self._lookup is not None:
+            self._remove(h, self._ids[h], self._bases[h])
+            if h != last:
+                self._remove(last, self._ids[last], self._bases[last])
+        self._ids[h], self._bases[h] = self._ids[last], self._bases[last]
+        del self._ids[last], self._bases[last]
+        if self._lookup is not None and h != last:
+            self._add(h, self._ids[h], self._bases[h])
+
+    def find(self, name):
+        """ (self, str) -> int
+        Returns the handle of name, or -1 if it is not in the table. """
+        if self._lookup is None:
+            self._build_lookup()
+        head, sep, base = name.rpartition('/')
+        d = self._dir_ids.get(head if head or not sep else None)
+        if d is None or d >= len(self._lookup):
+            return -1
+        return self._lookup[d].get(base, -1)
+
+    def index(self, name):
+        """ (self, str) -> int
+        Same as find, raising ValueError if name is not in the table. """
+        h = self.find(name)
+        if h < 0:
+            raise ValueError("{!r} is not in the table".format(name))
+        return h
+
+    def has_duplicates(self):
+        """ (self) -> bool """
+        if self._lookup is None:
+            self._build_lookup()
+        return bool(self._dups)
+
+    def sort(self, key=None):
+        """ (self, function) -> None
+        Sorts the names in place, like list.sort. Handles change. """
+        keys = list(map(key, self)) if key is not None else list(self)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        del keys
+        self._ids = array.array('I', map(self._ids.__getitem__, order))
+        self._bases = list(map(self._bases.__getitem__, order))
+        self._shared = False
+        self._lookup = self._dups = None
+
+    def copy(self):
+        """ (self) -> NameTable
+        Returns a copy sharing this storage until one of them changes. """
+        other = NameTable.__new__(NameTable)
+        other._dirs, other._dir_ids = self._dirs, self._dir_ids
+        other._ids, other._bases = self._ids, self._bases
+        other._lookup = other._dups = None
+        other._shared = self._shared = True
+        return other
+
+    def shares_storage(self, other):
+        """ (self, NameTable) -> bool
+        Checks if other is a copy of this table and neither of them
+        changed since, so that their handles are the same. """
+        return self._bases is other._bases and self._ids is other._ids
+
+    def view(self, handles):
+        """ (self, array) -> NameView """
+        return NameView(self, handles)
+
+    def _own(self):
+        # Copies storage shared with a copy before changing it. The
+        # interned directories are only ever appended to, so they stay
+        # shared.
+        if self._shared:
+            self._ids = array.array('I', self._ids)
+            self._bases = list(self._bases)
+            self._shared = False
+
+    def _intern(self, name):
+        # Directories are keyed by the part of the name before the last
+        # slash, which rpartition gives without copying the prefix with
+        # its slash; None stands for '/', whose part is '' like the top
+        # level's.
+        head, sep, base = name.rpartition('/')
+        key = head if head or not sep else None
+        d = self._dir_ids.get(key)
+        if d is None:
+            d = self._dir_ids[key] = len(self._dirs)
+            self._dirs.append(head + sep)
+        return (d, base)
+
+    def _build_lookup(self):
+        lookup = [{} for x in self._dirs]
+        dups = {}
+        for h, d, base in zip(itertools.count(), self._ids, self._bases):
+            names = lookup[d]
+            if base in names:
+                name = self._dirs[d] + base
+                dups[name] = dups.get(name, 0) + 1
+            else:
+                names[base] = h
+        self._lookup, self._dups = lookup, dups
+
+    def _add(self, h, d, base):
+        while len(self._lookup) <= d:
+            self._lookup.append({})
+        names = self._lookup[d]
+        k = names.get(base)
+        if k is None:
+            names[base] = h
+            return
+        name = self._dirs[d] + base
+        self._dups[name] = self._dups.get(name, 0) + 1
+        if h < k:
+            names[base] = h
+
+    def _remove(self, h, d, base):
+        # Called before handle h gets its new name.
+        names = self._lookup[d]
+        name = self._dirs[d] + base
+        count = self._dups.get(name)
+        if count is None:
+            del names[base]
+            return
+        if count == 1:
+            del self._dups[name]
+        else:
+            self._dups[name] = count - 1
+        if names[base] == h:
+            names[base] = next(k for k in range(len(self._bases))
+                               if k != h and self._ids[k] == d and self._bases[k] == base)
+
+class NameView(NameSequence):
+    """
+    The names of a NameTable at the given handles, an array, as a
+    read-only list. The table is usually a snapshot taken by
+    NameTable.copy, so renames in the original do not show.
+
+    Methods:
+        __init__(self, table, handles)
+        interleave(self, other)
+    """
+
+    def __init__(self, table, handles):
+        self.table = table
+        self.handles = handles
+
+    def __len__(self):
+        return len(self.handles)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.table[h] for h in self.handles[i]]
+        return self.table[self.handles[i]]
+
+    def __iter__(self):
+        return map(self.table.__getitem__, self.handles)
+
+    def interleave(self, other):
+        """ (self, NameView) -> NameView
+
+        Returns (self[0], other[0], self[1], other[1], ...), for a view
+        of the same table.
+        """
+        assert self.table is other.table and len(self) == len(other)
+        handles = array.array(self.handles.typecode)
+        handles.extend(itertools.chain.from_iterable(zip(self.handles, other.handles)))
+        return NameView(self.table, handles)
+
+def view_of(names):
+    """ (sequence) -> NameView
+
+    Returns names if it is a NameView, or a view of all of names.
+    """
+    if isinstance(names, NameView):
+        return names
+    table = names.copy() if isinstance(names, NameTable) else NameTable(names)
+    return table.view(array.array('I', range(len(table))))
+
+def has_duplicates(names):
+    """ (sequence) -> bool
+
+    Same as len(set(names)) != len(names), with only the hashes of the
+    names kept, unless two of them are equal.
+    """
+    hashes = sorted(map(hash, names))
+    if all(map(operator.ne, hashes, itertools.islice(hashes, 1, None))):
+        return False
+    return len(set(names)) != len(names)
+
+if __name__ == '__main__':
+    table = NameTable(['a/1.in', 'a/1.out', '2.in', 'a/1.in'])
+    assert list(table) == ['a/1.in', 'a/1.out', '2.in', 'a/1.in']
+    assert table.find('a/1.out') == 1 and table.find('1.out') == -1 and table.find('b/1.in') == -1
+    snapshot = table.copy()
+    table[0] = 'b/01.in'
+    assert table.find('a/1.in') == 3 and table.find('b/01.in') == 0
+    assert snapshot == ['a/1.in', 'a/1.out', '2.in', 'a/1.in']
+    assert snapshot.view(array.array('I', [2, 1])) == ['2.in', 'a/1.out']
+    assert snapshot.view(array.array('I', [2, 1, 2])).index('a/1.out') == 1
+    assert snapshot.view(array.array('I', [2, 1, 2])).count('2.in') == 2
+    assert has_duplicates(['a', 'b', 'a']) and not has_duplicates(['a', 'b'])
+    table.remove('a/1.out')
+    assert table == ['b/01.in', 'a/1.in', '2.in'] and table.find('a/1.in') == 1
+    table = NameTable(['x', '/x', 'a//x', 'a/x'])
+    assert list(table) == ['x', '/x', 'a//x', 'a/x'] and table.find('/x') == 1 and table.find('a//x') == 2
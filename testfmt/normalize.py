@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+""" normalize.py
+
+Normalizer, scan_files, normalize_files, scan_zip_members
+
+Text is normalized by turning CRLF line endings into LF, removing
+the spaces and tabs at the end of every line and ending non-empty
+files with a newline. Files containing a NUL byte are taken for
+binary files and left as they are.
+
+Usage:
+    dirty = scan_files('apple/', ['1.in', '1.out'])
+    normalize_files('apple/', dirty)
+    normalize_stream(fp_src, fp_dst)
+"""
+
+import os
+import re
+import mmap
+
+from testfmt import misc
+
+shutil = misc.lazy_import('shutil')
+zipfile = misc.lazy_import('zipfile')
+futures = misc.lazy_import('concurrent.futures')
+
+CHUNK_SIZE = 1 << 20
+
+DIRTY = re.compile(rb'[ \t\r]\n')
+TRAILING = re.compile(rb'[ \t\r]+\n')
+WHITESPACE = b' \t\r'
+
+class Normalizer(object):
+    """
+    Normalizes text fed chunk by chunk.
+
+    Whitespace at the end of a chunk is held back until it is known
+    whether a newline follows it.
+
+    Methods:
+        feed(self, chunk)
+        finish(self)
+    """
+
+    def __init__(self):
+        self.pending = b''
+        self.last = b''
+
+    def __repr__(self):
+        return 'normalize.Normalizer()'
+
+    def feed(self, chunk):
+        """ (self, bytes) -> bytes """
+        data = self.pending + chunk
+        end = data.rfind(b'\n') + 1
+        rest = data[end:].rstrip(WHITESPACE)
+        self.pending = data[end + len(rest):]
+        out = TRAILING.sub(b'\n', data[:end]) + rest
+        if out:
+            self.last = out[-1:]
+        return out
+
+    def finish(self):
+        """ (self) -> bytes
+
+        Drops the whitespace held back and returns the final newline
+        if one is missing.
+        """
+        self.pending = b''
+        return b'\n' if self.last not in (b'', b'\n') else b''
+
+def normalize_bytes(data):
+    """ (bytes) -> bytes """
+    if b'\0' in data:
+        return data
+    normalizer = Normalizer()
+    return normalizer.feed(data) + normalizer.finish()
+
+def normalize_stream(src, dst, chunk_size=CHUNK_SIZE):
+    """ (file, file, ...) -> (int, int)
+
+    Writes the normalized content of the binary file src to dst.
+    Returns the number of bytes read and written.
+    """
+    normalizer = Normalizer()
+    read = written = 0
+    while True:
+        chunk = src.read(chunk_size)
+        out = normalizer.feed(chunk) if chunk else normalizer.finish()
+        dst.write(out)
+        read += len(chunk)
+        written += len(out)
+        if not chunk:
+            return (read, written)
+
+def needs_normalizing(data):
+    """ (bytes-like) -> bool
+
+    data may be a mmap, which is searched without being copied.
+    """
+    if len(data) == 0 or data.find(b'\0') != -1:
+        return False
+    return data[-1:] != b'\n' or DIRTY.search(data) is not None
+
+def scan_stream(fp, chunk_size=CHUNK_SIZE):
+    """ (file, ...) -> (bool, int)
+
+    Reads a binary file chunk by chunk. Returns whether it needs
+    normalizing and the number of bytes read.
+    """
+    dirty, last, read = False, b'\n', 0
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            return (dirty or last != b'\n', read)
+        read += len(chunk)
+        if b'\0' in chunk:
+            return (False, read)
+        if not dirty:
+            dirty = DIRTY.search(last + chunk[:1]) is not None or DIRTY.search(chunk) is not None
+        last = chunk[-1:]
+
+def scan_file(path):
+    """ (str) -> (bool, int)
+
+    Same as scan_stream, reading the file through mmap.
+    """
+    with open(path, 'rb') as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if size == 0:
+            return (False, 0)
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return (needs_normalizing(mm), size)
+
+def normalize_file(path):
+    """ (str) -> (int, int)
+
+    Normalizes a file through a temporary file renamed over it, so
+    other links to the old file are left untouched.
+    Returns the number of bytes read and written.
+    """
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(path, 'rb') as src, open(tmp_path, 'xb') as dst:
+            result = normalize_stream(src, dst)
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+    return result
+
+def map_work(function, items, workers=None):
+    """ (function, list, ...) -> iterator
+
+    Maps function on items in a process pool, or in this process if
+    there is a single item or workers is 1.
+    """
+    if workers == 1 or len(items) <= 1:
+        return map(function, items)
+    chunksize = max(1, len(items) // ((workers or os.cpu_count() or 1) * 4))
+    with futures.ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(function, items, chunksize=chunksize))
+
+def scan_files(root, names, workers=None):
+    """ (str, list, ...) -> (list, int)
+
+    Returns the names of the files under root needing normalization,
+    and the number of bytes read.
+    """
+    results = map_work(scan_file, [os.path.join(root, x) for x in names], workers)
+    dirty, read = [], 0
+    for name, (x, n) in zip(names, results):
+        if x:
+            dirty.append(name)
+        read += n
+    return (dirty, read)
+
+def normalize_files(root, names, workers=None):
+    """ (str, list, ...) -> (int, int)
+
+    Normalizes the files under root. Returns the number of bytes read
+    and written.
+    """
+    results = list(map_work(normalize_file, [os.path.join(root, x) for x in names], workers))
+    return (sum(x[0] for x in results), sum(x[1] for x in results))
+
+def scan_zip_group(args):
+    """ ((str, list)) -> (list, int) """
+    zip_path, names = args
+    dirty, read = [], 0
+    with zipfile.ZipFile(zip_path, 'r') as z:
+        for name in names:
+            with z.open(name) as fp:
+                x, n = scan_stream(fp)
+            if x:
+                dirty.append(name)
+            read += n
+    return (dirty, read)
+
+def scan_zip_members(zip_path, names, workers=None):
+    """ (str, list, ...) -> (list, int)
+
+    Same as scan_files for members of a ZIP file, inflated in groups
+    so that every worker opens the ZIP file once per group.
+    """
+    n = (workers or os.cpu_count() or 1) * 4
+    groups = [(zip_path, names[i::n]) for i in range(n) if names[i::n]]
+    dirty, read = [], 0
+    for x, m in map_work(scan_zip_group, groups, workers):
+        dirty.extend(x)
+        read += m
+    order = {x: i for i, x in enumerate(names)}
+    return (sorted(dirty, key=order.get), read)
+
+if __name__ == '__main__':
+    assert normalize_bytes(b'a \r\nb\t\n\nc  ') == b'a\nb\n\nc\n'
+    assert normalize_bytes(b'') == b''
+    assert normalize_bytes(b'a\0 \n') == b'a\0 \n'
+    normalizer = Normalizer()
+    assert normalizer.feed(b'a  ') + normalizer.feed(b'\r') + normalizer.feed(b'\nb') + normalizer.finish() == b'a\nb\n'
+    assert needs_normalizing(b'a\r\n') and needs_normalizing(b'a') and not needs_normalizing(b'a\n')
+    assert not needs_normalizing(b'') and not needs_normalizing(b'a\0\r\n')
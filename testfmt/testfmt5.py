@@ -3,184 +3,343 @@
 """ testfmt5.py
 
 Usage:
+    testfmt convert apple/ --difmt '*.in' --dofmt '*.ok'
+    python -m testfmt detect apple.zip
     testfmt5.py apple/ -i '*.in' -o '*.ans' --detect
     testfmt5.py apple/ -i '*.in' -o '*.ans' -I '*.in' -O '*.ok' --preview
     testfmt5.py apple/ -i '*.in' -o '*.ans' -I '*.in' -O '*.ok'
     testfmt5.py apple.zip -i '*.in' -o '*.ans' --detect
     testfmt5.py apple.zip -i '*.in' -o '*.ans' -I '*.in' -O '*.ok' --preview
     testfmt5.py apple.zip -i '*.in' -o '*.ans' -I '*.in' -O '*.ok'
+    testfmt5.py batch apple/ banana.zip -m contest.txt -j 8
+    testfmt5.py cherry.tar.gz -i '*.in' -o '*.ans' -I '*.in' -O '*.ok'
+    testfmt watch apple/ --sifmt '*.in' --sofmt '*.ans' --convert
+    testfmt convert contest/ --shards -j 8
 """
 
+import io
 import os
 import sys
-import zipfile
 import argparse
-import functools
-
-import misc
-import format
-import filelist
-import formatpair
-
-from filelist import BaseFileList, FileList, ZipFileList
-
-def best_format_pair(files):
-    return max(
-        formatpair.ALL_KNOWN_FORMAT_PAIRS,
-        key = lambda pair: len(get_ifiles_ofiles(files, pair.ifmt, pair.ofmt)[0])
-    )
-
-def get_ifiles_ofiles(files, ifmt, ofmt):
-    """ (list, Format, Format) -> (list, list) """
-
-    assert isinstance(files, list)
-    assert isinstance(ifmt, format.Format)
-    assert isinstance(ofmt, format.Format)
-
-    #files = sorted(files)
-    ifiles, ofiles = [], []
-
-    for x in files:
-        if not ifmt.match(x):
-            continue
-        y = format.convert_format(x, ifmt, ofmt)
-        if y not in files:
-            continue
-        if (x in ifiles) or (x in ofiles):
-            continue
-        if (y in ifiles) or (y in ofiles):
-            continue
-        ifiles.append(x)
-        ofiles.append(y)
-    return (ifiles, ofiles)
-
-
-def do_detect(file_list, sifmt, sofmt, simple=False, **kwargs):
+import contextlib
+
+if __name__ == '__main__' and not __package__:
+    # Run as a script from a checkout: import the package next to it.
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from testfmt import api
+from testfmt import misc
+from testfmt import format
+from testfmt import dedup
+from testfmt import dircache
+from testfmt import filelist
+from testfmt import instrument
+from testfmt import watch
+
+from testfmt.api import best_format_pair, detect_format_pair, get_ifiles_ofiles
+
+futures = misc.lazy_import('concurrent.futures')
+
+def do_detect(file_list, sifmt, sofmt, simple=False, duplicates=False, hash_cache=None,
+              output_format='text', shards=None, jobs=None, **kwargs):
     """ (FileList, Format, Format, ...) -> None
-    Outputs input and output file list with the given formats. """
-    
-    assert (sifmt is None) == (sofmt is None)
-    if sifmt is None and sofmt is None:
-        pair = best_format_pair(file_list.files)
-        sifmt, sofmt = pair.ifmt, pair.ofmt
-        assert sifmt is not None
-        assert sofmt is not None
-    
-    ifiles, ofiles = get_ifiles_ofiles(file_list.files, sifmt, sofmt)
-    misc.output_detect_result(ifiles, ofiles, simple)
-
-def do_convert_preview(file_list, src, dst, simple=False):
-    """ (BaseFileList, list, list, ...) -> None
-    Moves files in preview mode. Exits 0 if success or 1 otherwise. """
-    
-    num_test_cases = misc.ensure_equal_len(src, dst) / 2
-    misc.output_src_and_dst(src, dst, simple)
-    success = BaseFileList(file_list.files).move_files_indirectly(src, dst, quiet=True)
-    misc.output_preview_result(success, num_test_cases, simple)
-    sys.exit(0 if success else 1)
-
-def do_convert_execute(file_list, src, dst, simple=False):
-    """ (FileList|ZipFileList, list, list, ...) -> None
-    Moves files really. Checks first. Exits 0 if success or 1 otherwise. """
-    
-    num_test_cases = misc.ensure_equal_len(src, dst) / 2
-    success = BaseFileList(file_list.files).move_files_indirectly(src, dst, quiet=True)
-    if success==False:
-        misc.output_status_on_checking_failed(num_test_cases)
-        sys.exit(1)
+    Outputs input and output file list with the given formats,
+    and the byte-identical test cases if duplicates is True.
+    With shards, the directories at that depth are detected on
+    their own. """
+    
+    if shards is not None:
+        result = api.detect_shards(file_list, sifmt, sofmt, depth=shards, jobs=jobs,
+                                   duplicates=duplicates, hash_cache=hash_cache)
     else:
-        success = file_list.move_files_indirectly(src, dst, real=True)
-        misc.output_convert_result(success, num_test_cases)
-        sys.exit(0 if success else 1)
+        result = api.detect_file_list(file_list, sifmt, sofmt,
+                                      duplicates=duplicates, hash_cache=hash_cache)
+    if output_format != 'text':
+        misc.output_detect_records(result.ifiles, result.ofiles, output_format, result.duplicates)
+        return
+    misc.output_detect_result(result.ifiles, result.ofiles, simple)
+    if result.shards is not None:
+        misc.output_shards(result.shards, simple)
+    if duplicates:
+        misc.output_duplicates(result.duplicates, result.ifiles, result.ofiles, simple)
 
-def do_convert(file_list, sifmt, sofmt, difmt, dofmt, preview=False, simple=False, **kwargs):
+def do_convert(file_list, sifmt, sofmt, difmt, dofmt, preview=False, simple=False,
+               drop_duplicates=False, hash_cache=None, dest=None, link='auto', normalize=False,
+               shards=None, jobs=None, **kwargs):
     """ (FileList|ZipFileList, Format, Format, Format, Format, ...) -> None)
-    Moves files in preview mode or real mode. """
-    
-    assert (sifmt is None) == (sofmt is None)
-    if sifmt is None and sofmt is None:
-        pair = best_format_pair(file_list.files)
-        sifmt, sofmt = pair.ifmt, pair.ofmt
-        assert sifmt is not None
-        assert sofmt is not None
-        
-    assert (difmt is None) == (dofmt is None)
-    if difmt is None and dofmt is None:
-        difmt, dofmt = formatpair.DEFAULT_IFMT, formatpair.DEFAULT_OFMT
-
-    sifiles, sofiles = get_ifiles_ofiles(file_list.files, sifmt, sofmt)
-    difiles = format.convert_format_list(sifiles, sifmt, difmt)
-    dofiles = format.convert_format_list(sofiles, sofmt, dofmt)
-
-    src = misc.join_alternatively(sifiles, sofiles)
-    dst = misc.join_alternatively(difiles, dofiles)
-    num_test_cases = misc.ensure_equal_len(src, dst) / 2
-
+    Moves files in preview mode or real mode.
+    With shards, the directories at that depth are converted on
+    their own.
+    Exits 0 if success or 1 otherwise. """
+    
+    if shards is not None:
+        report = api.convert_shards(file_list, sifmt, sofmt, difmt, dofmt,
+                                    preview=preview, quiet=False,
+                                    drop_duplicates=drop_duplicates, hash_cache=hash_cache,
+                                    dest=dest, normalize=normalize, depth=shards, jobs=jobs)
+    else:
+        report = api.convert_file_list(file_list, sifmt, sofmt, difmt, dofmt,
+                                       preview=preview, quiet=False,
+                                       drop_duplicates=drop_duplicates, hash_cache=hash_cache,
+                                       dest=dest, link=link, normalize=normalize)
+    num_test_cases = report.num_test_cases
+    misc.output_dropped_tests(report.dropped, simple)
+    misc.output_normalized(report.normalized, simple)
+    
     if num_test_cases == 0:
         misc.output_when_no_test_cases_found(simple)
         sys.exit(0)
     if preview:
-        do_convert_preview(file_list, src, dst, simple)
+        misc.output_src_and_dst(report.src, report.dst, simple)
+        if report.plan is not None:
+            misc.output_move_plan(report.plan[0], report.plan[1], simple)
+    if report.shards is not None:
+        done = None if preview or not report.checked else [x.success for shard, x in report.shards]
+        misc.output_shards(report.detected.shards, simple, done)
+    if preview:
+        misc.output_preview_result(report.success, num_test_cases, simple)
+    elif not report.checked:
+        misc.output_status_on_checking_failed(num_test_cases)
     else:
-        do_convert_execute(file_list, src, dst, simple)
+        misc.output_convert_result(report.success, num_test_cases, shards=report.shards is not None)
+    sys.exit(0 if report.success else 1)
 
-def get_file_list(path, alphabet, **kwargs):
-    assert path != ''
-    if zipfile.is_zipfile(path):
-        os.chdir(os.path.dirname(path) or '.')
-        file_list = ZipFileList(os.path.basename(path))
-    else:
-        os.chdir(path)
-        file_list = FileList.from_working_directory()
+def depth_argument(text):
+    """ (str) -> int or None
+    Parses --depth: a number of directory levels, 0 for no limit. """
     
-    if alphabet:
-        file_list.files.sort(key=functools.cmp_to_key(misc.cmp_general))
-    else:
-        file_list.files.sort(key=functools.cmp_to_key(misc.cmp_human))
+    depth = int(text)
+    if depth < 0:
+        raise argparse.ArgumentTypeError("must be 0 or more, not {}".format(depth))
+    return depth or None
+
+def get_file_list(path, **kwargs):
+    """ (str, ...) -> FileList|ZipFileList|TarFileList
+    Same as api.open_file_list, warning about the interrupted
+    conversions it left as they are. """
     
+    file_list = api.open_file_list(path, **kwargs)
+    misc.output_pending_journals(path, file_list.pending_journals)
     return file_list
 
+def run_target(path, detect=False, profile=None, **kwargs):
+    """ (str, ...) -> (str, int, str)
+    Detects or converts one target and returns its path, exit status
+    and output, followed by the profile of the target if asked. """
+    
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        with profiled(profile):
+            try:
+                file_list = get_file_list(path, recover=not (detect or kwargs.get('preview')), **kwargs)
+                if detect:
+                    do_detect(file_list, **kwargs)
+                else:
+                    do_convert(file_list, **kwargs)
+                status = 0
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else int(e.code is not None)
+            except Exception as e:
+                print("{}: {}".format(type(e).__name__, e))
+                status = 2
+    return (path, status, output.getvalue())
+
+@contextlib.contextmanager
+def profiled(profile=None):
+    """ (str) -> context manager
+    Prints the time and I/O spent in every stage of the enclosed code
+    to stderr, as a 'table' or as 'json', unless profile is None. """
+    
+    if profile is None:
+        yield
+        return
+    with instrument.Profiler() as profiler:
+        try:
+            yield
+        finally:
+            misc.output_profile(profiler.rows(), profile == 'json')
+
+def run_batch(paths, jobs=None, **kwargs):
+    """ (list, ...) -> iterator
+    Runs run_target on every path in a process pool.
+    Yields (path, status, output) in the order of paths. """
+    
+    paths = [os.path.abspath(x) for x in paths]
+    with futures.ProcessPoolExecutor(jobs) as executor:
+        pending = [executor.submit(run_target, x, **kwargs) for x in paths]
+        for future in pending:
+            yield future.result()
+
 def handle_list(args):
-    file_list = get_file_list(**vars(args))
-    print('\n'.join(file_list.files))
+    with profiled(args.profile):
+        misc.output_file_list(api.iter_file_list(**vars(args)), args.output_format)
+    if os.path.isdir(args.path):
+        misc.output_pending_journals(args.path, filelist.FileList.find_journals(args.path))
     
 def handle_detect(args):
-    file_list = get_file_list(**vars(args))
-    #ifiles, ofiles = get_ifiles_ofiles(file_list.files, args.sifmt, args.sofmt)
-    #misc.output_detect_result(ifiles, ofiles, args.simple)
-    do_detect(file_list, **vars(args))
+    with profiled(args.profile):
+        file_list = get_file_list(**vars(args))
+        #ifiles, ofiles = get_ifiles_ofiles(file_list.files, args.sifmt, args.sofmt)
+        #misc.output_detect_result(ifiles, ofiles, args.simple)
+        do_detect(file_list, **vars(args))
 
 def handle_convert(args):
-    file_list = get_file_list(**vars(args))
-    do_convert(file_list, **vars(args))
+    with profiled(args.profile):
+        file_list = get_file_list(recover=not args.preview, **vars(args))
+        do_convert(file_list, **vars(args))
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
+def handle_batch(args):
+    kwargs = dict(vars(args))
+    paths = kwargs.pop('paths')
+    for manifest in kwargs.pop('manifest') or []:
+        paths.extend(misc.read_manifest(manifest))
+    if kwargs['cache']:
+        kwargs['cache'] = os.path.abspath(kwargs['cache'])
+    if kwargs['hash_cache']:
+        kwargs['hash_cache'] = os.path.abspath(kwargs['hash_cache'])
+    del kwargs['handle']
+    
+    results = []
+    for result in run_batch(paths, **kwargs):
+        misc.output_batch_target(*result, is_simple=args.simple)
+        results.append(result)
+    misc.output_batch_result(results, args.simple)
+    sys.exit(0 if all(status == 0 for path, status, output in results) else 1)
+
+def handle_watch(args):
+    with profiled(args.profile):
+        with watch.Watch(args.path, args.sifmt, args.sofmt, alphabet=args.alphabet, depth=args.depth,
+                         include=args.include, exclude=args.exclude, polling=args.poll,
+                         interval=args.interval, rollback=args.rollback) as w:
+            try:
+                for events in w.events(settle=args.settle):
+                    misc.output_watch_events(events, args.simple, args.output_format)
+                    if args.convert and events[-1][0] == 'stable' and events[-1][1] > 0:
+                        break
+                else:
+                    return
+            except KeyboardInterrupt:
+                sys.exit(130)
+        w.sort()
+        do_convert(w.file_list, **dict(vars(args), sifmt=w.sifmt, sofmt=w.sofmt))
+
+class HelpFormatter(argparse.HelpFormatter):
+    """
+    Same as argparse.HelpFormatter, finding the terminal width without
+    importing shutil, which imports bz2 and lzma.
+    """
+
+    def __init__(self, prog, indent_increment=2, max_help_position=24, width=None):
+        if width is None:
+            width = terminal_width() - 2
+        super().__init__(prog, indent_increment, max_help_position, width)
+
+def terminal_width():
+    """ () -> int
+
+    Same as shutil.get_terminal_size().columns.
+    """
+    try:
+        return int(os.environ['COLUMNS'])
+    except (KeyError, ValueError):
+        pass
+    try:
+        return os.get_terminal_size(sys.__stdout__.fileno()).columns or 80
+    except (AttributeError, ValueError, OSError):
+        return 80
+
+def main(argv=None):
+    """ (list) -> None
+    Entry point of the testfmt command. """
+    
+    parser = argparse.ArgumentParser(prog='testfmt', formatter_class=HelpFormatter)
     subparsers = parser.add_subparsers()
     
-    parser_list = subparsers.add_parser('list')
+    parser_list = subparsers.add_parser('list', formatter_class=HelpFormatter)
     parser_list.add_argument('path')
     parser_list.add_argument('-a', '--alphabet', action='store_true', help="Sort alphabetically")
+    parser_list.add_argument('-d', '--depth', type=depth_argument, default=2, help="Directory levels to list, 0 for no limit")
+    parser_list.add_argument('--include', action='append', help="Only list files matching this glob")
+    parser_list.add_argument('--exclude', action='append', help="Skip files and directories matching this glob")
+    parser_list.add_argument('--cache', nargs='?', const=dircache.DEFAULT_PATH, help="Reuse directory listings cached in this file")
+    parser_list.add_argument('-0', '--null', dest='output_format', action='store_const', const='nul', default='text', help="End every name with a NUL character")
+    parser_list.add_argument('--jsonl', dest='output_format', action='store_const', const='jsonl', help="Print JSON lines")
+    parser_list.add_argument('--profile', nargs='?', const='table', choices=['table', 'json'], help="Print the time and I/O of every stage to stderr")
     parser_list.set_defaults(handle=handle_list)
     
-    parser_detect = subparsers.add_parser('detect')
+    parser_detect = subparsers.add_parser('detect', formatter_class=HelpFormatter)
     parser_detect.add_argument('path')
     parser_detect.add_argument('--sifmt', type=format.Format.from_string)
     parser_detect.add_argument('--sofmt', type=format.Format.from_string)
     parser_detect.add_argument('-a', '--alphabet', action='store_true', help="Sort alphabetically")
+    parser_detect.add_argument('-d', '--depth', type=depth_argument, default=2, help="Directory levels to list, 0 for no limit")
+    parser_detect.add_argument('--include', action='append', help="Only list files matching this glob")
+    parser_detect.add_argument('--exclude', action='append', help="Skip files and directories matching this glob")
+    parser_detect.add_argument('--cache', nargs='?', const=dircache.DEFAULT_PATH, help="Reuse directory listings cached in this file")
     parser_detect.add_argument('-s', '--simple', action='store_true', help="Use simple output format")
+    parser_detect.add_argument('--duplicates', action='store_true', help="Report byte-identical test cases")
+    parser_detect.add_argument('--hash-cache', nargs='?', const=dedup.DEFAULT_PATH, help="Reuse content hashes cached in this file")
+    parser_detect.add_argument('-0', '--null', dest='output_format', action='store_const', const='nul', default='text', help="End every name with a NUL character")
+    parser_detect.add_argument('--jsonl', dest='output_format', action='store_const', const='jsonl', help="Print JSON lines")
+    parser_detect.add_argument('--shards', nargs='?', type=int, const=1, metavar='DEPTH', help="Detect the test cases of every directory at this depth on its own")
+    parser_detect.add_argument('-j', '--jobs', type=int, help="Number of worker processes and threads for --shards")
+    parser_detect.add_argument('--profile', nargs='?', const='table', choices=['table', 'json'], help="Print the time and I/O of every stage to stderr")
     parser_detect.set_defaults(handle=handle_detect)
     
-    parser_convert = subparsers.add_parser('convert')
+    # Options shared by the commands converting test data.
+    convert_options = argparse.ArgumentParser(add_help=False, formatter_class=HelpFormatter)
+    convert_options.add_argument('--sifmt', type=format.Format.from_string)
+    convert_options.add_argument('--sofmt', type=format.Format.from_string)
+    convert_options.add_argument('--difmt', type=format.Format.from_string)
+    convert_options.add_argument('--dofmt', type=format.Format.from_string)
+    convert_options.add_argument('-a', '--alphabet', action='store_true', help="Sort alphabetically")
+    convert_options.add_argument('-d', '--depth', type=depth_argument, default=2, help="Directory levels to list, 0 for no limit")
+    convert_options.add_argument('--include', action='append', help="Only list files matching this glob")
+    convert_options.add_argument('--exclude', action='append', help="Skip files and directories matching this glob")
+    convert_options.add_argument('-s', '--simple', action='store_true', help="Use simple output format")
+    convert_options.add_argument('-p', '--preview', action='store_true')
+    convert_options.add_argument('--drop-duplicates', action='store_true', help="Only rename the first of byte-identical test cases")
+    convert_options.add_argument('--hash-cache', nargs='?', const=dedup.DEFAULT_PATH, help="Reuse content hashes cached in this file")
+    convert_options.add_argument('--normalize', action='store_true', help="Fix CRLF line endings, trailing whitespace and missing final newlines in test files")
+    convert_options.add_argument('--profile', nargs='?', const='table', choices=['table', 'json'], help="Print the time and I/O of every stage to stderr")
+    
+    parser_convert = subparsers.add_parser('convert', parents=[convert_options], formatter_class=HelpFormatter)
     parser_convert.add_argument('path')
-    parser_convert.add_argument('--sifmt', type=format.Format.from_string)
-    parser_convert.add_argument('--sofmt', type=format.Format.from_string)
-    parser_convert.add_argument('--difmt', type=format.Format.from_string)
-    parser_convert.add_argument('--dofmt', type=format.Format.from_string)
-    parser_convert.add_argument('-a', '--alphabet', action='store_true', help="Sort alphabetically")
-    parser_convert.add_argument('-s', '--simple', action='store_true', help="Use simple output format")
-    parser_convert.add_argument('-p', '--preview', action='store_true')
+    parser_convert.add_argument('--cache', nargs='?', const=dircache.DEFAULT_PATH, help="Reuse directory listings cached in this file")
+    parser_convert.add_argument('--in-place', action='store_true', help="Rename ZIP members without rewriting their data")
+    parser_convert.add_argument('--rollback', action='store_true', help="Roll back an interrupted conversion instead of resuming it")
+    parser_convert.add_argument('-o', '--output', dest='dest', help="Leave the test data as is and write a renamed copy to this new directory or ZIP file")
+    parser_convert.add_argument('--link', choices=filelist.LINK_MODES, default='auto', help="How --output copies files between directories (hardlinks share data with the original)")
+    parser_convert.add_argument('--shards', nargs='?', type=int, const=1, metavar='DEPTH', help="Convert the test cases of every directory at this depth on its own")
+    parser_convert.add_argument('-j', '--jobs', type=int, help="Number of worker processes and threads for --shards")
     parser_convert.set_defaults(handle=handle_convert)
+    
+    parser_batch = subparsers.add_parser('batch', parents=[convert_options], formatter_class=HelpFormatter)
+    parser_batch.add_argument('paths', nargs='*')
+    parser_batch.add_argument('-m', '--manifest', action='append', help="Read more paths from this file, one per line")
+    parser_batch.add_argument('-j', '--jobs', type=int, help="Number of worker processes")
+    parser_batch.add_argument('--detect', action='store_true', help="Only detect test cases")
+    parser_batch.add_argument('--cache', nargs='?', const=dircache.DEFAULT_PATH, help="Reuse directory listings cached in this file")
+    parser_batch.add_argument('--in-place', action='store_true', help="Rename ZIP members without rewriting their data")
+    parser_batch.add_argument('--duplicates', action='store_true', help="Report byte-identical test cases")
+    parser_batch.set_defaults(handle=handle_batch)
+    
+    parser_watch = subparsers.add_parser('watch', parents=[convert_options], formatter_class=HelpFormatter)
+    parser_watch.add_argument('path')
+    parser_watch.add_argument('--jsonl', dest='output_format', action='store_const', const='jsonl', default='text', help="Print JSON lines")
+    parser_watch.add_argument('--settle', type=float, default=watch.SETTLE_SECONDS, help="Seconds without changes after which the files count as settled")
+    parser_watch.add_argument('--poll', action='store_true', help="Poll the directories instead of using inotify")
+    parser_watch.add_argument('--interval', type=float, default=watch.POLL_INTERVAL, help="Seconds between two polls")
+    parser_watch.add_argument('--convert', action='store_true', help="Convert once the files settled with test cases, then exit")
+    parser_watch.add_argument('--rollback', action='store_true', help="Roll back an interrupted conversion instead of resuming it")
+    parser_watch.add_argument('-o', '--output', dest='dest', help="Leave the test data as is and write a renamed copy to this new directory or ZIP file")
+    parser_watch.add_argument('--link', choices=filelist.LINK_MODES, default='auto', help="How --output copies files between directories (hardlinks share data with the original)")
+    parser_watch.set_defaults(handle=handle_watch)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.handle is handle_convert and args.shards is not None and (args.dest or not os.path.isdir(args.path)):
+        parser.error("--shards only converts directories in place")
     args.handle(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,583 @@
+#!/usr/bin/env python3
+
+""" watch.py
+
+Watch, Pairing, Changes, DirectoryWatcher, PollingWatcher, InotifyWatcher
+
+Follows a directory while test files are being generated into it. The
+file list is listed once; after that only the names in inotify events
+(or in the directories whose mtime changed, when polling) are looked
+at, and the pairing of input and output files is updated name by name.
+
+Usage:
+    with Watch('apple/', sifmt, sofmt) as w:
+        for events in w.events():
+            print(events)       # [('pair', '1.in', '1.out'), ...]
+"""
+
+import os
+import sys
+import time
+
+from testfmt import api
+from testfmt import misc
+from testfmt import format
+from testfmt import dircache
+from testfmt.filelist import FileList, RenameJournal
+
+ctypes = misc.lazy_import('ctypes')
+select = misc.lazy_import('select')
+struct = misc.lazy_import('struct')
+
+SETTLE_SECONDS = 2.0
+POLL_INTERVAL = 1.0
+STOP_INTERVAL = 0.5
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+
+class Pairing(object):
+    """
+    The test cases of a changing file list, paired as get_ifiles_ofiles
+    pairs them: a file is paired with the file its name converts to,
+    from ifmt to ofmt, unless one of them is paired already. When a
+    file goes, its partner is paired again if it can be. Every change
+    costs a few lookups in files, whatever the number of files.
+
+    Methods:
+        __init__(self, ifmt, ofmt, files)
+        add(self, name)
+        remove(self, name)
+
+    Properties:
+        output_of (dict): the output file of every paired input file
+        input_of (dict): the input file of every paired output file
+        num_test_cases (int)
+    """
+
+    def __init__(self, ifmt, ofmt, files):
+        self.ifmt = ifmt
+        self.ofmt = ofmt
+        self.files = files
+        self.output_of = {}
+        self.input_of = {}
+
+    def __repr__(self):
+        return 'watch.Pairing({}, {}, {} test cases)'.format(self.ifmt, self.ofmt, self.num_test_cases)
+
+    @property
+    def num_test_cases(self):
+        return len(self.output_of)
+
+    def add(self, name):
+        """ (self, str) -> list
+
+        Pairs name, just added to files, if it completes a test case.
+        Returns the new pair as [('pair', ifile, ofile)], or [].
+        """
+        if name in self.output_of or name in self.input_of:
+            return []
+        if self.ifmt.match(name):
+            y = format.convert_format(name, self.ifmt, self.ofmt)
+            if y in self.files and y not in self.output_of and y not in self.input_of:
+                return self._link(name, y)
+        if self.ofmt.match(name):
+            x = format.convert_format(name, self.ofmt, self.ifmt)
+            if (x in self.files and x not in self.output_of and x not in self.input_of
+                    and format.convert_format(x, self.ifmt, self.ofmt) == name):
+                return self._link(x, name)
+        return []
+
+    def remove(self, name):
+        """ (self, str) -> list
+
+        Unpairs name, just removed from files, and pairs its partner
+        again if it can be. Returns the changes as ('unpair', ifile,
+        ofile) and ('pair', ifile, ofile) tuples.
+        """
+        if name in self.output_of:
+            x, y = name, self.output_of.pop(name)
+            del self.input_of[y]
+            return [('unpair', x, y)] + self.add(y)
+        if name in self.input_of:
+            x, y = self.input_of.pop(name), name
+            del self.output_of[x]
+            return [('unpair', x, y)] + self.add(x)
+        return []
+
+    def _link(self, x, y):
+        self.output_of[x] = y
+        self.input_of[y] = x
+        return [('pair', x, y)]
+
+class Changes(object):
+    """
+    The files added to, removed from and written in a directory tree
+    since the last look. A file removed and added again in between
+    counts as written.
+
+    Properties:
+        added, removed, written (list)
+    """
+
+    def __init__(self):
+        self._added = {}
+        self._removed = {}
+        self._written = {}
+
+    def __repr__(self):
+        return 'watch.Changes(added={}, removed={}, written={})'.format(
+            self.added, self.removed, self.written)
+
+    def __bool__(self):
+        return bool(self._added or self._removed or self._written)
+
+    @property
+    def added(self):
+        return list(self._added)
+
+    @property
+    def removed(self):
+        return list(self._removed)
+
+    @property
+    def written(self):
+        return list(self._written)
+
+    def add(self, name):
+        if name in self._removed:
+            del self._removed[name]
+            self._written[name] = None
+        else:
+            self._added[name] = None
+
+    def remove(self, name):
+        self._written.pop(name, None)
+        if name in self._added:
+            del self._added[name]
+        else:
+            self._removed[name] = None
+
+    def write(self, name):
+        if name not in self._added:
+            self._written[name] = None
+
+class DirectoryWatcher(object):
+    """
+    Keeps the files and subdirectories of every listed directory of a
+    tree, listed as misc.get_file_list_recursively lists them, and
+    finds what changed in them. Subclasses decide which directories
+    to list again.
+
+    Methods:
+        __init__(self, root, depth=2, include=None, exclude=None, interval=POLL_INTERVAL)
+        scan(self)
+        changes(self, timeout)
+        close(self)
+    """
+
+    def __init__(self, root, depth=2, include=None, exclude=None, interval=POLL_INTERVAL):
+        misc.check_depth(depth)
+        if depth == 0:
+            raise ValueError("depth 0 lists nothing to watch")
+        self.root = root
+        self.depth = depth
+        self.include = include
+        self.exclude = exclude
+        self.interval = interval
+        self.dirs = {}          # path -> (level, set of files, set of subdirectories)
+        self.stamps = {}        # path -> mtime_ns when listed, None if too recent to trust
+        self.next_poll = 0
+
+    def __repr__(self):
+        return 'watch.{}({!r})'.format(type(self).__name__, self.root)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def scan(self):
+        """ (self) -> list
+
+        Lists the whole tree and returns the names of its files.
+        """
+        changes = Changes()
+        self._add_tree('.', 0, changes)
+        return changes.added
+
+    def changes(self, timeout):
+        """ (self, float) -> Changes
+
+        Waits at most timeout seconds for changes and returns them.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """ (self) -> None """
+        pass
+
+    def _watch(self, path):
+        # Called before listing path; polling remembers its mtime.
+        try:
+            mtime = os.stat(os.path.join(self.root, path)).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is not None and dircache.DirCache.racy(mtime):
+            mtime = None
+        self.stamps[path] = mtime
+
+    def _unwatch(self, path):
+        self.stamps.pop(path, None)
+
+    def _poll(self, paths, changes):
+        # Lists again the directories of paths whose mtime changed.
+        for path in paths:
+            if path not in self.dirs:
+                continue
+            try:
+                mtime = os.stat(os.path.join(self.root, path)).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime is None or mtime != self.stamps.get(path):
+                self._relist(path, changes)
+
+    def _add_tree(self, path, level, changes):
+        stack = [(path, level)]
+        while stack:
+            (path, level) = stack.pop()
+            self._watch(path)
+            (files, dirrs) = misc.list_directory(path, level, self.depth, self.include, self.exclude,
+                                                 root=self.root)
+            self.dirs[path] = (level, set(files), set(dirrs))
+            for x in files:
+                changes.add(x)
+            stack.extend((x, level + 1) for x in dirrs)
+
+    def _drop_tree(self, path, changes):
+        stack = [path]
+        while stack:
+            path = stack.pop()
+            if path not in self.dirs:
+                continue
+            (level, files, dirrs) = self.dirs.pop(path)
+            self._unwatch(path)
+            for x in files:
+                changes.remove(x)
+            stack.extend(dirrs)
+
+    def _relist(self, path, changes):
+        (level, files, dirrs) = self.dirs[path]
+        self._watch(path)
+        (new_files, new_dirrs) = misc.list_directory(path, level, self.depth, self.include, self.exclude,
+                                                     root=self.root)
+        (new_files, new_dirrs) = (set(new_files), set(new_dirrs))
+        for x in new_files - files:
+            changes.add(x)
+        for x in files - new_files:
+            changes.remove(x)
+        self.dirs[path] = (level, new_files, new_dirrs)
+        for x in dirrs - new_dirrs:
+            self._drop_tree(x, changes)
+        for x in new_dirrs - dirrs:
+            self._add_tree(x, level + 1, changes)
+
+    def _keeps_file(self, name):
+        # Same filters as misc.list_directory, for a single new file.
+        if self.exclude and misc.match_globs(name, self.exclude):
+            return False
+        return not self.include or misc.match_globs(name, self.include)
+
+    def _keeps_dir(self, name, level):
+        # Same as _keeps_file, for a new directory at the given level.
+        if self.exclude and misc.match_globs(name, self.exclude):
+            return False
+        if self.depth is None:
+            return not os.path.islink(os.path.join(self.root, name))
+        return level < self.depth
+
+class PollingWatcher(DirectoryWatcher):
+    """
+    Finds changes by looking at the mtime of every directory every
+    interval seconds and listing again the ones that changed, or that
+    changed too recently for their mtime to be trusted, as in
+    dircache.DirCache. Only names coming and going are seen, not
+    writes to existing files.
+    """
+
+    def changes(self, timeout):
+        changes = Changes()
+        now = time.monotonic()
+        if now < self.next_poll:
+            time.sleep(min(timeout, self.next_poll - now))
+            if time.monotonic() < self.next_poll:
+                return changes
+        self.next_poll = time.monotonic() + self.interval
+        self._poll(list(self.dirs), changes)
+        return changes
+
+class InotifyWatcher(DirectoryWatcher):
+    """
+    Finds changes from the inotify events of every listed directory,
+    on Linux. Directories that can not be watched (once the limit of
+    watches is reached) are polled instead, and the whole tree is
+    listed again if the kernel drops events.
+    """
+
+    def __init__(self, root, depth=2, include=None, exclude=None, interval=POLL_INTERVAL):
+        super(InotifyWatcher, self).__init__(root, depth, include, exclude, interval)
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self.wds = {}           # path -> watch descriptor
+        self.paths = {}         # watch descriptor -> path
+        self.unwatched = set()
+
+    def changes(self, timeout):
+        changes = Changes()
+        if self.unwatched:
+            timeout = max(0, min(timeout, self.next_poll - time.monotonic()))
+        (readable, _, _) = select.select([self.fd], [], [], timeout)
+        if readable:
+            self._read_events(changes)
+        if self.unwatched and time.monotonic() >= self.next_poll:
+            self.next_poll = time.monotonic() + self.interval
+            self._poll(list(self.unwatched), changes)
+        return changes
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def _watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(os.path.join(self.root, path)), INOTIFY_MASK)
+        if wd < 0:
+            super(InotifyWatcher, self)._watch(path)
+            self.unwatched.add(path)
+            return
+        self.wds[path] = wd
+        self.paths[wd] = path
+
+    def _unwatch(self, path):
+        super(InotifyWatcher, self)._unwatch(path)
+        self.unwatched.discard(path)
+        wd = self.wds.pop(path, None)
+        if wd is not None and self.paths.get(wd) == path:
+            del self.paths[wd]
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def _read_events(self, changes):
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                return
+            i = 0
+            while i < len(data):
+                (wd, mask, cookie, n) = struct.unpack_from('iIII', data, i)
+                name = os.fsdecode(data[i+16:i+16+n].rstrip(b'\0'))
+                i += 16 + n
+                if mask & IN_Q_OVERFLOW:
+                    for path in list(self.dirs):
+                        if path in self.dirs:
+                            self._relist(path, changes)
+                    continue
+                path = self.paths.get(wd)
+                if mask & IN_IGNORED:
+                    if path is not None:
+                        del self.paths[wd]
+                        self.wds.pop(path, None)
+                    continue
+                if path is not None and path in self.dirs:
+                    self._apply_event(path, mask, name, changes)
+
+    def _apply_event(self, path, mask, name, changes):
+        (level, files, dirrs) = self.dirs[path]
+        x = name if path == '.' else os.path.join(path, name)
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            if x in files:
+                files.discard(x)
+                changes.remove(x)
+            elif x in dirrs:
+                dirrs.discard(x)
+                self._drop_tree(x, changes)
+        elif mask & (IN_CREATE | IN_MOVED_TO):
+            # Symbolic links carry no IN_ISDIR, so look at what they are.
+            full = os.path.join(self.root, x)
+            if mask & IN_ISDIR or os.path.isdir(full):
+                if x not in dirrs and self._keeps_dir(x, level + 1):
+                    dirrs.add(x)
+                    self._add_tree(x, level + 1, changes)
+            elif x not in files and os.path.isfile(full) and self._keeps_file(x):
+                files.add(x)
+                changes.add(x)
+        elif mask & IN_CLOSE_WRITE and x in files:
+            changes.write(x)
+
+def inotify_available():
+    """ () -> bool """
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        return hasattr(ctypes.CDLL(None), 'inotify_init1')
+    except OSError:
+        return False
+
+def open_watcher(root, depth=2, include=None, exclude=None, polling=False, interval=POLL_INTERVAL):
+    """ (str, ...) -> DirectoryWatcher
+
+    Returns an InotifyWatcher where inotify can be used, unless
+    polling is True, and a PollingWatcher otherwise.
+    """
+    if not polling and inotify_available():
+        try:
+            return InotifyWatcher(root, depth, include, exclude, interval)
+        except OSError:
+            pass
+    return PollingWatcher(root, depth, include, exclude, interval)
+
+class Watch(object):
+    """
+    A live FileList of a directory and the pairing of its test cases.
+
+    The directory is listed once, then kept up to date from the
+    changes found by a DirectoryWatcher. Without sifmt and sofmt, the
+    best known format pair is detected on the first listing, and again
+    whenever the number of files doubled or the files settled, until
+    a pair with test cases is found.
+
+    Methods:
+        __init__(self, path, sifmt=None, sofmt=None, alphabet=False, depth=2, ...)
+        events(self, settle=SETTLE_SECONDS, stop=None)
+        sort(self)
+        close(self)
+
+    Properties:
+        file_list (FileList)
+        sifmt, sofmt (Format or None)
+        pairing (Pairing or None)
+    """
+
+    def __init__(self, path, sifmt=None, sofmt=None, alphabet=False, depth=2, include=None, exclude=None,
+                 polling=False, interval=POLL_INTERVAL, rollback=False):
+        assert (sifmt is None) == (sofmt is None)
+        if os.path.isfile(path):
+            raise NotADirectoryError("Only directories can be watched: '{}'".format(path))
+        if not os.path.isdir(path):
+            raise FileNotFoundError("No such directory: '{}'".format(path))
+        FileList.recover_journal(path, rollback=rollback)
+        self.key = None if alphabet else misc.human_key
+        self.sifmt = sifmt
+        self.sofmt = sofmt
+        self.pairing = None
+        self.watcher = open_watcher(path, depth, include, exclude, polling, interval)
+        self.file_list = FileList((x for x in self.watcher.scan() if x != RenameJournal.NAME), root=path)
+        self.detected_at = 0
+
+    def __repr__(self):
+        return 'watch.Watch({!r}, {!r})'.format(self.file_list.root, self.pairing)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def events(self, settle=SETTLE_SECONDS, stop=None):
+        """ (self, float, ...) -> iterator
+
+        Yields the changes of the test cases as lists of events:
+            ('format', sifmt, sofmt) once a format pair is detected
+            ('pair', ifile, ofile) when a test case is complete
+            ('unpair', ifile, ofile) when one of its files goes
+            ('stable', num_test_cases) once no file came, went or was
+                written for settle seconds
+        The first list pairs the files already there. Stops when the
+        threading.Event stop is set.
+        """
+        events = self._start_pairing() if self.sifmt is not None else self._detect()
+        last = time.monotonic()
+        settled = False
+        while stop is None or not stop.is_set():
+            if events:
+                yield events
+                events = []
+            elapsed = time.monotonic() - last
+            if not settled and elapsed >= settle:
+                settled = True
+                if self.pairing is None:
+                    events = self._detect(force=True)
+                yield events + [('stable', self.num_test_cases)]
+                events = []
+                continue
+            timeout = STOP_INTERVAL if settled else min(STOP_INTERVAL, settle - elapsed)
+            changes = self.watcher.changes(timeout)
+            if changes:
+                events = self._apply(changes)
+                last = time.monotonic()
+                settled = False
+
+    @property
+    def num_test_cases(self):
+        return 0 if self.pairing is None else self.pairing.num_test_cases
+
+    def sort(self):
+        """ (self) -> None
+
+        Sorts the file list as open_file_list does, for convert.
+        """
+        self.file_list.files.sort(key=self.key)
+
+    def close(self):
+        """ (self) -> None """
+        self.watcher.close()
+
+    def _apply(self, changes):
+        files = self.file_list.files
+        events = []
+        for x in changes.removed:
+            if x != RenameJournal.NAME:
+                files.remove(x)
+                if self.pairing is not None:
+                    events.extend(self.pairing.remove(x))
+        for x in sorted(changes.added, key=self.key):
+            if x != RenameJournal.NAME:
+                files.append(x)
+                if self.pairing is not None:
+                    events.extend(self.pairing.add(x))
+        if self.pairing is None and len(files) >= 2 * self.detected_at:
+            events.extend(self._detect())
+        return events
+
+    def _detect(self, force=False):
+        files = self.file_list.files
+        if len(files) == 0 or (not force and len(files) < 2 * self.detected_at):
+            return []
+        self.detected_at = len(files)
+        (pair, ifiles, ofiles) = api.detect_format_pair(files)
+        if len(ifiles) == 0:
+            return []
+        self.sifmt, self.sofmt = pair.ifmt, pair.ofmt
+        return [('format', self.sifmt, self.sofmt)] + self._start_pairing()
+
+    def _start_pairing(self):
+        self.sort()
+        self.pairing = Pairing(self.sifmt, self.sofmt, self.file_list.files)
+        events = []
+        for x in self.file_list.files:
+            events.extend(self.pairing.add(x))
+        return events
@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import shutil
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+import concurrent.futures
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import api
+from testfmt.filelist import FileList
+from testfmt.format import Format
+
+
+class Killed(BaseException):
+    pass
+
+
+class TestApi(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        self.problems = []
+        for p in range(8):
+            problem = os.path.join(self.tmp, 'p{}'.format(p))
+            os.makedirs(os.path.join(problem, 'sub'))
+            for name in ['1.inp', '1.out', '2.inp', '2.out', 'sub/10.inp', 'sub/10.out']:
+                with open(os.path.join(problem, name), 'w') as fp:
+                    fp.write(name)
+            self.problems.append(problem)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_detect(self):
+        result = api.detect(self.problems[0])
+        self.assertEqual(str(result.sifmt), '*.inp')
+        self.assertEqual(result.ifiles, ['1.inp', '2.inp', 'sub/10.inp'])
+        self.assertEqual(result.ofiles, ['1.out', '2.out', 'sub/10.out'])
+        self.assertEqual(os.getcwd(), self.cwd)
+
+    def test_results_are_lists(self):
+        result = api.detect(self.problems[0], duplicates=True)
+        report = api.convert(self.problems[1], preview=True)
+        self.assertEqual(json.loads(json.dumps({'ifiles': result.ifiles, 'ofiles': result.ofiles})), {
+            'ifiles': ['1.inp', '2.inp', 'sub/10.inp'], 'ofiles': ['1.out', '2.out', 'sub/10.out']})
+        self.assertEqual(json.loads(json.dumps([report.src, report.dst, report.plan, report.detected.ifiles])), [
+            ['1.inp', '1.out', '2.inp', '2.out', 'sub/10.inp', 'sub/10.out'],
+            ['00.in', '00.ok', '01.in', '01.ok', '02.in', '02.ok'],
+            [['1.inp', '1.out', '2.inp', '2.out', 'sub/10.inp', 'sub/10.out'],
+             ['00.in', '00.ok', '01.in', '01.ok', '02.in', '02.ok']],
+            ['1.inp', '2.inp', 'sub/10.inp']])
+        self.assertEqual(result.ofiles.index('2.out'), 1)
+        report = api.convert_shards(api.open_file_list(self.tmp, depth=None), preview=True)
+        for shard, shard_report in report.shards:
+            json.dumps([shard_report.src, shard_report.dst, shard_report.detected.ofiles])
+
+    def test_iter_file_list(self):
+        for alphabet in [False, True]:
+            self.assertEqual(list(api.iter_file_list(self.problems[0], alphabet=alphabet)),
+                             api.open_file_list(self.problems[0], alphabet=alphabet).files)
+        with self.assertRaises(FileNotFoundError):
+            list(api.iter_file_list(os.path.join(self.tmp, 'missing')))
+
+    def test_preview(self):
+        report = api.convert(self.problems[0], preview=True)
+        self.assertTrue(report.success)
+        self.assertEqual(report.dst, ['00.in', '00.ok', '01.in', '01.ok', '02.in', '02.ok'])
+        self.assertTrue(os.path.isfile(os.path.join(self.problems[0], '1.inp')))
+
+    def test_failed_check_changes_nothing(self):
+        report = api.convert(self.problems[0], difmt=Format.from_string('*.x'),
+                             dofmt=Format.from_string('*.x'))
+        self.assertFalse(report.checked)
+        self.assertFalse(report.success)
+        self.assertIsNone(report.plan)
+        self.assertTrue(os.path.isfile(os.path.join(self.problems[0], '1.inp')))
+
+    def test_convert_from_many_threads(self):
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            reports = list(executor.map(api.convert, self.problems))
+        self.assertTrue(all(report.success for report in reports))
+        for problem in self.problems:
+            self.assertEqual(sorted(os.listdir(problem)),
+                             ['00.in', '00.ok', '01.in', '01.ok', '02.in', '02.ok'])
+            with open(os.path.join(problem, '02.ok')) as fp:
+                self.assertEqual(fp.read(), 'sub/10.out')
+        self.assertEqual(os.getcwd(), self.cwd)
+
+    def test_convert_zip(self):
+        path = os.path.join(self.tmp, 'p0.zip')
+        shutil.make_archive(path[:-4], 'zip', self.problems[0])
+        report = api.convert(path, quiet=True)
+        self.assertTrue(report.success)
+        with zipfile.ZipFile(path) as z:
+            self.assertEqual(z.read('02.in'), b'sub/10.inp')
+
+    def test_pending_journal_is_only_recovered_by_convert(self):
+        problem = self.problems[0]
+        really_renames = FileList.really_renames
+        def killed_after_one(file_list, src, dst):
+            if os.path.isfile(os.path.join(problem, '00.in')):
+                raise Killed()
+            return really_renames(file_list, src, dst)
+        file_list = FileList(['1.inp', '1.out'], root=problem)
+        with mock.patch.object(FileList, 'really_renames', killed_after_one):
+            self.assertRaises(Killed, file_list.move_files_planned,
+                              ['1.inp', '1.out'], ['00.in', '00.ok'], real=True, quiet=True)
+        names = sorted(os.listdir(problem))
+        self.assertEqual(api.open_file_list(problem).pending_journals, [''])
+        api.detect(problem)
+        list(api.iter_file_list(problem))
+        api.convert(problem, preview=True)
+        self.assertEqual(sorted(os.listdir(problem)), names)
+        self.assertTrue(api.convert(problem, rollback=True).success)
+        self.assertFalse(api.open_file_list(problem).pending_journals)
+        self.assertEqual(api.detect(problem).ifiles, ['00.in', '01.in', '02.in'])
+
+    def test_missing_path(self):
+        self.assertRaises(FileNotFoundError, api.detect, os.path.join(self.tmp, 'missing'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import shutil
+import asyncio
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt.filelist import FileList
+from testfmt.asyncapi import AsyncRunner
+
+
+class TestAsyncRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.problems = []
+        for p in range(12):
+            problem = os.path.join(self.tmp, 'p{}'.format(p))
+            os.makedirs(problem)
+            for i in range(1, 21):
+                for ext in ['.inp', '.out']:
+                    open(os.path.join(problem, str(i) + ext), 'w').close()
+            self.problems.append(problem)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_concurrent_detect_and_convert(self):
+        async def main():
+            async with AsyncRunner(max_workers=4) as runner:
+                results = await asyncio.gather(*map(runner.detect, self.problems))
+                reports = await asyncio.gather(*map(runner.convert, self.problems))
+            return results, reports
+        results, reports = asyncio.run(main())
+        self.assertEqual([x.num_test_cases for x in results], [20] * len(self.problems))
+        self.assertTrue(all(x.success for x in reports))
+        self.assertIn('19.ok', os.listdir(self.problems[-1]))
+
+    def test_cancel_rolls_back(self):
+        problem = self.problems[0]
+        before = sorted(os.listdir(problem))
+        really_renames = FileList.really_renames
+        def slow_renames(self, src, dst):
+            time.sleep(0.005)
+            return really_renames(self, src, dst)
+
+        async def main():
+            async with AsyncRunner() as runner:
+                task = asyncio.ensure_future(runner.convert(problem))
+                await asyncio.sleep(0.05)
+                task.cancel()
+                await task
+
+        FileList.really_renames = slow_renames
+        try:
+            self.assertRaises(asyncio.CancelledError, asyncio.run, main())
+        finally:
+            FileList.really_renames = really_renames
+        self.assertEqual(sorted(os.listdir(problem)), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import misc
+from testfmt import testfmt5
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        for problem in ['p1', 'p2']:
+            for name in ['1.inp', '1.out', '2.inp', '2.out']:
+                path = os.path.join(self.tmp, problem, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, 'w').close()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    def options(self, **kwargs):
+        options = dict(sifmt=None, sofmt=None, difmt=None, dofmt=None,
+                       alphabet=False, simple=True, preview=False)
+        options.update(kwargs)
+        return options
+
+    def test_run_target_keeps_working_directory(self):
+        path = os.path.join(self.tmp, 'p1')
+        self.assertEqual(testfmt5.run_target(path, detect=True, **self.options()),
+                         (path, 0, '1.inp\n1.out\n2.inp\n2.out\n'))
+        self.assertEqual(os.getcwd(), self.cwd)
+
+    def test_run_target_reports_errors(self):
+        path, status, output = testfmt5.run_target(
+            os.path.join(self.tmp, 'missing'), **self.options())
+        self.assertEqual(status, 2)
+        self.assertIn('FileNotFoundError', output)
+
+    def test_run_batch(self):
+        manifest = os.path.join(self.tmp, 'manifest.txt')
+        with open(manifest, 'w') as fp:
+            fp.write('# problems\np2\n\n')
+        paths = [os.path.join(self.tmp, 'p1')] + misc.read_manifest(manifest)
+        results = list(testfmt5.run_batch(paths, jobs=2, **self.options()))
+        self.assertEqual([(x[0], x[1]) for x in results], [(x, 0) for x in paths])
+        for path in paths:
+            self.assertEqual(sorted(os.listdir(path)), ['00.in', '00.ok', '01.in', '01.ok'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import bench
+
+
+class TestBench(unittest.TestCase):
+
+    def test_make_names(self):
+        self.assertEqual(bench.make_names('in.*|ans.*', 4), (['in.1', 'in.2'], ['ans.1', 'ans.2']))
+
+    def test_run_benchmarks(self):
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                data = bench.run_benchmarks([20], ['*|*.a', 'debug.in.*|debug.out.*'])
+            finally:
+                sys.stdout = stdout
+        stages = [x['stage'] for x in data['results'] if x['scheme'] == '*|*.a']
+        self.assertEqual(stages, [
+            'sort_human_key', 'sort_cmp_human', 'file_list', 'get_ifiles_ofiles', 'best_format_pair',
+            'move_files_indirectly', 'convert_preview', 'get_file_list_recursively', 'convert',
+            'list', 'apply_changes', 'apply_changes_in_place'])
+        self.assertTrue(all(x['peak_bytes'] is not None for x in data['results']))
+
+    def test_compare_results(self):
+        def results(seconds):
+            return {'results': [{'layout': 'dir', 'scheme': '*.in|*.ok', 'size': 10,
+                                 'stage': 'convert', 'seconds': seconds}]}
+        self.assertFalse(bench.compare_results(results(1.0), results(1.2))[0][3])
+        self.assertTrue(bench.compare_results(results(1.0), results(1.3))[0][3])
+        self.assertFalse(bench.compare_results(results(0.001), results(0.005))[0][3])
+        self.assertEqual(bench.compare_results(results(1.0), {'results': []}), [])
+
+    def test_lazy_imports(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            for name in ['1.in', '1.out', '2.in', '2.out']:
+                open(os.path.join(tmp, name), 'w').close()
+            os.makedirs(os.path.join(tmp, 'sub'))
+            modules = bench.imported_modules(['detect', tmp])
+        finally:
+            shutil.rmtree(tmp)
+        self.assertIn('testfmt.testfmt5', modules)
+        self.assertEqual([x for x in modules if x.split('.')[0] in bench.LAZY_MODULES
+                          or x.startswith('concurrent.futures')], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import sys
+import errno
+import shutil
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import api
+from testfmt import filelist
+from testfmt.format import Format
+
+
+FILES = {'1.inp': 'a', '1.out': 'x', '2.inp': 'b', '2.out': 'y', '3.inp': 'a', '3.out': 'x',
+         'checker.cpp': 'int main() {}'}
+
+
+class TestCopyConvert(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp, 'src')
+        os.makedirs(self.src)
+        for name, text in FILES.items():
+            with open(os.path.join(self.src, name), 'w') as fp:
+                fp.write(text)
+        self.src_zip = os.path.join(self.tmp, 'src.zip')
+        with zipfile.ZipFile(self.src_zip, 'w', zipfile.ZIP_DEFLATED) as z:
+            for name, text in sorted(FILES.items()):
+                z.writestr(name, text * 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, *names):
+        return os.path.join(self.tmp, *names)
+
+    def assertSourceUntouched(self):
+        self.assertEqual(sorted(os.listdir(self.src)), sorted(FILES))
+        with zipfile.ZipFile(self.src_zip) as z:
+            self.assertEqual(sorted(z.namelist()), sorted(FILES))
+
+    def test_directory_to_directory(self):
+        report = api.convert(self.src, dest=self.path('dst'), link='hardlink')
+        self.assertTrue(report.success)
+        self.assertEqual(sorted(os.listdir(self.path('dst'))), [
+            '00.in', '00.ok', '01.in', '01.ok', '02.in', '02.ok', 'checker.cpp'])
+        self.assertTrue(os.path.samefile(self.path('src', '2.out'), self.path('dst', '01.ok')))
+        self.assertSourceUntouched()
+
+    def test_copy_mode(self):
+        report = api.convert(self.src, dest=self.path('dst'), link='copy')
+        self.assertTrue(report.success)
+        self.assertFalse(os.path.samefile(self.path('src', '2.out'), self.path('dst', '01.ok')))
+        with open(self.path('dst', '01.ok')) as fp:
+            self.assertEqual(fp.read(), 'y')
+
+    def test_directory_to_zip(self):
+        report = api.convert(self.src, dest=self.path('dst.zip'))
+        self.assertTrue(report.success)
+        with zipfile.ZipFile(self.path('dst.zip')) as z:
+            self.assertEqual(z.read('02.in'), b'a')
+            self.assertEqual(len(z.namelist()), 7)
+        self.assertSourceUntouched()
+
+    def test_zip_to_zip(self):
+        report = api.convert(self.src_zip, dest=self.path('dst.zip'))
+        self.assertTrue(report.success)
+        with zipfile.ZipFile(self.src_zip) as src, zipfile.ZipFile(self.path('dst.zip')) as dst:
+            self.assertEqual(dst.getinfo('01.ok').compress_size, src.getinfo('2.out').compress_size)
+            self.assertEqual(dst.read('01.ok'), b'y' * 100)
+        self.assertSourceUntouched()
+
+    def test_zip_to_directory(self):
+        report = api.convert(self.src_zip, dest=self.path('dst'))
+        self.assertTrue(report.success)
+        with open(self.path('dst', '00.ok')) as fp:
+            self.assertEqual(fp.read(), 'x' * 100)
+
+    def test_drop_duplicates(self):
+        report = api.convert(self.src, dest=self.path('dst'), drop_duplicates=True)
+        self.assertTrue(report.success)
+        self.assertEqual(sorted(os.listdir(self.path('dst'))), [
+            '00.in', '00.ok', '01.in', '01.ok', 'checker.cpp'])
+        self.assertSourceUntouched()
+
+    def test_name_conflict(self):
+        report = api.convert(self.src, dest=self.path('dst'),
+                             sifmt=Format.from_string('*.inp'), sofmt=Format.from_string('*.out'),
+                             difmt=Format.from_string('*.cpp'), dofmt=Format.from_string('*.ok'))
+        self.assertTrue(report.success)
+        os.rename(self.path('src', '3.inp'), self.path('src', 'checker.inp'))
+        os.rename(self.path('src', '3.out'), self.path('src', 'checker.out'))
+        report = api.convert(self.src, dest=self.path('dst2'),
+                             sifmt=Format.from_string('*.inp'), sofmt=Format.from_string('*.out'),
+                             difmt=Format.from_string('*.cpp'), dofmt=Format.from_string('*.ok'))
+        self.assertFalse(report.checked)
+        self.assertFalse(os.path.exists(self.path('dst2')))
+
+    def test_existing_destination(self):
+        os.makedirs(self.path('dst'))
+        report = api.convert(self.src, dest=self.path('dst'))
+        self.assertTrue(report.checked)
+        self.assertFalse(report.success)
+        self.assertEqual(os.listdir(self.path('dst')), [])
+
+    def test_failure_removes_partial_copy(self):
+        with mock.patch.object(filelist, 'copy_file_data', side_effect=OSError(errno.ENOSPC, 'full')):
+            report = api.convert(self.src, dest=self.path('dst'), link='copy')
+        self.assertFalse(report.success)
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['src', 'src.zip'])
+
+    def test_hostile_member_name(self):
+        hostile = self.path('hostile.zip')
+        for name in ('../../escaped.txt', '/tmp/escaped.txt', 'sub/../../escaped.txt'):
+            shutil.copy(self.src_zip, hostile)
+            with zipfile.ZipFile(hostile, 'a') as z:
+                z.writestr(name, 'evil')
+            report = api.convert(hostile, dest=self.path('dst'))
+            self.assertFalse(report.success)
+            self.assertFalse(os.path.exists(os.path.join(os.path.dirname(self.tmp), 'escaped.txt')))
+            self.assertFalse(os.path.exists('/tmp/escaped.txt'))
+            self.assertEqual(sorted(os.listdir(self.tmp)), ['hostile.zip', 'src', 'src.zip'])
+
+    def test_copy_destination(self):
+        self.assertEqual(filelist.copy_destination(self.tmp, 'a/b'), self.path('a', 'b'))
+        os.symlink('..', self.path('up'))
+        for name in ('../x', '/x', 'a/../../x', 'up/x'):
+            with self.assertRaises(OSError):
+                filelist.copy_destination(self.tmp, name)
+
+    def test_linker_fallback(self):
+        linker = filelist.FileLinker()
+        with mock.patch.object(filelist, 'reflink_file', side_effect=OSError(errno.EOPNOTSUPP, 'no')) as reflink:
+            self.assertEqual(linker.link(self.path('src', '1.inp'), self.path('a')), 'hardlink')
+            self.assertEqual(linker.link(self.path('src', '1.out'), self.path('b')), 'hardlink')
+        self.assertEqual(reflink.call_count, 1)
+        with self.assertRaises(FileExistsError):
+            linker.link(self.path('src', '1.out'), self.path('b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
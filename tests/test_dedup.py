@@ -0,0 +1,113 @@
+import os
+import sys
+import shutil
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import api
+from testfmt import dedup
+from testfmt.filelist import FileList, ZipFileList
+
+
+CONTENTS = {
+    '1.inp': 'a', '1.out': 'x',
+    '2.inp': 'b', '2.out': 'x',
+    '3.inp': 'a', '3.out': 'x',
+    '4.inp': 'c', '4.out': 'y',
+    '5.inp': 'b', '5.out': 'x',
+    '6.inp': 'a', '6.out': 'z',
+}
+IFILES = ['{}.inp'.format(i) for i in range(1, 7)]
+OFILES = ['{}.out'.format(i) for i in range(1, 7)]
+
+
+class TestFindDuplicateTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dirr = os.path.join(self.tmp, 'p')
+        os.makedirs(self.dirr)
+        for name, text in CONTENTS.items():
+            path = os.path.join(self.dirr, name)
+            with open(path, 'w') as fp:
+                fp.write(text)
+            os.utime(path, ns=(10**18, 10**18))
+        self.zip_path = os.path.join(self.tmp, 'p.zip')
+        with zipfile.ZipFile(self.zip_path, 'w') as z:
+            for name, text in sorted(CONTENTS.items()):
+                z.writestr(name, text)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_directory(self):
+        file_list = FileList(sorted(CONTENTS), root=self.dirr)
+        groups = dedup.find_duplicate_tests(file_list, IFILES, OFILES)
+        self.assertEqual(groups, [[0, 2], [1, 4]])
+
+    def test_zip(self):
+        file_list = ZipFileList(self.zip_path)
+        groups = dedup.find_duplicate_tests(file_list, IFILES, OFILES)
+        self.assertEqual(groups, [[0, 2], [1, 4]])
+
+    def test_size_prefilter(self):
+        with open(os.path.join(self.dirr, '4.inp'), 'w') as fp:
+            fp.write('longer')
+        file_list = FileList(sorted(CONTENTS), root=self.dirr)
+        with mock.patch.object(dedup, 'hash_stream', wraps=dedup.hash_stream) as hash_stream:
+            dedup.find_duplicate_tests(file_list, IFILES, OFILES)
+        self.assertEqual(hash_stream.call_count, 10)
+
+    def test_hash_cache(self):
+        cache_path = os.path.join(self.tmp, 'hashes.json')
+        file_list = FileList(sorted(CONTENTS), root=self.dirr)
+        dedup.find_duplicate_tests(file_list, IFILES, OFILES, cache=dedup.HashCache(cache_path))
+
+        cache = dedup.HashCache(cache_path)
+        self.assertEqual(cache.entries, {})
+        dedup.find_duplicate_tests(file_list, IFILES, OFILES, cache=cache)
+        cache.save()
+
+        cache = dedup.HashCache(cache_path)
+        with mock.patch.object(dedup, 'hash_stream') as hash_stream:
+            groups = dedup.find_duplicate_tests(file_list, IFILES, OFILES, cache=cache)
+        self.assertEqual(hash_stream.call_count, 0)
+        self.assertEqual(groups, [[0, 2], [1, 4]])
+
+        path = os.path.join(self.dirr, '3.inp')
+        with open(path, 'w') as fp:
+            fp.write('d')
+        os.utime(path, ns=(2 * 10**18, 2 * 10**18))
+        groups = dedup.find_duplicate_tests(file_list, IFILES, OFILES, cache=cache)
+        self.assertEqual(groups, [[1, 4]])
+
+    def test_racy_files_not_cached(self):
+        path = os.path.join(self.dirr, '1.inp')
+        os.utime(path)
+        cache = dedup.HashCache(os.path.join(self.tmp, 'hashes.json'))
+        file_list = FileList(sorted(CONTENTS), root=self.dirr)
+        dedup.find_duplicate_tests(file_list, IFILES, OFILES, cache=cache)
+        self.assertNotIn(os.path.abspath(path), cache.entries)
+        self.assertIn(os.path.abspath(os.path.join(self.dirr, '3.inp')), cache.entries)
+
+    def test_convert_drop_duplicates(self):
+        report = api.convert(self.dirr, drop_duplicates=True)
+        self.assertTrue(report.success)
+        self.assertEqual(report.dropped, [('3.inp', '3.out'), ('5.inp', '5.out')])
+        self.assertEqual(report.num_test_cases, 4)
+        self.assertEqual(sorted(os.listdir(self.dirr)), [
+            '00.in', '00.ok', '01.in', '01.ok', '02.in', '02.ok', '03.in', '03.ok',
+            '3.inp', '3.out', '5.inp', '5.out'])
+
+    def test_detect_duplicates(self):
+        result = api.detect(self.zip_path, duplicates=True)
+        self.assertEqual(result.duplicates, [[0, 2], [1, 4]])
+        self.assertIsNone(api.detect(self.zip_path).duplicates)
+
+
+if __name__ == '__main__':
+    unittest.main()
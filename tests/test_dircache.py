@@ -0,0 +1,111 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import threading
+import concurrent.futures
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import misc
+from testfmt import dircache
+from testfmt.filelist import FileList
+
+
+class TestDirCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, 'tests')
+        self.cache_path = os.path.join(self.tmp, 'cache', 'dircache.json')
+        for path in ['1.in', '1.ok', 'a/2.in', 'a/2.ok', 'b/3.in']:
+            path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+        self.age()
+        os.chdir(self.root)
+
+        self.scanned = []
+        self.scan = misc.get_file_list_and_dirr_list
+        def counting_scan(path, root='.'):
+            self.scanned.append(path)
+            return self.scan(path, root=root)
+        misc.get_file_list_and_dirr_list = counting_scan
+
+    def tearDown(self):
+        misc.get_file_list_and_dirr_list = self.scan
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    def age(self):
+        for d in ['', 'a', 'b']:
+            os.utime(os.path.join(self.root, d), (1e9, 1e9))
+
+    def list_files(self):
+        cache = dircache.DirCache(self.cache_path)
+        file_list = FileList.from_working_directory(cache=cache)
+        cache.save()
+        return file_list
+
+    def test_unchanged_directories_are_not_read(self):
+        files = self.list_files().files
+        self.assertEqual(len(self.scanned), 3)
+        self.scanned = []
+        self.assertEqual(self.list_files().files, files)
+        self.assertEqual(self.scanned, [])
+
+    def test_changed_directory_is_read_again(self):
+        self.list_files()
+        open(os.path.join('a', '4.in'), 'w').close()
+        os.utime('a', (2e9, 2e9))
+        self.scanned = []
+        self.assertIn('a/4.in', self.list_files().files)
+        self.assertEqual(self.scanned, ['a'])
+
+    def test_recent_directories_are_not_cached(self):
+        os.utime('b')
+        self.list_files()
+        self.scanned = []
+        self.list_files()
+        self.assertEqual(self.scanned, ['b'])
+
+    def test_renames_invalidate(self):
+        cache = dircache.DirCache(self.cache_path)
+        file_list = FileList.from_working_directory(cache=cache)
+        self.assertTrue(file_list.move_file('a/2.in', 'b/2.in', real=True, quiet=True))
+        self.age()
+        cache.save()
+        self.scanned = []
+        files = self.list_files().files
+        self.assertEqual(sorted(self.scanned), ['.', 'a', 'b'])
+        self.assertIn('b/2.in', files)
+        self.assertNotIn('a/2.in', files)
+
+    def test_eviction(self):
+        cache = dircache.DirCache(self.cache_path, max_entries=2)
+        for path in ['.', 'b', 'a']:
+            cache.list(path)
+        cache.save()
+        self.assertEqual(sorted(dircache.DirCache(self.cache_path).entries),
+                         [os.path.join(self.root, 'a'), os.path.join(self.root, 'b')])
+
+    def test_concurrent_saves(self):
+        # Instances of the same path saving from several threads.
+        caches = [dircache.DirCache(self.cache_path) for i in range(8)]
+        for cache in caches:
+            cache.list('.')
+        barrier = threading.Barrier(len(caches))
+        def save(cache):
+            barrier.wait()
+            for i in range(20):
+                cache.save()
+        with concurrent.futures.ThreadPoolExecutor(len(caches)) as executor:
+            list(executor.map(save, caches))
+        self.assertEqual(os.listdir(os.path.dirname(self.cache_path)), ['dircache.json'])
+        self.assertEqual(list(dircache.DirCache(self.cache_path).entries), [self.root])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt.filelist import BaseFileList, FileList, RenameJournal
+
+
+class ListFileList(BaseFileList):
+    """ The original list-based move_file, kept as an oracle. """
+
+    def move_file(self, src, dst, real=False, quiet=False):
+        if src == dst:
+            return src in self.files
+        if (src not in self.files) or (dst in self.files):
+            return False
+        self.files[self.files.index(src)] = dst
+        return True
+
+
+class TestMoveFiles(unittest.TestCase):
+
+    def test_files_setter_reindexes(self):
+        file_list = BaseFileList(['a', 'b'])
+        file_list.files = ['c', 'd']
+        self.assertFalse(file_list.move_file('a', 'x', quiet=True))
+        self.assertTrue(file_list.move_file('c', 'x', quiet=True))
+        self.assertEqual(file_list.files, ['x', 'd'])
+
+    def test_duplicates(self):
+        file_list = BaseFileList(['a', 'b', 'a'])
+        self.assertTrue(file_list.move_file('a', 'c', quiet=True))
+        self.assertFalse(file_list.move_file('b', 'a', quiet=True))
+        self.assertTrue(file_list.move_file('a', 'd', quiet=True))
+        self.assertTrue(file_list.move_file('b', 'a', quiet=True))
+        self.assertEqual(file_list.files, ['c', 'a', 'd'])
+
+    def test_matches_reference_on_random_moves(self):
+        rng = random.Random(20240103)
+        names = [str(i) for i in range(12)]
+        for _ in range(300):
+            files = [rng.choice(names) for _ in range(rng.randrange(10))]
+            n = rng.randrange(8)
+            src = [rng.choice(names) for _ in range(n)]
+            dst = [rng.choice(names) for _ in range(n)]
+            for method in ['move_files_best_effort', 'move_files_directly',
+                           'move_files_indirectly']:
+                fast, slow = BaseFileList(files), ListFileList(files)
+                try:
+                    expected = getattr(slow, method)(src, dst, quiet=True)
+                except RuntimeError:
+                    self.assertRaises(RuntimeError, getattr(fast, method),
+                                      src, dst, quiet=True)
+                    continue
+                self.assertEqual(getattr(fast, method)(src, dst, quiet=True),
+                                 expected, (files, src, dst, method))
+                self.assertEqual(fast.files, slow.files)
+
+
+class CountingFileList(BaseFileList):
+
+    def __init__(self, files):
+        super(CountingFileList, self).__init__(files)
+        self.renames = 0
+
+    def really_renames(self, src, dst):
+        self.renames += 1
+        return True
+
+
+class TestPlanMoves(unittest.TestCase):
+
+    def test_chain_needs_no_intermediate_name(self):
+        file_list = BaseFileList(['1', '2', '3'])
+        self.assertEqual(file_list.plan_moves(['1', '2', '3'], ['2', '3', '4']),
+                         (['3', '2', '1'], ['4', '3', '2']))
+
+    def test_cycle_uses_one_intermediate_name(self):
+        file_list = CountingFileList(['a', 'b', 'c', 'd'])
+        src, dst = ['a', 'b', 'c', 'd'], ['b', 'a', 'd', 'c']
+        self.assertTrue(file_list.move_files_planned(src, dst, real=True, quiet=True))
+        self.assertEqual(file_list.files, ['b', 'a', 'd', 'c'])
+        self.assertEqual(file_list.renames, 6)
+
+    def test_invalid_moves(self):
+        file_list = BaseFileList(['a', 'b', 'c'])
+        self.assertIsNone(file_list.plan_moves(['a', 'x'], ['d', 'e']))
+        self.assertIsNone(file_list.plan_moves(['a', 'a'], ['d', 'e']))
+        self.assertIsNone(file_list.plan_moves(['a', 'b'], ['d', 'd']))
+        self.assertIsNone(file_list.plan_moves(['a'], ['c']))
+
+    def test_matches_indirect_moves(self):
+        rng = random.Random(20240104)
+        names = [str(i) for i in range(12)]
+        for _ in range(300):
+            files = rng.sample(names, rng.randrange(10))
+            n = rng.randrange(len(files) + 1)
+            src = rng.sample(files, n)
+            dst = [rng.choice(names) for _ in range(n)]
+            if rng.randrange(2):
+                dst = rng.sample(names, n)
+            planned, indirect = CountingFileList(files), BaseFileList(files)
+            expected = indirect.move_files_indirectly(src, dst, quiet=True)
+            self.assertEqual(planned.move_files_planned(src, dst, real=True, quiet=True),
+                             expected, (files, src, dst))
+            self.assertEqual(planned.files, indirect.files)
+            if expected:
+                self.assertLessEqual(planned.renames, n + n // 2)
+
+
+class Killed(BaseException):
+    pass
+
+
+class KilledFileList(FileList):
+    """ Dies like a killed process after a number of renames. """
+
+    def __init__(self, files, root, kill_after):
+        super(KilledFileList, self).__init__(files, root=root)
+        self.kill_after = kill_after
+
+    def really_renames(self, src, dst):
+        if self.kill_after == 0:
+            raise Killed()
+        self.kill_after -= 1
+        return super(KilledFileList, self).really_renames(src, dst)
+
+
+class TestRenameJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.files = ['{}.{}'.format(i, ext) for i in range(1, 8) for ext in ['in', 'ok']]
+        for name in self.files:
+            with open(os.path.join(self.tmp, name), 'w') as fp:
+                fp.write(name)
+        # A chain into a new directory and a cycle through a temporary name.
+        self.src = ['1.in', '1.ok', '2.in', '2.ok', '3.in', '4.in', '5.in', '6.ok', '7.in']
+        self.dst = ['a/1.in', 'a/1.ok', '1.in', '1.ok', '4.in', '3.in', '6.ok', '7.in', '5.in']
+        self.batch = RenameJournal.BATCH
+        RenameJournal.BATCH = 2
+
+    def tearDown(self):
+        RenameJournal.BATCH = self.batch
+        shutil.rmtree(self.tmp)
+
+    def contents(self):
+        rslt = {}
+        for d, dirrs, files in os.walk(self.tmp):
+            for name in files:
+                path = os.path.join(d, name)
+                with open(path) as fp:
+                    rslt[os.path.relpath(path, self.tmp)] = fp.read()
+        return rslt
+
+    def expected(self):
+        rslt = {x: x for x in self.files}
+        moved = {self.dst[i]: rslt.pop(self.src[i]) for i in range(len(self.src))}
+        rslt.update(moved)
+        return rslt
+
+    def test_journal_is_removed(self):
+        file_list = FileList(self.files, root=self.tmp)
+        self.assertTrue(file_list.move_files_planned(self.src, self.dst, real=True, quiet=True))
+        self.assertEqual(self.contents(), self.expected())
+
+    def test_resume_or_rollback_after_kill(self):
+        original = self.contents()
+        n = len(BaseFileList(self.files).plan_moves(self.src, self.dst)[0])
+        for kill_after in range(n):
+            for rollback in [False, True]:
+                file_list = KilledFileList(self.files, self.tmp, kill_after)
+                self.assertRaises(Killed, file_list.move_files_planned,
+                                  self.src, self.dst, real=True, quiet=True)
+                self.assertIn(RenameJournal.NAME, os.listdir(self.tmp))
+                self.assertTrue(FileList.recover_journal(self.tmp, rollback=rollback))
+                if rollback:
+                    self.assertEqual(self.contents(), original)
+                else:
+                    self.assertEqual(self.contents(), self.expected())
+                    file_list = FileList(self.expected(), root=self.tmp)
+                    self.assertTrue(file_list.move_files_planned(
+                        self.dst, self.src, real=True, quiet=True))
+                self.assertFalse(FileList.recover_journal(self.tmp))
+
+    def test_incomplete_plan_is_ignored(self):
+        with open(os.path.join(self.tmp, RenameJournal.NAME), 'w') as fp:
+            fp.write('{"version": 1, "moves": 3}\n["1.in", "x", 1]\n')
+        self.assertTrue(FileList.recover_journal(self.tmp))
+        self.assertEqual(self.contents(), {x: x for x in self.files})
+        self.assertNotIn(RenameJournal.NAME, FileList.from_directory(self.tmp).files)
+
+
+if __name__ == '__main__':
+    unittest.main()
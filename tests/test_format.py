@@ -0,0 +1,39 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import format
+from testfmt.format import Format
+
+
+class TestCompiledFormat(unittest.TestCase):
+
+    def test_matches_format_methods(self):
+        rng = random.Random(20240109)
+        formats = list(map(Format.from_string, [
+            '*', 'a*a', '*.in', 't*.in', 'in.*', '*00*.in', '.*.', 'a*0001*b']))
+        texts = [''.join(rng.choice('ab.int\n*') for _ in range(rng.randrange(7)))
+                 for _ in range(500)]
+        for fmt in formats:
+            compiled = fmt.compile()
+            self.assertEqual(compiled.match_list(texts), [fmt.match(x) for x in texts])
+            self.assertEqual(compiled.infix_list(texts),
+                             [fmt.infix(x) if fmt.match(x) else None for x in texts])
+            self.assertEqual(compiled.text_list(texts),
+                             [fmt.text(texts[i], i) for i in range(len(texts))])
+            self.assertEqual(compiled.text_list(texts, numbered=False),
+                             [fmt.text(x) for x in texts])
+
+    def test_convert_format_list(self):
+        self.assertEqual(format.convert_format_list(
+            ['1.inp', '2.inp', '10.inp'], Format.from_string('*.inp'), Format.from_string('*01*.in')),
+            ['01.in', '02.in', '03.in'])
+        self.assertRaises(AssertionError, format.convert_format_list,
+                          ['1.out'], Format.from_string('*.inp'), Format.from_string('*.in'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import shutil
+import zipfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import api
+from testfmt import instrument
+
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dirr = os.path.join(self.tmp, 'p')
+        os.makedirs(os.path.join(self.dirr, 'sub'))
+        for name in ['1.inp', '1.out', '2.inp', '2.out']:
+            with open(os.path.join(self.dirr, name), 'w') as fp:
+                fp.write(name)
+        self.zip_path = os.path.join(self.tmp, 'p.zip')
+        with zipfile.ZipFile(self.zip_path, 'w') as z:
+            for name in ['1.inp', '1.out']:
+                z.writestr(name, '0123456789')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_convert_directory(self):
+        with instrument.Profiler() as profiler:
+            api.convert(self.dirr)
+        stages = profiler.stages
+        self.assertEqual(list(stages), ['list', 'sort', 'detect', 'plan', 'rename'])
+        self.assertEqual(stages['list']['listdir'], 2)
+        self.assertEqual(stages['rename']['rename'], 4)
+        self.assertEqual(stages['plan']['rename'], 0)
+        self.assertTrue(all(x['calls'] == 1 for x in stages.values()))
+
+    def test_convert_zip(self):
+        with instrument.Profiler() as profiler:
+            api.convert(self.zip_path)
+        stages = profiler.stages
+        self.assertEqual(stages['zip_rewrite']['bytes_read'], 20)
+        self.assertGreater(stages['zip_rewrite']['bytes_written'], 20)
+        self.assertEqual(stages['rename']['bytes_read'], 20)
+
+    def test_hook(self):
+        calls = []
+        def hook(name, stats):
+            calls.append((name, sorted(stats)))
+        instrument.add_hook(hook)
+        try:
+            api.detect(self.dirr)
+        finally:
+            instrument.remove_hook(hook)
+        api.detect(self.dirr)
+        keys = sorted(('seconds',) + instrument.COUNTERS)
+        self.assertEqual(calls, [('list', keys), ('sort', keys), ('detect', keys)])
+
+    def test_no_hooks(self):
+        before = instrument.snapshot()
+        api.convert(self.dirr)
+        self.assertEqual(instrument.snapshot(), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import os
+import sys
+import random
+import shutil
+import io
+import functools
+import tempfile
+import unittest
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import misc
+from testfmt import testfmt5
+
+
+class TestGetFileListRecursively(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        for path in ['1.in', '1.ok', 'a/2.in', 'a/2.ok', 'a/b/3.in',
+                     'a/b/c/4.in', 'd/5.in', 'd/skip.tmp']:
+            path = os.path.join(self.tmp, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+        os.chdir(self.tmp)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    def test_default_depth(self):
+        self.assertEqual(misc.get_file_list_recursively(),
+                         ['1.in', '1.ok', 'a/2.in', 'a/2.ok', 'd/5.in', 'd/skip.tmp'])
+
+    def test_depth(self):
+        self.assertEqual(misc.get_file_list_recursively(depth=0), [])
+        self.assertEqual(misc.get_file_list_recursively(depth=1), ['1.in', '1.ok'])
+        self.assertEqual(misc.get_file_list_recursively(depth=3, workers=1),
+                         ['1.in', '1.ok', 'a/2.in', 'a/2.ok', 'a/b/3.in',
+                          'd/5.in', 'd/skip.tmp'])
+        self.assertEqual(len(misc.get_file_list_recursively(depth=None)), 8)
+        self.assertRaises(ValueError, misc.get_file_list_recursively, depth=-1)
+        self.assertRaises(ValueError, list, misc.iter_file_list_sorted(depth=-1))
+
+    def test_depth_after_single_subdirectory(self):
+        # The root holds only 'e', which then branches.
+        for path in ['e/1', 'e/a/2', 'e/a/b/3', 'e/a/c/4', 'e/a/b/x/5']:
+            path = os.path.join(self.tmp, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+        root = os.path.join(self.tmp, 'e')
+        expected = ['1', 'a/2', 'a/b/3', 'a/c/4']
+        self.assertEqual(misc.get_file_list_recursively(depth=3, root=root), expected)
+        self.assertEqual(list(misc.iter_file_list_sorted(depth=3, root=root)), expected)
+
+    def test_depth_option(self):
+        # --depth 0 lists everything, negative depths are rejected.
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            testfmt5.main(['list', '.', '--depth', '0'])
+        self.assertEqual(len(output.getvalue().split()), 8)
+        with self.assertRaises(SystemExit) as e, contextlib.redirect_stderr(io.StringIO()):
+            testfmt5.main(['list', '.', '--depth', '-1'])
+        self.assertEqual(e.exception.code, 2)
+
+    def test_globs(self):
+        self.assertEqual(misc.get_file_list_recursively(depth=None, include=['*.in'], exclude=['b']),
+                         ['1.in', 'a/2.in', 'd/5.in'])
+        self.assertEqual(misc.get_file_list_recursively(exclude=['*.tmp', 'a/*']),
+                         ['1.in', '1.ok', 'd/5.in'])
+
+
+class TestIterFileListSorted(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        rng = random.Random(20240301)
+        parts = ['a', 'a1', 'a01', 'a10', 'sub', 'sub.txt', 'sub0', 's-1', '1', '01', 'x_9']
+        for _ in range(300):
+            dirrs = [rng.choice(parts) for _ in range(rng.randrange(4))]
+            path = os.path.join(self.tmp, *dirrs, rng.choice(parts) + rng.choice(['', '.in', '1']))
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if not os.path.isdir(path):
+                    open(path, 'w').close()
+            except (FileExistsError, NotADirectoryError):
+                pass
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_same_order_as_sorted_listing(self):
+        for depth in [0, 1, 2, 3, None]:
+            files = misc.get_file_list_recursively(depth=depth, root=self.tmp)
+            for key in [None, misc.human_key]:
+                expected = sorted(files, key=key)
+                actual = list(misc.iter_file_list_sorted(key, depth=depth, root=self.tmp))
+                self.assertEqual(actual, expected, (depth, key))
+
+
+class TestOutput(unittest.TestCase):
+
+    def output(self, function, *args):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            function(*args)
+        return stdout.getvalue()
+
+    def test_file_list(self):
+        files = ['{}.in'.format(i) for i in range(misc.LINES_PER_WRITE + 3)]
+        self.assertEqual(self.output(misc.output_file_list, iter(files)), '\n'.join(files) + '\n')
+        self.assertEqual(self.output(misc.output_file_list, ['a b', 'c'], 'nul'), 'a b\0c\0')
+        self.assertEqual(self.output(misc.output_file_list, ['a"'], 'jsonl'), '{"path": "a\\""}\n')
+        self.assertEqual(self.output(misc.output_file_list, []), '')
+
+    def test_detect_records(self):
+        self.assertEqual(self.output(misc.output_detect_records, ['1.in', '2.in'], ['1.ok', '2.ok'], 'nul'),
+                         '1.in\x001.ok\x002.in\x002.ok\x00')
+        self.assertEqual(self.output(misc.output_detect_records, ['1.in', '2.in'], ['1.ok', '2.ok'],
+                                     'jsonl', [[0, 1]]).splitlines(), [
+            '{"input": "1.in", "output": "1.ok"}',
+            '{"input": "2.in", "output": "2.ok"}',
+            '{"duplicates": [["1.in", "1.ok"], ["2.in", "2.ok"]]}'])
+
+
+class TestCommandOptions(unittest.TestCase):
+
+    def test_shared_convert_options(self):
+        for command in ['convert', 'batch', 'watch']:
+            output = io.StringIO()
+            with self.assertRaises(SystemExit) as e, contextlib.redirect_stdout(output):
+                testfmt5.main([command, '--help'])
+            self.assertEqual(e.exception.code, 0)
+            for option in ['--sifmt', '--dofmt', '--depth', '--exclude', '--preview',
+                           '--drop-duplicates', '--hash-cache', '--normalize']:
+                self.assertIn(option, output.getvalue())
+
+
+class TestHumanKey(unittest.TestCase):
+
+    def test_matches_cmp_human(self):
+        rng = random.Random(20240108)
+        names = [''.join(rng.choice('0019aA._-/ ') for _ in range(rng.randrange(8)))
+                 for _ in range(300)]
+        for x in names:
+            for y in names[:60]:
+                expected = misc.cmp_human(x, y)
+                actual = misc.cmp_general(misc.human_key(x), misc.human_key(y))
+                self.assertEqual(actual, expected, (x, y))
+        self.assertEqual(sorted(names, key=misc.human_key),
+                         sorted(names, key=functools.cmp_to_key(misc.cmp_human)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import sys
+import array
+import unittest
+import collections.abc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import api
+from testfmt import misc
+from testfmt import nametable
+from testfmt.filelist import BaseFileList
+from testfmt.format import Format
+from testfmt.nametable import NameTable
+
+
+NAMES = ['a/1.in', 'a/1.out', 'a/b/2.in', 'a/b/2.out', '3.in', '3.out']
+
+
+class TestNameTable(unittest.TestCase):
+
+    def test_list(self):
+        table = NameTable(NAMES)
+        self.assertEqual(len(table), 6)
+        self.assertEqual(list(table), NAMES)
+        self.assertEqual(table, NAMES)
+        self.assertEqual(table[2], 'a/b/2.in')
+        self.assertEqual(table[-1], '3.out')
+        self.assertEqual(table[1:3], ['a/1.out', 'a/b/2.in'])
+        self.assertEqual(table + ['x'], NAMES + ['x'])
+        self.assertIn('a/b/2.out', table)
+        self.assertNotIn('b/2.out', table)
+        self.assertEqual(table.index('3.in'), 4)
+        with self.assertRaises(ValueError):
+            table.index('2.in')
+
+    def test_rename(self):
+        table = NameTable(NAMES)
+        self.assertEqual(table.find('a/1.in'), 0)
+        table[0] = 'c/01.in'
+        table.append('a/1.in')
+        self.assertEqual(table.find('c/01.in'), 0)
+        self.assertEqual(table.find('a/1.in'), 6)
+        self.assertEqual(table.find('c/1.in'), -1)
+        self.assertEqual(table[0], 'c/01.in')
+
+    def test_duplicates(self):
+        table = NameTable(['x', 'y', 'x'])
+        self.assertTrue(table.has_duplicates())
+        self.assertEqual(table.find('x'), 0)
+        table[0] = 'z'
+        self.assertEqual(table.find('x'), 2)
+        self.assertFalse(table.has_duplicates())
+        table[1] = 'x'
+        self.assertTrue(table.has_duplicates())
+        self.assertEqual(table.find('x'), 1)
+        self.assertTrue(nametable.has_duplicates(['a', 'b', 'a']))
+        self.assertFalse(nametable.has_duplicates(NAMES))
+
+    def test_copy_on_write(self):
+        table = NameTable(NAMES)
+        snapshot = table.copy()
+        self.assertTrue(table.shares_storage(snapshot))
+        table[0] = 'a/01.in'
+        self.assertFalse(table.shares_storage(snapshot))
+        self.assertEqual(snapshot, NAMES)
+        self.assertEqual(snapshot.find('a/1.in'), 0)
+        self.assertEqual(table.find('a/1.in'), -1)
+
+    def test_sort(self):
+        table = NameTable(['b/10', 'b/9', 'a'])
+        table.sort(key=misc.human_key)
+        self.assertEqual(table, ['a', 'b/9', 'b/10'])
+        self.assertEqual(table.find('b/10'), 2)
+        table.sort()
+        self.assertEqual(table, ['a', 'b/10', 'b/9'])
+
+    def test_view(self):
+        table = NameTable(NAMES)
+        ifiles = table.view(array.array('I', [0, 2, 4]))
+        ofiles = table.view(array.array('I', [1, 3, 5]))
+        self.assertEqual(ifiles, ['a/1.in', 'a/b/2.in', '3.in'])
+        self.assertEqual(ifiles[1:], ['a/b/2.in', '3.in'])
+        self.assertEqual(misc.join_alternatively(ifiles, ofiles), NAMES)
+        self.assertIs(nametable.view_of(ifiles), ifiles)
+        self.assertEqual(nametable.view_of(NAMES), NAMES)
+
+    def test_sequence(self):
+        view = NameTable(NAMES).view(array.array('I', [4, 0, 4]))
+        self.assertIsInstance(view, collections.abc.Sequence)
+        self.assertEqual(view.index('a/1.in'), 1)
+        self.assertEqual(view.count('3.in'), 2)
+        self.assertIn('3.in', view)
+        self.assertEqual(list(reversed(view)), ['3.in', 'a/1.in', '3.in'])
+
+
+class TestFileListNames(unittest.TestCase):
+
+    def test_pairing(self):
+        file_list = BaseFileList(NAMES + ['checker.cpp'])
+        ifiles, ofiles = api.get_ifiles_ofiles(file_list.files, Format.from_string('*.in'),
+                                               Format.from_string('*.out'))
+        self.assertEqual(sorted(ifiles), ['3.in', 'a/1.in', 'a/b/2.in'])
+        self.assertEqual([x[:-3] for x in ofiles], [x[:-2] for x in ifiles])
+        self.assertEqual(api.get_ifiles_ofiles(list(file_list.files), Format.from_string('*.in'),
+                                               Format.from_string('*.out')), (list(ifiles), list(ofiles)))
+
+    def test_plan_moves(self):
+        file_list = BaseFileList(['1', '2', '3'])
+        src, dst = file_list.plan_moves(['1', '2', '3'], ['2', '3', '1'])
+        moves = list(zip(src, dst))
+        self.assertEqual(len(moves), 4)
+        self.assertTrue(file_list.move_files_directly(src, dst, quiet=True))
+        self.assertEqual(file_list.files, ['2', '3', '1'])
+        self.assertIsNone(file_list.plan_moves(['1', '1'], ['2', '4']))
+        self.assertIsNone(file_list.plan_moves(['1', '2'], ['4', '4']))
+        self.assertIsNone(file_list.plan_moves(['5'], ['6']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import io
+import os
+import sys
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import api
+from testfmt import normalize
+from testfmt.normalize import Normalizer
+
+
+FILES = {'1.in': b'1 2 \r\n3\t\n', '1.out': b'ok', '2.in': b'clean\n', '2.out': b'x\n',
+         '3.in': b'a\0 \r\n', '3.out': b''}
+NORMALIZED = {'00.in': b'1 2\n3\n', '00.ok': b'ok\n', '01.in': b'clean\n', '01.ok': b'x\n',
+              '02.in': b'a\0 \r\n', '02.ok': b''}
+
+
+class TestNormalizer(unittest.TestCase):
+
+    def normalize_chunks(self, data, size):
+        normalizer = Normalizer()
+        out = b''.join(normalizer.feed(data[i:i+size]) for i in range(0, len(data), size))
+        return out + normalizer.finish()
+
+    def test_chunk_boundaries(self):
+        data = b'a b  \r\n\r\n  c\t \r\nd \n  \ne'
+        expected = b'a b\n\n  c\nd\n\ne\n'
+        self.assertEqual(normalize.normalize_bytes(data), expected)
+        for size in range(1, len(data) + 1):
+            self.assertEqual(self.normalize_chunks(data, size), expected)
+
+    def test_scan(self):
+        for data in [b'a\r\n', b'a \n', b'a', b'a\n\t', b'a\nb\r\nc\n']:
+            self.assertTrue(normalize.needs_normalizing(data))
+            for size in [1, 2, 1 << 20]:
+                self.assertEqual(normalize.scan_stream(io.BytesIO(data), size), (True, len(data)))
+        for data in [b'', b'a\n', b'\n\n', b'a\0\r\n', b'a\r b\n']:
+            self.assertFalse(normalize.needs_normalizing(data))
+            self.assertFalse(normalize.scan_stream(io.BytesIO(data), 1)[0])
+
+    def test_stream(self):
+        dst = io.BytesIO()
+        self.assertEqual(normalize.normalize_stream(io.BytesIO(b'a \r\nb'), dst, 2), (5, 4))
+        self.assertEqual(dst.getvalue(), b'a\nb\n')
+
+
+class TestNormalizeConvert(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dirr = os.path.join(self.tmp, 'p')
+        os.makedirs(self.dirr)
+        for name, data in FILES.items():
+            with open(os.path.join(self.dirr, name), 'wb') as fp:
+                fp.write(data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, *names):
+        return os.path.join(self.tmp, *names)
+
+    def read_directory(self, dirr):
+        result = {}
+        for name in os.listdir(dirr):
+            with open(os.path.join(dirr, name), 'rb') as fp:
+                result[name] = fp.read()
+        return result
+
+    def test_directory(self):
+        os.link(self.path('p', '1.in'), self.path('link'))
+        clean = os.stat(self.path('p', '2.in')).st_ino
+        report = api.convert(self.dirr, preview=True, normalize=True)
+        self.assertEqual(report.normalized, ['1.in', '1.out'])
+        self.assertEqual(self.read_directory(self.dirr), FILES)
+
+        report = api.convert(self.dirr, normalize=True)
+        self.assertTrue(report.success)
+        self.assertEqual(report.normalized, ['1.in', '1.out'])
+        self.assertEqual(self.read_directory(self.dirr), NORMALIZED)
+        self.assertEqual(os.stat(self.path('p', '01.in')).st_ino, clean)
+        with open(self.path('link'), 'rb') as fp:
+            self.assertEqual(fp.read(), FILES['1.in'])
+
+    def test_zip(self):
+        zip_path = self.path('p.zip')
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as z:
+            for name, data in sorted(FILES.items()):
+                z.writestr(name, data * 100 if name == '2.in' else data)
+        with zipfile.ZipFile(zip_path) as z:
+            compress_size = z.getinfo('2.in').compress_size
+        for in_place in [False, True]:
+            report = api.convert(zip_path, normalize=True, in_place=in_place)
+            self.assertTrue(report.success)
+            with zipfile.ZipFile(zip_path) as z:
+                self.assertIsNone(z.testzip())
+                self.assertEqual(z.read('00.in'), NORMALIZED['00.in'])
+                self.assertEqual(z.read('00.ok'), NORMALIZED['00.ok'])
+                self.assertEqual(z.read('02.in'), NORMALIZED['02.in'])
+                self.assertEqual(z.getinfo('01.in').compress_size, compress_size)
+            self.assertEqual(api.convert(zip_path, normalize=True).normalized, [])
+
+    def test_tar(self):
+        tar_path = self.path('p.tar.gz')
+        with tarfile.open(tar_path, 'w:gz') as tar:
+            for name, data in sorted(FILES.items()):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        report = api.convert(tar_path, normalize=True)
+        self.assertTrue(report.success)
+        self.assertEqual(report.normalized, ['1.in', '1.out'])
+        with tarfile.open(tar_path) as tar:
+            self.assertEqual({x.name: tar.extractfile(x).read() for x in tar}, NORMALIZED)
+
+    def test_copy(self):
+        report = api.convert(self.dirr, dest=self.path('dst'), link='hardlink', normalize=True)
+        self.assertTrue(report.success)
+        self.assertEqual(self.read_directory(self.path('dst')), NORMALIZED)
+        self.assertEqual(self.read_directory(self.dirr), FILES)
+        self.assertTrue(os.path.samefile(self.path('p', '2.in'), self.path('dst', '01.in')))
+
+        report = api.convert(self.dirr, dest=self.path('dst.zip'), normalize=True)
+        self.assertTrue(report.success)
+        with zipfile.ZipFile(self.path('dst.zip')) as z:
+            self.assertEqual({x: z.read(x) for x in z.namelist()}, NORMALIZED)
+
+    def test_workers(self):
+        names = sorted(FILES)
+        self.assertEqual(normalize.scan_files(self.dirr, names, workers=1),
+                         normalize.scan_files(self.dirr, names, workers=2))
+        self.assertEqual(normalize.scan_files(self.dirr, names)[0], ['1.in', '1.out'])
+
+
+if __name__ == '__main__':
+    unittest.main()
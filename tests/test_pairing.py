@@ -0,0 +1,93 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import format
+from testfmt import formatpair
+from testfmt import testfmt5
+
+
+def reference_ifiles_ofiles(files, ifmt, ofmt):
+    """ The original list-based pairing, kept as an oracle. """
+    ifiles, ofiles = [], []
+    for x in files:
+        if not ifmt.match(x):
+            continue
+        y = format.convert_format(x, ifmt, ofmt)
+        if y not in files:
+            continue
+        if (x in ifiles) or (x in ofiles):
+            continue
+        if (y in ifiles) or (y in ofiles):
+            continue
+        ifiles.append(x)
+        ofiles.append(y)
+    return (ifiles, ofiles)
+
+
+def random_file_list(rng, n):
+    stems = ['', 'a', 'in', 'debug', 'test', '1', '01', 'in.1']
+    exts = ['', '.in', '.ok', '.a', '.inp', '.out', '.ans', '.in.a']
+    files = []
+    for _ in range(n):
+        name = rng.choice(['', 'in.', 'ans.', 'debug.in.', 'debug.out.'])
+        name += rng.choice(stems) + str(rng.randrange(20)) + rng.choice(exts)
+        files.append(name)
+    return files
+
+
+class TestGetIfilesOfiles(unittest.TestCase):
+
+    def test_simple(self):
+        files = ['1.in', '1.ok', '2.in', '3.ok']
+        ifmt = format.Format.from_string('*.in')
+        ofmt = format.Format.from_string('*.ok')
+        self.assertEqual(testfmt5.get_ifiles_ofiles(files, ifmt, ofmt),
+                         (['1.in'], ['1.ok']))
+
+    def test_same_format(self):
+        files = ['a', 'b', 'a']
+        fmt = format.Format.from_string('*')
+        self.assertEqual(testfmt5.get_ifiles_ofiles(files, fmt, fmt),
+                         (['a', 'b'], ['a', 'b']))
+
+    def test_matches_reference_on_random_lists(self):
+        rng = random.Random(20240101)
+        pairs = formatpair.ALL_KNOWN_FORMAT_PAIRS + [
+            formatpair.FormatPair.from_string('*.in|*.in.a'),
+            formatpair.FormatPair.from_string('*|*'),
+        ]
+        for _ in range(200):
+            files = random_file_list(rng, rng.randrange(60))
+            for pair in pairs:
+                self.assertEqual(
+                    testfmt5.get_ifiles_ofiles(files, pair.ifmt, pair.ofmt),
+                    reference_ifiles_ofiles(files, pair.ifmt, pair.ofmt),
+                    (files, str(pair)))
+
+
+class TestDetectFormatPair(unittest.TestCase):
+
+    def test_matches_per_pair_scan(self):
+        rng = random.Random(20240102)
+        pairs = formatpair.ALL_KNOWN_FORMAT_PAIRS
+        for _ in range(200):
+            files = random_file_list(rng, rng.randrange(60))
+            expected = max(pairs, key=lambda pair: len(
+                reference_ifiles_ofiles(files, pair.ifmt, pair.ofmt)[0]))
+            pair, ifiles, ofiles = testfmt5.detect_format_pair(files)
+            self.assertIs(pair, expected, files)
+            self.assertEqual((ifiles, ofiles), reference_ifiles_ofiles(
+                files, pair.ifmt, pair.ofmt))
+
+    def test_best_format_pair(self):
+        files = ['1.inp', '1.out', '2.inp', '2.out', '3.in', '3.ok']
+        self.assertEqual(testfmt5.best_format_pair(files),
+                         formatpair.FormatPair.from_string('*.inp|*.out'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import io
+import os
+import sys
+import shutil
+import zipfile
+import tempfile
+import contextlib
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import api
+from testfmt import dedup
+from testfmt import misc
+from testfmt import testfmt5
+from testfmt.filelist import FileList, RenameJournal
+from testfmt.format import Format
+
+
+FILES = ['sub1/a.inp', 'sub1/a.out', 'sub1/b.inp', 'sub1/b.out',
+         'sub2/in.1', 'sub2/ans.1', 'sub2/in.2', 'sub2/ans.2',
+         'sub3/readme', 'top.in', 'top.out']
+CONVERTED = ['00.in', '00.ok', 'sub1/00.in', 'sub1/00.ok', 'sub1/01.in', 'sub1/01.ok',
+             'sub2/00.in', 'sub2/00.ok', 'sub2/01.in', 'sub2/01.ok', 'sub3/readme']
+
+
+class Killed(BaseException):
+    pass
+
+
+class TestGroupByDirectory(unittest.TestCase):
+
+    def test_depth(self):
+        names = ['1.in', 'a/1.in', 'a/b/2.in', 'c/3.in']
+        self.assertEqual(misc.group_by_directory(names),
+                         {'': ['1.in'], 'a': ['1.in', 'b/2.in'], 'c': ['3.in']})
+        self.assertEqual(misc.group_by_directory(names, 2),
+                         {'': ['1.in'], 'a': ['1.in'], 'a/b': ['2.in'], 'c': ['3.in']})
+
+
+class TestShards(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        for name in FILES:
+            path = os.path.join(self.tmp, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as fp:
+                fp.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def contents(self):
+        rslt = {}
+        for d, dirs, files in os.walk(self.tmp):
+            for name in files:
+                path = os.path.join(d, name)
+                with open(path) as fp:
+                    rslt[os.path.relpath(path, self.tmp)] = fp.read()
+        return rslt
+
+    def test_detect(self):
+        file_list = api.open_file_list(self.tmp)
+        result = api.detect_shards(file_list)
+        self.assertEqual(result.ifiles, ['sub1/a.inp', 'sub1/b.inp', 'sub2/in.1', 'sub2/in.2', 'top.in'])
+        self.assertEqual(result.ofiles, ['sub1/a.out', 'sub1/b.out', 'sub2/ans.1', 'sub2/ans.2', 'top.out'])
+        self.assertEqual([(x, str(y.sifmt), str(y.sofmt)) for x, y in result.shards],
+                         [('sub1', '*.inp', '*.out'), ('sub2', 'in.*', 'ans.*'), ('', '*.in', '*.out')])
+        serial = api.detect_shards(file_list, jobs=1)
+        self.assertEqual((serial.ifiles, serial.ofiles), (result.ifiles, result.ofiles))
+
+    def test_given_formats(self):
+        file_list = api.open_file_list(self.tmp)
+        result = api.detect_shards(file_list, Format.from_string('in.*'), Format.from_string('ans.*'))
+        self.assertEqual(result.ifiles, ['sub2/in.1', 'sub2/in.2'])
+
+    def test_convert(self):
+        file_list = api.open_file_list(self.tmp)
+        original = self.contents()
+        report = api.convert_shards(file_list, preview=True)
+        self.assertTrue(report.success)
+        self.assertEqual(report.plan[1][:2], ['sub1/00.in', 'sub1/00.ok'])
+        self.assertEqual(self.contents(), original)
+        report = api.convert_shards(file_list, jobs=2)
+        self.assertTrue(report.success)
+        self.assertEqual(sorted(file_list.files), CONVERTED)
+        self.assertEqual(sorted(self.contents()), CONVERTED)
+        self.assertEqual(self.contents()['sub2/01.ok'], 'sub2/ans.2')
+
+    def test_hash_cache_saved_once(self):
+        cache = dedup.HashCache(os.path.join(self.tmp, 'hashes.json'))
+        with mock.patch.object(dedup.HashCache, 'save') as save:
+            api.detect_shards(api.open_file_list(self.tmp), duplicates=True, hash_cache=cache)
+            self.assertEqual(save.call_count, 1)
+            api.convert_shards(api.open_file_list(self.tmp), preview=True, jobs=3,
+                               drop_duplicates=True, hash_cache=cache)
+            self.assertEqual(save.call_count, 2)
+
+    def test_moves_printed_as_done(self):
+        output = io.StringIO()
+        printed = []
+        really_renames = FileList.really_renames
+        def renames(self, src, dst):
+            printed.append("Moving '{0}{1}' -> '{0}{2}'".format(self.display_prefix, src, dst)
+                           in output.getvalue())
+            return really_renames(self, src, dst)
+        with mock.patch.object(FileList, 'really_renames', renames), contextlib.redirect_stdout(output):
+            report = api.convert_shards(api.open_file_list(self.tmp), quiet=False, jobs=1)
+        self.assertTrue(report.success)
+        self.assertTrue(printed and all(printed))
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines.count("Moving 'sub1/a.inp' -> 'sub1/00.in'"), 1)
+        self.assertEqual(len(lines), len(printed))
+
+    def test_conflict_changes_nothing(self):
+        open(os.path.join(self.tmp, 'sub2', '01.ok'), 'w').close()
+        original = self.contents()
+        report = api.convert_shards(api.open_file_list(self.tmp))
+        self.assertFalse(report.checked or report.success)
+        self.assertEqual(self.contents(), original)
+
+    def test_failed_shard_is_rolled_back(self):
+        really_renames = FileList.really_renames
+        def failing_renames(self, src, dst):
+            return False if self.root.endswith('sub2') else really_renames(self, src, dst)
+        file_list = api.open_file_list(self.tmp)
+        with mock.patch.object(FileList, 'really_renames', failing_renames):
+            report = api.convert_shards(file_list)
+        self.assertFalse(report.success)
+        self.assertEqual([(x, y.success) for x, y in report.shards],
+                         [('sub1', True), ('sub2', False), ('', True)])
+        expected = [x for x in CONVERTED if not x.startswith('sub2/')] + FILES[4:8]
+        self.assertEqual(sorted(file_list.files), sorted(expected))
+        self.assertEqual(sorted(self.contents()), sorted(expected))
+
+    def test_interrupted_shard_is_recovered(self):
+        original = self.contents()
+        def killed(self, src, dst):
+            raise Killed()
+        shard_list = dict(api.open_file_list(self.tmp).shards())['sub1']
+        with mock.patch.object(FileList, 'really_renames', killed):
+            self.assertRaises(Killed, shard_list.move_files_planned,
+                              ['a.inp'], ['00.in'], real=True, quiet=True)
+        self.assertIn(RenameJournal.NAME, os.listdir(os.path.join(self.tmp, 'sub1')))
+        self.assertEqual(api.open_file_list(self.tmp).pending_journals, ['sub1'])
+        file_list = api.open_file_list(self.tmp, recover=True, rollback=True)
+        self.assertFalse(file_list.pending_journals)
+        self.assertEqual(sorted(file_list.files), sorted(FILES))
+        self.assertEqual(self.contents(), original)
+
+    def test_cli(self):
+        with self.assertRaises(SystemExit) as e:
+            testfmt5.main(['convert', self.tmp, '--shards', '-j', '2', '-s'])
+        self.assertEqual(e.exception.code, 0)
+        self.assertEqual(sorted(self.contents()), CONVERTED)
+        with self.assertRaises(SystemExit) as e, mock.patch('sys.stderr'):
+            testfmt5.main(['convert', self.tmp, '--shards', '-o', os.path.join(self.tmp, 'copy')])
+        self.assertEqual(e.exception.code, 2)
+
+    def test_cli_detect_archive(self):
+        path = os.path.join(self.tmp, 'p.zip')
+        with zipfile.ZipFile(path, 'w') as z:
+            for name in FILES:
+                z.writestr(name, name)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            testfmt5.main(['detect', path, '--shards', '-s'])
+        self.assertIn('sub2/in.2', output.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import io
+import os
+import sys
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import api
+from testfmt import dedup
+from testfmt import filelist
+from testfmt.filelist import TarFileList
+
+
+FILES = {'1.inp': b'a', '1.out': b'x', '2.inp': b'b', '2.out': b'y', '3.inp': b'a', '3.out': b'x'}
+
+
+def add_file(tar, name, data, **kw):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = 1000000000
+    for x in kw:
+        setattr(info, x, kw[x])
+    tar.addfile(info, io.BytesIO(data))
+
+
+class TestTarFileList(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, *names):
+        return os.path.join(self.tmp, *names)
+
+    def make_tar(self, compression='', files=FILES):
+        path = self.path('p.tar' + ('.' + compression if compression else ''))
+        with tarfile.open(path, 'w:' + compression) as tar:
+            for name, data in sorted(files.items()):
+                add_file(tar, name, data)
+        return path
+
+    def members(self, path):
+        with tarfile.open(path) as tar:
+            return {x.name: tar.extractfile(x).read() for x in tar if x.isreg()}
+
+    def test_compression(self):
+        for compression in ['', 'gz', 'bz2', 'xz']:
+            self.assertEqual(filelist.tar_compression(self.make_tar(compression)), compression)
+        with open(self.path('junk.bin'), 'wb') as fp:
+            fp.write(b'junk' * 256)
+        self.assertIsNone(filelist.tar_compression(self.path('junk.bin')))
+        with zipfile.ZipFile(self.path('p.zip'), 'w') as z:
+            z.writestr('1.in', 'a')
+        self.assertIsNone(filelist.tar_compression(self.path('p.zip')))
+
+    def test_list(self):
+        path = self.make_tar('gz', dict(FILES, **{'sub/4.inp': b'c'}))
+        self.assertEqual(sorted(TarFileList(path).files), sorted(list(FILES) + ['sub/4.inp']))
+        self.assertEqual(list(api.iter_file_list(path)), ['1.inp', '1.out', '2.inp', '2.out',
+                                                          '3.inp', '3.out', 'sub/4.inp'])
+
+    def test_convert(self):
+        for compression in ['', 'gz', 'bz2', 'xz']:
+            path = self.make_tar(compression)
+            report = api.convert(path)
+            self.assertTrue(report.success)
+            self.assertEqual(filelist.tar_compression(path), compression)
+            self.assertEqual(self.members(path), {
+                '00.in': b'a', '00.ok': b'x', '01.in': b'b', '01.ok': b'y', '02.in': b'a', '02.ok': b'x'})
+            self.assertEqual(os.listdir(self.tmp), [os.path.basename(path)])
+            os.remove(path)
+
+    def test_links(self):
+        path = self.path('p.tar')
+        with tarfile.open(path, 'w', format=tarfile.PAX_FORMAT) as tar:
+            add_file(tar, '1.inp', b'a', pax_headers={'path': '1.inp'})
+            add_file(tar, '1.out', b'x')
+            add_file(tar, '2.inp', b'', type=tarfile.SYMTYPE, linkname='1.inp')
+            add_file(tar, '2.out', b'', type=tarfile.LNKTYPE, linkname='1.out')
+        self.assertEqual(TarFileList(path).links, {'2.out': '1.out'})
+        self.assertTrue(api.convert(path).success)
+        with tarfile.open(path) as tar:
+            infos = {x.name: x for x in tar}
+        self.assertEqual(sorted(infos), ['00.in', '00.ok', '01.in', '01.ok'])
+        self.assertEqual(infos['01.ok'].linkname, '00.ok')
+        self.assertEqual(infos['01.in'].linkname, '1.inp')
+
+        report = api.convert(path, dest=self.path('dst'))
+        self.assertTrue(report.success)
+        self.assertTrue(os.path.samefile(self.path('dst', '00.ok'), self.path('dst', '01.ok')))
+        self.assertEqual(os.readlink(self.path('dst', '01.in')), '1.inp')
+        report = api.convert(path, dest=self.path('dst.zip'))
+        self.assertTrue(report.success)
+        with zipfile.ZipFile(self.path('dst.zip')) as z:
+            self.assertEqual(z.read('01.ok'), b'x')
+            self.assertEqual(z.read('01.in'), b'1.inp')
+
+    def test_duplicates(self):
+        path = self.make_tar('gz')
+        result = api.detect(path, duplicates=True)
+        self.assertEqual(result.duplicates, [[0, 2]])
+        report = api.convert(path, dest=self.path('dst.zip'), drop_duplicates=True)
+        self.assertTrue(report.success)
+        with zipfile.ZipFile(self.path('dst.zip')) as z:
+            self.assertEqual(sorted(z.namelist()), ['00.in', '00.ok', '01.in', '01.ok'])
+        self.assertEqual(self.members(path), FILES)
+
+    def test_hash_cache_rebuilt_archive(self):
+        cache_path = self.path('hashes.json')
+        path = self.path('p.tar.gz')
+        for i, second in enumerate([b'a', b'b', b'b']):
+            if i < 2:
+                with tarfile.open(path, 'w:gz') as tar:
+                    for name, data in [('1.inp', b'a'), ('1.out', b'x'), ('2.inp', second), ('2.out', b'x')]:
+                        add_file(tar, name, data, mtime=0)
+                os.utime(path, ns=(10**18 + i, 10**18 + i))
+            cache = dedup.HashCache(cache_path)
+            with mock.patch.object(dedup, 'hash_stream', wraps=dedup.hash_stream) as hash_stream:
+                result = api.detect(path, duplicates=True, hash_cache=cache)
+            self.assertEqual(result.duplicates, [[0, 1]] if second == b'a' else [])
+            self.assertEqual(hash_stream.call_count, 0 if i == 2 else 4)
+            cache.save()
+        os.utime(path)
+        cache = dedup.HashCache(cache_path)
+        entries = dict(cache.entries)
+        api.detect(path, duplicates=True, hash_cache=cache)
+        self.assertEqual(sorted(cache.entries), sorted(entries))
+
+    def test_copy_to_directory(self):
+        path = self.make_tar('bz2')
+        report = api.convert(path, dest=self.path('dst'))
+        self.assertTrue(report.success)
+        with open(self.path('dst', '01.ok'), 'rb') as fp:
+            self.assertEqual(fp.read(), b'y')
+        self.assertEqual(self.members(path), FILES)
+
+    def test_hostile_copy(self):
+        outside = os.path.join(os.path.dirname(self.tmp), 'escaped.txt')
+        for name, kw in [('../escaped.txt', {}), ('/tmp/escaped.txt', {}),
+                         ('4.inp', dict(type=tarfile.SYMTYPE, linkname='/etc/passwd')),
+                         ('4.inp', dict(type=tarfile.SYMTYPE, linkname='../../escaped.txt'))]:
+            path = self.path('p.tar')
+            with tarfile.open(path, 'w') as tar:
+                for x, data in sorted(FILES.items()):
+                    add_file(tar, x, data)
+                add_file(tar, name, b'', **kw)
+            report = api.convert(path, dest=self.path('dst'))
+            self.assertFalse(report.success)
+            self.assertFalse(os.path.lexists(outside))
+            self.assertFalse(os.path.lexists('/tmp/escaped.txt'))
+            self.assertEqual(os.listdir(self.tmp), ['p.tar'])
+        with tarfile.open(path, 'w') as tar:
+            for x, data in sorted(FILES.items()):
+                add_file(tar, x, data)
+            add_file(tar, 'sub/4.inp', b'', type=tarfile.SYMTYPE, linkname='../1.inp')
+        self.assertTrue(api.convert(path, dest=self.path('dst')).success)
+        self.assertEqual(os.readlink(self.path('dst', 'sub', '4.inp')), '../1.inp')
+
+    def test_zstd_unavailable(self):
+        with open(self.path('p.tar.zst'), 'wb') as fp:
+            fp.write(b'\x28\xb5\x2f\xfd' + b'\0' * 16)
+        with mock.patch.object(filelist, 'zstandard', None):
+            self.assertEqual(filelist.tar_compression(self.path('p.tar.zst')), 'zst')
+            with self.assertRaises(tarfile.CompressionError):
+                TarFileList(self.path('p.tar.zst'))
+
+    def test_not_an_archive(self):
+        with open(self.path('junk.bin'), 'wb') as fp:
+            fp.write(b'junk')
+        with self.assertRaises(FileNotFoundError):
+            api.open_file_list(self.path('junk.bin'))
+
+
+if __name__ == '__main__':
+    unittest.main()
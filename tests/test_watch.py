@@ -0,0 +1,161 @@
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import contextlib
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import watch
+from testfmt import testfmt5
+from testfmt.format import Format
+from testfmt.nametable import NameTable
+from testfmt.watch import Pairing, PollingWatcher, InotifyWatcher, Watch
+
+
+IFMT, OFMT = Format.from_string('*.in'), Format.from_string('*.out')
+
+
+class TestPairing(unittest.TestCase):
+
+    def test_add_remove(self):
+        files = NameTable(['1.in', '2.out'])
+        pairing = Pairing(IFMT, OFMT, files)
+        self.assertEqual(pairing.add('1.in'), [])
+        files.append('1.out')
+        self.assertEqual(pairing.add('1.out'), [('pair', '1.in', '1.out')])
+        files.append('2.in')
+        self.assertEqual(pairing.add('2.in'), [('pair', '2.in', '2.out')])
+        self.assertEqual(pairing.num_test_cases, 2)
+        files.remove('1.in')
+        self.assertEqual(pairing.remove('1.in'), [('unpair', '1.in', '1.out')])
+        self.assertEqual(pairing.remove('1.in'), [])
+        self.assertEqual(pairing.output_of, {'2.in': '2.out'})
+
+    def test_repair(self):
+        # '1' pairs with '1.a', which is also an input of '1.a.a'.
+        fmt1, fmt2 = Format.from_string('*'), Format.from_string('*.a')
+        files = NameTable(['1', '1.a', '1.a.a'])
+        pairing = Pairing(fmt1, fmt2, files)
+        self.assertEqual([pairing.add(x) for x in files], [[('pair', '1', '1.a')], [], []])
+        files.remove('1')
+        self.assertEqual(pairing.remove('1'), [('unpair', '1', '1.a'), ('pair', '1.a', '1.a.a')])
+
+
+class TestWatchers(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def touch(self, *names):
+        for name in names:
+            path = os.path.join(self.tmp, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+
+    def check_watcher(self, watcher):
+        self.touch('1.in', 'a/2.in', 'a/b/3.in')
+        with watcher:
+            self.assertEqual(sorted(watcher.scan()), ['1.in', 'a/2.in'])
+            self.touch('1.out', 'a/2.out', 'c/4.in')
+            os.remove(os.path.join(self.tmp, '1.in'))
+            changes = watcher.changes(1)
+            self.assertEqual(sorted(changes.added), ['1.out', 'a/2.out', 'c/4.in'])
+            self.assertEqual(changes.removed, ['1.in'])
+            shutil.rmtree(os.path.join(self.tmp, 'a'))
+            os.rename(os.path.join(self.tmp, 'c'), os.path.join(self.tmp, 'd'))
+            changes = watcher.changes(1)
+            self.assertEqual(changes.added, ['d/4.in'])
+            self.assertEqual(sorted(changes.removed), ['a/2.in', 'a/2.out', 'c/4.in'])
+            self.assertFalse(watcher.changes(0))
+
+    def test_polling(self):
+        self.check_watcher(PollingWatcher(self.tmp, interval=0))
+
+    @unittest.skipUnless(watch.inotify_available(), "needs inotify")
+    def test_inotify(self):
+        self.check_watcher(InotifyWatcher(self.tmp))
+
+    @unittest.skipUnless(watch.inotify_available(), "needs inotify")
+    def test_inotify_limit(self):
+        # Directories that can not be watched are polled.
+        watcher = InotifyWatcher(self.tmp, interval=0)
+        watcher.libc = mock.Mock(wraps=watcher.libc)
+        watcher.libc.inotify_add_watch.return_value = -1
+        self.check_watcher(watcher)
+        self.assertEqual(watcher.wds, {})
+
+    def test_changes(self):
+        changes = watch.Changes()
+        changes.add('a')
+        changes.remove('a')
+        changes.remove('b')
+        changes.add('b')
+        changes.remove('c')
+        self.assertEqual((changes.added, changes.removed, changes.written), ([], ['c'], ['b']))
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.touch('1.inp', '1.out', '2.inp')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def touch(self, *names):
+        for name in names:
+            open(os.path.join(self.tmp, name), 'w').close()
+
+    def test_events(self):
+        with Watch(self.tmp, polling=True, interval=0) as w:
+            events = w.events(settle=0.05)
+            self.assertEqual(next(events), [
+                ('format', Format.from_string('*.inp'), Format.from_string('*.out')),
+                ('pair', '1.inp', '1.out')])
+            self.assertEqual(next(events), [('stable', 1)])
+            self.touch('2.out')
+            os.remove(os.path.join(self.tmp, '1.out'))
+            self.assertEqual(next(events), [('unpair', '1.inp', '1.out'), ('pair', '2.inp', '2.out')])
+            self.assertEqual(next(events), [('stable', 1)])
+        self.assertEqual(sorted(w.file_list.files), ['1.inp', '2.inp', '2.out'])
+
+    def test_no_test_cases(self):
+        with Watch(self.tmp, IFMT, OFMT, polling=True, interval=0) as w:
+            events = w.events(settle=0)
+            self.assertEqual(next(events), [('stable', 0)])
+            self.touch('3.in', '3.out')
+            self.assertEqual(next(events), [('pair', '3.in', '3.out')])
+
+    def test_not_a_directory(self):
+        with self.assertRaises(NotADirectoryError):
+            Watch(os.path.join(self.tmp, '1.inp'))
+
+    def test_convert(self):
+        self.touch('2.out')
+        with self.assertRaises(SystemExit) as e:
+            testfmt5.main(['watch', self.tmp, '--convert', '--settle', '0', '--poll', '-s'])
+        self.assertEqual(e.exception.code, 0)
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['00.in', '00.ok', '01.in', '01.ok'])
+
+    def test_convert_profile(self):
+        self.touch('2.out')
+        stderr = io.StringIO()
+        with self.assertRaises(SystemExit) as e, contextlib.redirect_stderr(stderr):
+            testfmt5.main(['watch', self.tmp, '--convert', '--settle', '0', '--poll', '-s',
+                           '--profile', 'json'])
+        self.assertEqual(e.exception.code, 0)
+        stages = {x['stage']: x for x in json.loads(stderr.getvalue())['stages']}
+        self.assertEqual(stages['rename']['rename'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
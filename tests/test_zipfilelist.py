@@ -0,0 +1,167 @@
+import io
+import os
+import sys
+import json
+import shutil
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from testfmt import api
+from testfmt import misc
+from testfmt import instrument
+from testfmt.filelist import ZipFileList, ZipRawWriter
+
+
+class NonSeekable(io.RawIOBase):
+
+    def __init__(self, fp):
+        self.fp = fp
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.fp.write(data)
+
+
+class TestZipFileList(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'tests.zip')
+        self.data = {
+            '1.in': b'1 2\n' * 1000,
+            '1.ok': b'3\n',
+            'sub/2.in': b'',
+            'sub/2.ok': os.urandom(5000),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write_zip(self, seekable=True):
+        with open(self.path, 'wb') as fp:
+            target = fp if seekable else NonSeekable(fp)
+            with zipfile.ZipFile(target, 'w') as z:
+                for i, name in enumerate(sorted(self.data)):
+                    method = zipfile.ZIP_DEFLATED if i % 2 else zipfile.ZIP_STORED
+                    z.writestr(name, self.data[name], compress_type=method)
+
+    def check_renamed(self, in_place=False, dst=['00.in', '00.ok', '01.in', '01.ok']):
+        file_list = ZipFileList(self.path, in_place=in_place)
+        src = ['1.in', '1.ok', 'sub/2.in', 'sub/2.ok']
+        self.assertTrue(file_list.move_files_planned(src, dst, real=True, quiet=True))
+        with zipfile.ZipFile(self.path) as z:
+            self.assertIsNone(z.testzip())
+            self.assertEqual(sorted(z.namelist()), sorted(dst))
+            for i in range(len(src)):
+                self.assertEqual(z.read(dst[i]), self.data[src[i]])
+
+    def test_raw_copy(self):
+        self.write_zip()
+        self.check_renamed()
+
+    def test_raw_copy_with_data_descriptors(self):
+        self.write_zip(seekable=False)
+        with zipfile.ZipFile(self.path) as z:
+            self.assertTrue(all(info.flag_bits & 0x08 for info in z.infolist()))
+        self.check_renamed()
+
+    def test_bad_local_crc(self):
+        self.write_zip()
+        with zipfile.ZipFile(self.path) as z:
+            offset = z.getinfo('1.ok').header_offset
+        with open(self.path, 'r+b') as fp:
+            fp.seek(offset + 14)
+            fp.write(b'\0\0\0\0')
+        file_list = ZipFileList(self.path)
+        file_list.old_name = {'00.ok': '1.ok'}
+        self.assertRaises(zipfile.BadZipFile, file_list.apply_changes, quiet=True)
+        self.assertEqual(os.listdir(self.tmp), ['tests.zip'])
+
+    def test_in_place(self):
+        self.write_zip()
+        size = os.path.getsize(self.path)
+        self.check_renamed(in_place=True, dst=['1.ok', '1.in', '2.in', '2.ok'])
+        self.assertLessEqual(os.path.getsize(self.path), size)
+        self.assertEqual(os.listdir(self.tmp), ['tests.zip'])
+
+    def test_in_place_longer_names(self):
+        self.write_zip(seekable=False)
+        self.check_renamed(in_place=True, dst=['a.in', 'longer-name-1.ok', 'é.in', 'b/longer-name-2.ok'])
+
+    def test_in_place_failure_is_rolled_back(self):
+        self.write_zip()
+        with open(self.path, 'rb') as fp:
+            original = fp.read()
+        file_list = ZipFileList(self.path, in_place=True)
+        file_list.old_name = {'00.ok': '1.ok', 'a-long-name.in': 'sub/2.in'}
+
+        def failing_copy(src, dst, size):
+            dst.write(b'x' * 100)
+            raise EOFError
+        copy_bytes = misc.copy_bytes
+        misc.copy_bytes = failing_copy
+        try:
+            self.assertRaises(EOFError, file_list.apply_changes, quiet=True, in_place=True)
+        finally:
+            misc.copy_bytes = copy_bytes
+        with open(self.path, 'rb') as fp:
+            self.assertEqual(fp.read(), original)
+        self.assertEqual(os.listdir(self.tmp), ['tests.zip'])
+
+    def test_fallback_without_zipfile_internals(self):
+        # A zipfile module missing a private attribute gets recompressed
+        # members, in place or not.
+        self.write_zip()
+        attributes = ZipRawWriter.ATTRIBUTES
+        ZipRawWriter.ATTRIBUTES = attributes + ('_no_such_attribute',)
+        try:
+            with mock.patch.object(ZipRawWriter, 'write') as write:
+                self.check_renamed()
+                self.write_zip()
+                self.check_renamed(in_place=True, dst=['1.ok', '1.in', '2.in', '2.ok'])
+        finally:
+            ZipRawWriter.ATTRIBUTES = attributes
+        write.assert_not_called()
+        self.assertEqual(os.listdir(self.tmp), ['tests.zip'])
+
+    def test_recompressed_byte_counts(self):
+        # Members deflated at another level change size when recompressed.
+        with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as z:
+            for name in sorted(self.data):
+                z.writestr(name, self.data[name] + b'4 5 6\n' * 500)
+        with zipfile.ZipFile(self.path) as z:
+            read = sum(x.compress_size for x in z.infolist())
+        with mock.patch.object(ZipRawWriter, 'supported', return_value=False), \
+                instrument.Profiler() as profiler:
+            self.assertTrue(api.convert(self.path).success)
+        with zipfile.ZipFile(self.path) as z:
+            written = sum(x.compress_size for x in z.infolist())
+        self.assertNotEqual(read, written)
+        stage = profiler.stages['zip_rewrite']
+        self.assertEqual((stage['bytes_read'], stage['bytes_written']), (read, written))
+
+    def test_journal_is_recovered_on_open(self):
+        self.write_zip()
+        with open(self.path, 'rb') as fp:
+            original = fp.read()
+        with open(self.path + '.journal', 'w') as fp:
+            json.dump({'size': len(original), 'patches': [[10, original[10:20].hex()]]}, fp)
+        with open(self.path, 'r+b') as fp:
+            fp.seek(10)
+            fp.write(b'\xff' * 10)
+            fp.seek(0, 2)
+            fp.write(b'garbage')
+        self.assertEqual(sorted(ZipFileList(self.path).files), sorted(self.data))
+        with open(self.path, 'rb') as fp:
+            self.assertEqual(fp.read(), original)
+        self.assertEqual(os.listdir(self.tmp), ['tests.zip'])
+
+
+if __name__ == '__main__':
+    unittest.main()